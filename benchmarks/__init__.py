@@ -0,0 +1,6 @@
+"""
+Benchmarks for the transaction logger.
+
+Run a benchmark from the project root, e.g.:
+    uv run python -m benchmarks.bench_extractors --count 500
+"""
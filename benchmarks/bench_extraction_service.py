@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Extraction service benchmark.
+
+Starts the HTTP extraction service of utils/extraction_service.py on a local
+port and sends it a synthetic corpus from concurrent keep-alive clients, one
+raw RFC822 email per request or in JSON batches. Reports requests and emails
+per second and p50/p99 request latency.
+
+Usage:
+    uv run python -m benchmarks.bench_extraction_service [--count N] [--workers N]
+                                                         [--clients N]
+                                                         [--batch-sizes N [N ...]]
+                                                         [--json PATH]
+
+Examples:
+    uv run python -m benchmarks.bench_extraction_service
+    uv run python -m benchmarks.bench_extraction_service --workers 8 --clients 16
+"""
+
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+
+# The Foodpanda extractor reads its card number from the environment when the
+# registry is built, so it has to be set before importing the extractors
+os.environ.setdefault("CARD_USED_FOR_FPND", "FPND")
+
+from benchmarks.bench_extractors import percentile  # noqa: E402
+from utils.extraction_service import ExtractionService  # noqa: E402
+from utils.extractors.test_data.synthetic import generate_corpus, to_rfc822  # noqa: E402
+
+
+def run(port: int, raw_emails: list[bytes], clients: int, batch_size: int) -> dict:
+    """
+    Send every email to the service from concurrent clients
+
+    Args:
+        port (int): Port of the service
+        raw_emails (list[bytes]): The raw emails
+        clients (int): Concurrent client connections
+        batch_size (int): Emails per request, 1 for raw RFC822 requests
+
+    Returns:
+        dict: Throughput and latency percentiles
+    """
+    if batch_size == 1:
+        requests = [(raw_email, "message/rfc822") for raw_email in raw_emails]
+    else:
+        requests = [
+            (
+                json.dumps(
+                    {
+                        "emails": [
+                            {"raw": raw_email.decode("utf-8", errors="replace")}
+                            for raw_email in raw_emails[start : start + batch_size]
+                        ]
+                    }
+                ).encode(),
+                "application/json",
+            )
+            for start in range(0, len(raw_emails), batch_size)
+        ]
+
+    latencies: list[float] = []
+    errors = []
+    lock = threading.Lock()
+    next_request = iter(requests)
+
+    def client() -> None:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        try:
+            while True:
+                with lock:
+                    request = next(next_request, None)
+                if request is None:
+                    return
+                body, content_type = request
+                start = time.perf_counter()
+                connection.request("POST", "/extract", body, {"Content-Type": content_type})
+                response = connection.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if response.status != 200:
+                        errors.append(response.status)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    return {
+        "batch_size": batch_size,
+        "requests": len(requests),
+        "errors": len(errors),
+        "seconds": seconds,
+        "requests_per_second": len(requests) / seconds,
+        "emails_per_second": len(raw_emails) / seconds,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def print_results(results: list[dict]) -> None:
+    print(
+        f"{'batch':>6} {'requests':>9} {'errors':>7} {'req/s':>9} "
+        f"{'emails/s':>9} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    print("-" * 62)
+    for result in results:
+        print(
+            f"{result['batch_size']:>6} {result['requests']:>9} {result['errors']:>7} "
+            f"{result['requests_per_second']:>9.1f} {result['emails_per_second']:>9.1f} "
+            f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction service benchmark")
+    parser.add_argument("--count", type=int, default=2000, help="emails sent per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="service worker processes (default: CPUs)"
+    )
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument(
+        "--batch-sizes",
+        type=int,
+        nargs="+",
+        default=[1, 50],
+        help="emails per request, 1 sends raw RFC822 requests",
+    )
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    raw_emails = [
+        to_rfc822(email_data)
+        for email_data in generate_corpus(args.count, seed=args.seed, card_number="FPND")
+    ]
+
+    # Batches of the default 10 MiB limit hold a few thousand emails
+    with ExtractionService(args.workers) as service:
+        server = service.make_server(0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            print(f"{service.workers} workers, {args.clients} clients, {args.count} emails")
+            results = [
+                run(server.server_address[1], raw_emails, args.clients, batch_size)
+                for batch_size in args.batch_sizes
+            ]
+        finally:
+            server.shutdown()
+            server.server_close()
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
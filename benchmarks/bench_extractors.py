@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Extractor micro-benchmark.
+
+Runs every extractor route over a synthetic corpus and reports throughput
+(emails per second), p50/p99 latency and peak traced memory per route.
+Latency is measured in a first pass and memory in a second pass, since
+tracemalloc itself slows extraction down.
+
+Usage:
+    uv run python -m benchmarks.bench_extractors [--count N] [--merchant NAME]
+                                                 [--seed N] [--json PATH]
+
+Examples:
+    uv run python -m benchmarks.bench_extractors
+    uv run python -m benchmarks.bench_extractors --count 2000 --merchant Grab
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+# The Foodpanda extractor reads its card number from the environment when the
+# registry is built, so it has to be set before importing the extractors
+os.environ.setdefault("CARD_USED_FOR_FPND", "FPND")
+
+from utils.extractors import TransactionExtractor  # noqa: E402
+from utils.extractors.test_data.synthetic import GENERATORS, generate_emails  # noqa: E402
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def bench_route(
+    transaction_extractor: TransactionExtractor, emails: list[dict]
+) -> dict:
+    """
+    Benchmark the extraction of a list of emails of a single route
+
+    Returns:
+        dict: Throughput, latency percentiles, peak memory and correctness
+    """
+    latencies = []
+    correct = 0
+    for email_data in emails:
+        start = time.perf_counter()
+        result = transaction_extractor.extract_from_email(
+            merchant=email_data["merchant"],
+            email_body=email_data["body"],
+            email_subject=email_data["subject"],
+        )
+        latencies.append(time.perf_counter() - start)
+
+        expected = email_data["expected"]
+        if expected is None:
+            correct += not result.card_number
+        else:
+            correct += (result.card_number, result.amount, result.merchant) == (
+                expected["card_number"],
+                expected["amount"],
+                expected["merchant"],
+            )
+
+    tracemalloc.start()
+    for email_data in emails:
+        transaction_extractor.extract_from_email(
+            merchant=email_data["merchant"],
+            email_body=email_data["body"],
+            email_subject=email_data["subject"],
+        )
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "emails": len(emails),
+        "emails_per_second": len(emails) / sum(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_memory_kb": peak / 1024,
+        "accuracy": correct / len(emails),
+        "mean_body_bytes": statistics.mean(len(e["body"]) for e in emails),
+    }
+
+
+def run(count: int = 500, merchant: str | None = None, seed: int = 0) -> list[dict]:
+    """
+    Benchmark every route of every (or one) merchant
+
+    Args:
+        count (int): Number of emails per route (default: 500)
+        merchant (str, optional): Only benchmark this merchant
+        seed (int): Corpus random seed (default: 0)
+
+    Returns:
+        list[dict]: One result per (merchant, route)
+    """
+    # Every pass must run the extractors, not the memoized results
+    transaction_extractor = TransactionExtractor(cache_size=0)
+    results = []
+    for merchant_name, generators in GENERATORS.items():
+        if merchant and merchant_name != merchant:
+            continue
+        for route in generators:
+            emails = generate_emails(merchant_name, route, count, seed=seed)
+            result = bench_route(transaction_extractor, emails)
+            results.append({"merchant": merchant_name, "route": route, **result})
+    return results
+
+
+def print_results(results: list[dict]) -> None:
+    print(
+        f"{'merchant':<10} {'route':<42} {'emails/s':>10} {'p50 ms':>8} "
+        f"{'p99 ms':>8} {'peak KiB':>9} {'accuracy':>8}"
+    )
+    print("-" * 101)
+    for result in results:
+        print(
+            f"{result['merchant']:<10} {result['route'][:42]:<42} "
+            f"{result['emails_per_second']:>10.1f} {result['p50_ms']:>8.3f} "
+            f"{result['p99_ms']:>8.3f} {result['peak_memory_kb']:>9.1f} "
+            f"{result['accuracy']:>8.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extractor micro-benchmark")
+    parser.add_argument("--count", type=int, default=500, help="emails per route")
+    parser.add_argument("--merchant", help="only benchmark this merchant")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(count=args.count, merchant=args.merchant, seed=args.seed)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
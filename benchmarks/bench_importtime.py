@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Import time budget check.
+
+Imports each entry module in a fresh interpreter with `-X importtime`, reports
+its cumulative import time and the slowest modules it pulls in, and fails if a
+module exceeds its time budget or imports a heavy dependency it must only load
+on first use.
+
+Usage:
+    uv run python -m benchmarks.bench_importtime [--runs N] [--top N] [--json PATH]
+
+Exit status is 1 when any budget is exceeded, so it can gate CI.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+# Budgets in milliseconds (best of --runs) and modules that must stay unloaded
+BUDGETS = {
+    "utils.extractors": {
+        "max_ms": 120,
+        "forbidden": ["pandas", "bs4", "gspread", "dotenv"],
+    },
+    "utils.gmail": {
+        "max_ms": 120,
+        "forbidden": ["pandas", "bs4", "gspread"],
+    },
+    "test_extractor": {
+        "max_ms": 200,
+        "forbidden": ["pandas", "gspread", "gspread_formatting", "google.oauth2"],
+    },
+    "utils.pipeline": {
+        "max_ms": 150,
+        "forbidden": ["pandas", "bs4", "gspread", "gspread_formatting", "google.oauth2"],
+    },
+}
+
+
+def measure(module: str) -> dict:
+    """
+    Import a module in a fresh interpreter
+
+    Args:
+        module (str): Module to import
+
+    Returns:
+        dict: Cumulative import time in ms and the cumulative time of every
+            imported module
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Children are listed before their parent, so the modules imported by the
+    # target are the indented lines right before its own top-level line
+    subtree = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # Header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        subtree.append((name.strip(), int(cumulative) / 1000))
+        if depth == 0 and name.strip() != module:
+            subtree = []  # Imported by site, not by the target
+    modules = dict(subtree)
+    return {"total_ms": modules.get(module, 0.0), "modules": modules}
+
+
+def run(runs: int = 3, top: int = 5) -> list[dict]:
+    """
+    Check every module against its budget
+
+    Args:
+        runs (int): Imports per module, the fastest one is kept (default: 3)
+        top (int): Number of slowest imported modules to report (default: 5)
+
+    Returns:
+        list[dict]: One result per module
+    """
+    results = []
+    for module, budget in BUDGETS.items():
+        best = min((measure(module) for _ in range(runs)), key=lambda m: m["total_ms"])
+        imported = best["modules"]
+        loaded = [name for name in budget["forbidden"] if name in imported]
+        slowest = sorted(
+            ((name, ms) for name, ms in imported.items() if name != module),
+            key=lambda item: item[1],
+            reverse=True,
+        )[:top]
+        results.append(
+            {
+                "module": module,
+                "total_ms": best["total_ms"],
+                "budget_ms": budget["max_ms"],
+                "forbidden_loaded": loaded,
+                "slowest": slowest,
+                "ok": best["total_ms"] <= budget["max_ms"] and not loaded,
+            }
+        )
+    return results
+
+
+def print_results(results: list[dict]) -> None:
+    for result in results:
+        status = "ok" if result["ok"] else "OVER BUDGET"
+        print(
+            f"{result['module']:<20} {result['total_ms']:>8.1f} ms "
+            f"(budget {result['budget_ms']} ms) {status}"
+        )
+        if result["forbidden_loaded"]:
+            print(f"  imports at startup: {', '.join(result['forbidden_loaded'])}")
+        for name, ms in result["slowest"]:
+            print(f"  {ms:>8.1f} ms {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time budget check")
+    parser.add_argument("--runs", type=int, default=3, help="imports per module")
+    parser.add_argument("--top", type=int, default=5, help="slowest imports to show")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(runs=args.runs, top=args.top)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    sys.exit(0 if all(result["ok"] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
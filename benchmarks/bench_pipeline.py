@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline benchmark.
+
+Runs the logger pipeline (fetch and extract, record, upload) against a local
+fake IMAP server seeded with a synthetic corpus and an in-process fake of the
+Google Sheets API. Reports wall time, IMAP round trips and Sheets API calls
+per stage, and memory, so fetch and upload optimizations can be measured
+without real credentials.
+
+With --staged the overlapped pipeline of utils/staged.py runs instead and is
+reported as a single stage. --latency-ms delays every IMAP command and Sheets
+request to approximate remote servers, where the overlap matters most.
+IMAP connections are compressed with COMPRESS=DEFLATE unless --no-compress
+is given; IMAP KiB are the bytes on the wire either way.
+
+Usage:
+    uv run python -m benchmarks.bench_pipeline [--sizes N [N ...]] [--seed N]
+                                               [--staged] [--latency-ms MS]
+                                               [--no-compress]
+                                               [--tracemalloc] [--json PATH]
+
+Examples:
+    uv run python -m benchmarks.bench_pipeline
+    uv run python -m benchmarks.bench_pipeline --sizes 10 1000 100000
+    uv run python -m benchmarks.bench_pipeline --staged --latency-ms 2
+    uv run python -m benchmarks.bench_pipeline --sizes 1000 --no-compress
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+# The Foodpanda extractor reads its card number from the environment when the
+# registry is built, so it has to be set before importing the extractors
+CARD_DIGITS = "4321"
+os.environ["CARD_USED_FOR_FPND"] = CARD_DIGITS
+
+import gspread  # noqa: E402
+
+from benchmarks.fake_imap import FakeIMAPServer  # noqa: E402
+from benchmarks.fake_sheets import FakeSheetsSession  # noqa: E402
+from utils.extractors import TransactionExtractor  # noqa: E402
+from utils.extractors.test_data.synthetic import generate_corpus, to_rfc822  # noqa: E402
+from utils.gmail import Gmail  # noqa: E402
+from utils.googlesheets import SheetManager  # noqa: E402
+from utils.metrics import metrics  # noqa: E402
+from utils.pipeline import (  # noqa: E402
+    fetch_transactions,
+    record_transactions,
+    upload_pending,
+)
+from utils.staged import run_logger_staged  # noqa: E402
+from utils.store import TransactionStore  # noqa: E402
+
+
+class BenchCard:
+    """Card configuration used by the benchmark (see cards/_template.py)"""
+
+    NICKNAME = "Bench"
+    MERCHANTS = ["Grab", "Metrobank", "Foodpanda", "GreenGSM"]
+    LAST_DIGITS = CARD_DIGITS
+    STATEMENT_DATE = "15"
+    PREFIX = "BENCH"
+    GOOGLE_SHEET_ID = None
+    LAST_RUN_TIME_ENV_NAME = "BENCH_LAST_RUN_TIME"
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(
+    size: int,
+    seed: int = 0,
+    trace_memory: bool = False,
+    staged: bool = False,
+    latency: float = 0.0,
+    compress: bool = True,
+) -> dict:
+    """
+    Run the pipeline once over a synthetic mailbox
+
+    Args:
+        size (int): Number of emails in the mailbox
+        seed (int): Corpus random seed (default: 0)
+        trace_memory (bool): Also report peak traced Python memory (default: False)
+        staged (bool): Run the overlapped pipeline (default: False)
+        latency (float): Seconds added to every IMAP command and Sheets request
+            (default: 0.0)
+        compress (bool): Negotiate IMAP COMPRESS=DEFLATE (default: True)
+
+    Returns:
+        dict: Wall time, IMAP commands and Sheets calls per stage, memory and
+            the run metrics report (see utils.metrics)
+    """
+    corpus = generate_corpus(size, seed=seed, card_number=CARD_DIGITS)
+    date_interval = [
+        corpus[0]["date"] - timedelta(days=1),
+        corpus[-1]["date"] + timedelta(days=1),
+    ]
+
+    session = FakeSheetsSession(latency=latency)
+    card = type("Card", (BenchCard,), {"GOOGLE_SHEET_ID": session.create_spreadsheet()})
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+    transaction_extractor = TransactionExtractor()
+
+    stages = {}
+    metrics.enable()
+    if trace_memory:
+        tracemalloc.start()
+
+    raw_emails = (to_rfc822(email_data) for email_data in corpus)
+    with FakeIMAPServer(raw_emails, latency=latency) as server, \
+            tempfile.TemporaryDirectory() as tmp_dir, \
+            contextlib.redirect_stdout(io.StringIO()):
+        gmail_client = Gmail(
+            "bench@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+            compress=compress,
+        )
+        store = TransactionStore(os.path.join(tmp_dir, "transactions.db"))
+
+        def stage(name, func, *args, **kwargs):
+            server.reset_counters()
+            session.reset_counters()
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            stages[name] = {
+                "seconds": time.perf_counter() - start,
+                "imap_commands": sum(server.counters.values()),
+                "imap_bytes": server.bytes_sent + server.bytes_received,
+                "sheets_calls": sum(session.calls.values()),
+                "sheets_bytes": session.request_bytes + session.response_bytes,
+            }
+            return result
+
+        if staged:
+            uploaded = stage(
+                "staged",
+                run_logger_staged,
+                card,
+                gmail_client,
+                sheet_client,
+                transaction_extractor,
+                store,
+                date_interval,
+                limit=None,
+            )
+            recorded = len(store.transactions(card.LAST_DIGITS))
+            store.close()
+        else:
+            records = stage(
+                "fetch",
+                fetch_transactions,
+                gmail_client,
+                transaction_extractor,
+                card.MERCHANTS,
+                date_interval,
+                limit=None,
+            )
+            recorded = stage("record", record_transactions, store, records, card)
+            uploaded = stage("upload", upload_pending, store, sheet_client, card)
+            store.close()
+
+    result = {
+        "emails": size,
+        "transactions": recorded,
+        "uploaded": uploaded,
+        "seconds": sum(s["seconds"] for s in stages.values()),
+        "stages": stages,
+        "max_rss_mb": _max_rss_mb(),
+        "metrics": metrics.report(),
+    }
+    metrics.disable()
+    if trace_memory:
+        result["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result
+
+
+def print_results(results: list[dict]) -> None:
+    print(
+        f"{'emails':>8} {'stage':<8} {'seconds':>9} {'imap cmds':>10} "
+        f"{'imap KiB':>10} {'sheets calls':>13} {'sheets KiB':>11}"
+    )
+    print("-" * 75)
+    for result in results:
+        for name, stage in result["stages"].items():
+            print(
+                f"{result['emails']:>8} {name:<8} {stage['seconds']:>9.3f} "
+                f"{stage['imap_commands']:>10} {stage['imap_bytes'] / 1024:>10.1f} "
+                f"{stage['sheets_calls']:>13} {stage['sheets_bytes'] / 1024:>11.1f}"
+            )
+        memory = f"max RSS {result['max_rss_mb']:.1f} MiB"
+        if "peak_traced_mb" in result:
+            memory += f", peak traced {result['peak_traced_mb']:.1f} MiB"
+        print(
+            f"{result['emails']:>8} {'total':<8} {result['seconds']:>9.3f}  "
+            f"{result['transactions']} transactions, {result['uploaded']} uploaded, {memory}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 1000], help="mailbox sizes to run"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--staged", action="store_true", help="run the overlapped staged pipeline"
+    )
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=0.0,
+        help="delay added to every IMAP command and Sheets request",
+    )
+    parser.add_argument(
+        "--no-compress", action="store_true", help="do not compress IMAP connections"
+    )
+    parser.add_argument(
+        "--tracemalloc", action="store_true", help="also report peak traced memory"
+    )
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = [
+        run(
+            size,
+            seed=args.seed,
+            trace_memory=args.tracemalloc,
+            staged=args.staged,
+            latency=args.latency_ms / 1000,
+            compress=not args.no_compress,
+        )
+        for size in args.sizes
+    ]
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+"""
+Local IMAP stand-in for benchmarks and tests.
+
+Serves a seeded list of raw emails over plain TCP and implements the subset
+of IMAP4rev1 and Gmail extensions used by `utils.gmail.Gmail`: LOGIN,
+SELECT, SEARCH (ALL, UID ranges and X-GM-RAW), FETCH, STORE of X-GM-LABELS
+and their UID variants, IDLE (messages added with add_message while a
+client idles are announced with EXISTS) and COMPRESS=DEFLATE, which Gmail
+advertises after LOGIN.
+Every command is counted so round trips can be reported per stage, and the
+bytes on the wire (compressed, when negotiated) are counted per direction.
+
+Usage:
+    with FakeIMAPServer(raw_emails) as server:
+        gmail = Gmail("user", "pass", imap_server="127.0.0.1",
+                      imap_port=server.port, imap_ssl=False)
+        emails = gmail.read_emails(search_string="ALL", limit=None)
+        print(server.counters)
+"""
+
+import re
+import select
+import socket
+import socketserver
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from email.parser import BytesHeaderParser
+from email.utils import parseaddr, parsedate_to_datetime
+
+CAPABILITIES = "IMAP4rev1 X-GM-EXT-1 UIDPLUS IDLE"
+
+GMAIL_RAW_TERM = re.compile(r'(-?)(\{[^}]*\}|[\w-]+:(?:"[^"]*"|\S+))')
+FETCH_ITEM = re.compile(r"RFC822|BODY(?:\.PEEK)?\[\]", re.IGNORECASE)
+STORE_LABELS = re.compile(r"([+-]?)X-GM-LABELS(?:\.SILENT)?\s+\((.*)\)", re.IGNORECASE)
+# Compressed bytes read from the socket at a time
+READ_SIZE = 64 * 1024
+
+LABEL = re.compile(r'"((?:[^"\\]|\\.)*)"|([^\s()]+)')
+
+
+@dataclass
+class FakeMessage:
+    uid: int
+    raw: bytes
+    sender: str
+    subject: str
+    timestamp: float
+    labels: set = field(default_factory=set)
+
+
+def parse_sequence_set(sequence_set: str, highest: int) -> list[int]:
+    """Expand an IMAP sequence set such as "1,3:5,7:*" into numbers"""
+    numbers = []
+    for part in sequence_set.split(","):
+        if ":" in part:
+            start, end = part.split(":")
+            start = highest if start == "*" else int(start)
+            end = highest if end == "*" else int(end)
+            numbers.extend(range(min(start, end), max(start, end) + 1))
+        else:
+            numbers.append(highest if part == "*" else int(part))
+    return numbers
+
+
+def matches_gmail_raw(message: FakeMessage, query: str) -> bool:
+    """Evaluate the Gmail search operators used by the logger against a message"""
+    for negate, term in GMAIL_RAW_TERM.findall(query):
+        if term.startswith("{"):
+            # Braces combine the terms inside with OR
+            result = any(
+                matches_gmail_raw(message, inner) for inner in _split_or(term[1:-1])
+            )
+        else:
+            result = _matches_term(message, term)
+        if result == bool(negate):
+            return False
+    return True
+
+
+def _split_or(terms: str) -> list[str]:
+    return ["".join(match) for match in GMAIL_RAW_TERM.findall(terms)]
+
+
+def _matches_term(message: FakeMessage, term: str) -> bool:
+    operator, value = term.split(":", 1)
+    value = value.strip('"').lower()
+    operator = operator.lower()
+    if operator == "from":
+        return value in message.sender
+    if operator == "after":
+        return message.timestamp >= float(value)
+    if operator == "before":
+        return message.timestamp < float(value)
+    if operator == "subject":
+        return value in message.subject
+    if operator == "label":
+        return value in {label.replace("/", "-") for label in message.labels}
+    # Unknown operators (e.g. category:) never match in the fake
+    return False
+
+
+class FakeIMAPServer:
+    """Threaded local IMAP server seeded with raw emails"""
+
+    def __init__(
+        self,
+        raw_emails=(),
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        compress: bool = True,
+    ):
+        """
+        Args:
+            raw_emails: Raw RFC822 emails the mailbox starts with
+            host (str): Address to listen on (default: 127.0.0.1)
+            port (int): Port to listen on, 0 for any free port (default: 0)
+            latency (float): Seconds every command waits before it is handled,
+                to simulate a remote server (default: 0.0)
+            compress (bool): Offer COMPRESS=DEFLATE after LOGIN (default: True)
+        """
+        self.messages: list[FakeMessage] = []
+        self.latency = latency
+        self.compress = compress
+        self.counters = Counter()
+        # Upcoming commands, e.g. "UID FETCH", answered by dropping the
+        # connection, to test how clients recover
+        self.failures = Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.lock = threading.RLock()
+        for raw_email in raw_emails:
+            self.add_message(raw_email)
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                # Responses are written in several chunks; avoid Nagle delays
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                super().setup()
+
+            def handle(self):
+                IMAPSession(server, self).run()
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.tcp_server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.tcp_server.daemon_threads = True
+        self.host, self.port = self.tcp_server.server_address
+        self.thread = None
+
+    def add_message(self, raw_email: bytes) -> FakeMessage:
+        """Append a raw email to the mailbox and index its headers"""
+        headers = BytesHeaderParser().parsebytes(raw_email)
+        with self.lock:
+            message = FakeMessage(
+                uid=len(self.messages) + 1,
+                raw=raw_email,
+                sender=parseaddr(headers["from"] or "")[1].lower(),
+                subject=(headers["subject"] or "").lower(),
+                timestamp=parsedate_to_datetime(headers["date"]).timestamp(),
+            )
+            self.messages.append(message)
+        return message
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    def start(self) -> "FakeIMAPServer":
+        self.thread = threading.Thread(target=self.tcp_server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.tcp_server.shutdown()
+        self.tcp_server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class IMAPSession:
+    """State of a single client connection"""
+
+    def __init__(self, server: FakeIMAPServer, handler: socketserver.StreamRequestHandler):
+        self.server = server
+        self.rfile = handler.rfile
+        self.wfile = handler.wfile
+        self.connection = handler.connection
+        self.selected = False
+        self.compressor = None
+        self.decompressor = None
+        # Inflated bytes not read yet
+        self.buffer = bytearray()
+
+    def send(self, data: bytes) -> None:
+        if self.compressor is not None:
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.wfile.write(data)
+        self.wfile.flush()
+        with self.server.lock:
+            self.server.bytes_sent += len(data)
+
+    def readline(self) -> bytes:
+        if self.decompressor is None:
+            line = self.rfile.readline()
+            self._count_received(len(line))
+            return line
+        start = 0
+        while (end := self.buffer.find(b"\n", start)) < 0:
+            start = len(self.buffer)
+            if not self._fill():
+                end = len(self.buffer) - 1
+                break
+        line = bytes(self.buffer[: end + 1])
+        del self.buffer[: end + 1]
+        return line
+
+    def read(self, size: int) -> bytes:
+        if self.decompressor is None:
+            data = self.rfile.read(size)
+            self._count_received(len(data))
+            return data
+        while len(self.buffer) < size and self._fill():
+            pass
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def _fill(self) -> bool:
+        chunk = self.rfile.read1(READ_SIZE)
+        if not chunk:
+            return False
+        self._count_received(len(chunk))
+        self.buffer += self.decompressor.decompress(chunk)
+        return True
+
+    def _count_received(self, size: int) -> None:
+        with self.server.lock:
+            self.server.bytes_received += size
+
+    def read_command(self) -> str | None:
+        line = self.readline()
+        if not line:
+            return None
+        # Synchronizing literals: {n} at the end of the line
+        while (literal := re.search(rb"\{(\d+)\}\r\n$", line)) is not None:
+            self.send(b"+ Ready for literal\r\n")
+            line = line[: literal.start()] + b'"' + self.read(int(literal.group(1))) + b'"'
+            line += self.readline()
+        return line.decode("utf-8", errors="replace").rstrip("\r\n")
+
+    def run(self) -> None:
+        self.send(f"* OK [CAPABILITY {CAPABILITIES}] Fake IMAP ready\r\n".encode())
+        while (line := self.read_command()) is not None:
+            tag, _, rest = line.partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            uid = command == "UID"
+            if uid:
+                command, _, args = args.partition(" ")
+                command = command.upper()
+
+            name = f"UID {command}" if uid else command
+            with self.server.lock:
+                self.server.counters[name] += 1
+                drop = self.server.failures[name] > 0
+                if drop:
+                    self.server.failures[name] -= 1
+            if drop:
+                break
+
+            if self.server.latency:
+                time.sleep(self.server.latency)
+
+            handler = getattr(self, f"do_{command.lower()}", None)
+            if handler is None:
+                self.send(f"{tag} BAD Unsupported command {command}\r\n".encode())
+                continue
+            if handler(tag, args, uid) is False:
+                break
+
+    # --- Commands ---
+
+    def do_capability(self, tag, args, uid):
+        self.send(f"* CAPABILITY {CAPABILITIES}\r\n{tag} OK CAPABILITY completed\r\n".encode())
+
+    def do_noop(self, tag, args, uid):
+        self.send(f"{tag} OK NOOP completed\r\n".encode())
+
+    def do_login(self, tag, args, uid):
+        capabilities = CAPABILITIES + (" COMPRESS=DEFLATE" if self.server.compress else "")
+        self.send(f"{tag} OK [CAPABILITY {capabilities}] LOGIN completed\r\n".encode())
+
+    def do_compress(self, tag, args, uid):
+        if not self.server.compress or args.upper() != "DEFLATE":
+            self.send(f"{tag} BAD Unsupported compression {args}\r\n".encode())
+            return
+        if self.compressor is not None:
+            self.send(f"{tag} NO [COMPRESSIONACTIVE] Already compressed\r\n".encode())
+            return
+        # The response is the last uncompressed data in both directions
+        self.send(f"{tag} OK DEFLATE active\r\n".encode())
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self.decompressor = zlib.decompressobj(-15)
+
+    def do_idle(self, tag, args, uid):
+        with self.server.lock:
+            seen = len(self.server.messages)
+        self.send(b"+ idling\r\n")
+        while True:
+            with self.server.lock:
+                exists = len(self.server.messages)
+            if exists != seen:
+                self.send(f"* {exists} EXISTS\r\n".encode())
+                seen = exists
+            readable = self.buffer or select.select([self.connection], [], [], 0.02)[0]
+            if readable:
+                # DONE, or the connection was closed
+                if not self.readline():
+                    return False
+                break
+        self.send(f"{tag} OK IDLE terminated\r\n".encode())
+
+    def do_logout(self, tag, args, uid):
+        self.send(f"* BYE Logging out\r\n{tag} OK LOGOUT completed\r\n".encode())
+        return False
+
+    def do_select(self, tag, args, uid):
+        self.selected = True
+        with self.server.lock:
+            exists = len(self.server.messages)
+        self.send(
+            (
+                f"* {exists} EXISTS\r\n* 0 RECENT\r\n"
+                f"* OK [UIDVALIDITY 1] UIDs valid\r\n"
+                f"* OK [UIDNEXT {exists + 1}] Predicted next UID\r\n"
+                f"{tag} OK [READ-WRITE] SELECT completed\r\n"
+            ).encode()
+        )
+
+    do_examine = do_select
+
+    def do_close(self, tag, args, uid):
+        self.selected = False
+        self.send(f"{tag} OK CLOSE completed\r\n".encode())
+
+    def do_search(self, tag, args, uid):
+        with self.server.lock:
+            messages = list(enumerate(self.server.messages, 1))
+
+        raw_query = re.search(r'X-GM-RAW\s+"((?:[^"\\]|\\.)*)"', args, re.IGNORECASE)
+        uid_range = re.search(r"\bUID\s+([\d:*,]+)", args, re.IGNORECASE)
+        if raw_query:
+            query = raw_query.group(1).replace('\\"', '"')
+            messages = [(n, m) for n, m in messages if matches_gmail_raw(m, query)]
+        if uid_range:
+            highest = messages[-1][1].uid if messages else 0
+            uids = set(parse_sequence_set(uid_range.group(1), highest))
+            messages = [(n, m) for n, m in messages if m.uid in uids]
+
+        found = " ".join(str(m.uid if uid else n) for n, m in messages)
+        self.send(f"* SEARCH {found}\r\n{tag} OK SEARCH completed\r\n".encode())
+
+    def do_fetch(self, tag, args, uid):
+        sequence_set, _, items = args.partition(" ")
+        with self.server.lock:
+            messages = list(enumerate(self.server.messages, 1))
+        if not messages:
+            self.send(f"{tag} OK FETCH completed\r\n".encode())
+            return
+
+        if uid:
+            wanted = set(parse_sequence_set(sequence_set, messages[-1][1].uid))
+            selected = [(n, m) for n, m in messages if m.uid in wanted]
+        else:
+            wanted = set(parse_sequence_set(sequence_set, len(messages)))
+            selected = [(n, m) for n, m in messages if n in wanted]
+
+        body_item = FETCH_ITEM.search(items)
+        for number, message in selected:
+            parts = [f"UID {message.uid}"]
+            if "X-GM-LABELS" in items.upper():
+                labels = " ".join(f'"{label}"' for label in sorted(message.labels))
+                parts.append(f"X-GM-LABELS ({labels})")
+            response = f"* {number} FETCH ({' '.join(parts)}".encode()
+            if body_item:
+                name = body_item.group(0).upper().replace(".PEEK", "")
+                response += f" {name} {{{len(message.raw)}}}\r\n".encode() + message.raw
+            self.send(response + b")\r\n")
+        self.send(f"{tag} OK FETCH completed\r\n".encode())
+
+    def do_store(self, tag, args, uid):
+        sequence_set, _, items = args.partition(" ")
+        store = STORE_LABELS.search(items)
+        if store is None:
+            self.send(f"{tag} BAD Only X-GM-LABELS can be stored\r\n".encode())
+            return
+        operation = store.group(1)
+        labels = {quoted or bare for quoted, bare in LABEL.findall(store.group(2))}
+
+        with self.server.lock:
+            messages = list(enumerate(self.server.messages, 1))
+            highest = messages[-1][1].uid if uid else len(messages)
+            wanted = set(parse_sequence_set(sequence_set, highest)) if messages else set()
+            for number, message in messages:
+                if (message.uid if uid else number) not in wanted:
+                    continue
+                if operation == "+":
+                    message.labels |= labels
+                elif operation == "-":
+                    message.labels -= labels
+                else:
+                    message.labels = set(labels)
+        self.send(f"{tag} OK STORE completed\r\n".encode())
@@ -0,0 +1,320 @@
+"""
+In-process fake of the Google Sheets endpoints that gspread talks to.
+
+`FakeSheetsSession` replaces the authorized requests session of a gspread
+client. It keeps spreadsheets in memory, implements the metadata, values and
+batchUpdate endpoints used by `utils.googlesheets.SheetManager`, and records
+call counts and payload sizes.
+
+Usage:
+    session = FakeSheetsSession()
+    spreadsheet_id = session.create_spreadsheet("Transactions")
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+    ...
+    print(session.calls, session.request_bytes)
+"""
+
+import json
+import re
+import time
+from collections import Counter
+from urllib.parse import unquote
+
+BASE_URL = "https://sheets.googleapis.com/v4/spreadsheets/"
+
+A1_CELL = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+class FakeResponse:
+    def __init__(self, payload: dict, status_code: int = 200):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode()
+        self.text = self.content.decode()
+        self.ok = status_code < 400
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+def column_index(letters: str) -> int:
+    """Convert column letters to a 0-based index ("A" -> 0, "AA" -> 26)"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+class FakeSpreadsheet:
+    def __init__(self, spreadsheet_id: str, title: str, sheet_titles: list[str]):
+        self.id = spreadsheet_id
+        self.title = title
+        self.sheets = []
+        self.next_sheet_id = 0
+        for sheet_title in sheet_titles:
+            self.add_sheet({"title": sheet_title})
+
+    def add_sheet(self, properties: dict) -> dict:
+        grid = properties.get("gridProperties", {})
+        sheet_id = properties.get("sheetId", self.next_sheet_id)
+        sheet = {
+            "properties": {
+                "sheetId": sheet_id,
+                "title": properties["title"],
+                # Inserted before the sheet at its index
+                "index": properties["index"] - 0.5 if "index" in properties else len(self.sheets),
+                "sheetType": "GRID",
+                "gridProperties": {
+                    "rowCount": grid.get("rowCount", 1000),
+                    "columnCount": grid.get("columnCount", 26),
+                },
+            },
+            "values": [],
+        }
+        self.next_sheet_id = max(self.next_sheet_id, sheet_id) + 1
+        self.sheets.append(sheet)
+        self._sort()
+        return sheet["properties"]
+
+    def _sort(self) -> None:
+        self.sheets.sort(key=lambda sheet: sheet["properties"]["index"])
+        for index, sheet in enumerate(self.sheets):
+            sheet["properties"]["index"] = index
+
+    def sheet_by_id(self, sheet_id: int) -> dict:
+        return next(s for s in self.sheets if s["properties"]["sheetId"] == sheet_id)
+
+    def parse_range(self, a1_range: str):
+        """Split "'Title'!A1:B2" into (sheet, start row, start col, end row, end col)"""
+        title, _, cells = a1_range.rpartition("!")
+        if not title and not A1_CELL.match(cells.partition(":")[0]):
+            # A bare sheet title is the whole sheet
+            title, cells = cells, "A1"
+        title = title.strip("'").replace("''", "'")
+        sheet = (
+            next(s for s in self.sheets if s["properties"]["title"] == title)
+            if title
+            else self.sheets[0]
+        )
+        start, _, end = cells.partition(":")
+        start_col, start_row = A1_CELL.match(start).groups()
+        end_col, end_row = A1_CELL.match(end or start).groups()
+        return (
+            sheet,
+            int(start_row) - 1 if start_row else 0,
+            column_index(start_col) if start_col else 0,
+            int(end_row) - 1 if end_row else None,
+            column_index(end_col) if end_col else None,
+        )
+
+    def get_values(self, a1_range: str, major_dimension: str = "ROWS") -> list:
+        sheet, start_row, start_col, end_row, end_col = self.parse_range(a1_range)
+        rows = sheet["values"][start_row : None if end_row is None else end_row + 1]
+        values = [
+            [_formatted(v) for v in row[start_col : None if end_col is None else end_col + 1]]
+            for row in rows
+        ]
+        # The API omits trailing empty rows
+        while values and not any(str(v) != "" for v in values[-1]):
+            values.pop()
+        if major_dimension == "COLUMNS":
+            width = max((len(row) for row in values), default=0)
+            values = [[row[i] if i < len(row) else "" for row in values] for i in range(width)]
+        return values
+
+    def set_values(self, a1_range: str, values: list) -> int:
+        sheet, start_row, start_col, _, _ = self.parse_range(a1_range)
+        grid = sheet["properties"]["gridProperties"]
+        grid["rowCount"] = max(grid["rowCount"], start_row + len(values))
+        for offset, row in enumerate(values):
+            row_index = start_row + offset
+            while len(sheet["values"]) <= row_index:
+                sheet["values"].append([])
+            target = sheet["values"][row_index]
+            while len(target) < start_col + len(row):
+                target.append("")
+            target[start_col : start_col + len(row)] = row
+        return sum(len(row) for row in values)
+
+    def metadata(self) -> dict:
+        return {
+            "spreadsheetId": self.id,
+            "properties": {"title": self.title, "locale": "en_US", "timeZone": "Asia/Manila"},
+            "sheets": [{"properties": s["properties"]} for s in self.sheets],
+        }
+
+    def batch_update(self, requests: list) -> list:
+        replies = []
+        for request in requests:
+            (kind, body), = request.items()
+            if kind == "addSheet":
+                replies.append({"addSheet": {"properties": self.add_sheet(body["properties"])}})
+                continue
+            if kind == "updateSheetProperties":
+                properties = body["properties"]
+                sheet = self.sheet_by_id(properties["sheetId"])
+                for field in body["fields"].split(","):
+                    source, target = properties, sheet["properties"]
+                    *parents, name = re.split(r"[./]", field.strip())
+                    for parent in parents:
+                        source, target = source[parent], target.setdefault(parent, {})
+                    target[name] = source[name]
+                if "index" in body["fields"]:
+                    # Move the sheet before the others that share the index
+                    sheet["properties"]["index"] -= 0.5
+                    self._sort()
+            elif kind == "updateCells":
+                start = body["start"]
+                sheet = self.sheet_by_id(start["sheetId"])
+                title = sheet["properties"]["title"].replace("'", "''")
+                row = start.get("rowIndex", 0) + 1
+                column = start.get("columnIndex", 0)
+                values = [
+                    [
+                        next(iter(cell.get("userEnteredValue", {"stringValue": ""}).values()))
+                        for cell in row_data.get("values", [])
+                    ]
+                    for row_data in body.get("rows", [])
+                ]
+                self.set_values(f"'{title}'!{_column_letters(column)}{row}", values)
+            elif kind == "deleteSheet":
+                self.sheets.remove(self.sheet_by_id(body["sheetId"]))
+                self._sort()
+            # Formatting, widths and validations have no effect on the values
+            replies.append({})
+        return replies
+
+
+class FakeSheetsSession:
+    """Stand-in for the requests session of a gspread client"""
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency (float): Seconds every request waits, to simulate the
+                round trip to the API (default: 0.0)
+        """
+        self.latency = latency
+        self.headers = {}
+        self.spreadsheets: dict[str, FakeSpreadsheet] = {}
+        self.calls = Counter()
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def create_spreadsheet(
+        self, title: str = "Transactions", sheet_titles: list[str] = ("Summary", "Categories")
+    ) -> str:
+        """Create a spreadsheet and return its ID"""
+        spreadsheet_id = f"fake-spreadsheet-{len(self.spreadsheets) + 1}"
+        self.spreadsheets[spreadsheet_id] = FakeSpreadsheet(
+            spreadsheet_id, title, list(sheet_titles)
+        )
+        return spreadsheet_id
+
+    def reset_counters(self) -> None:
+        self.calls.clear()
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def request(self, method, url, json=None, params=None, data=None, files=None, headers=None, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        method = method.upper()
+        path = url[len(BASE_URL) :] if url.startswith(BASE_URL) else url
+        spreadsheet_id = re.split(r"[/:]", path, maxsplit=1)[0]
+        rest = path[len(spreadsheet_id) :]
+
+        response = self._dispatch(method, spreadsheet_id, rest, json or {}, params or {})
+        self.calls[f"{method} {self._endpoint_name(rest)}"] += 1
+        self.request_bytes += len(_json_dumps(json)) if json is not None else 0
+        self.response_bytes += len(response.content)
+        return response
+
+    @staticmethod
+    def _endpoint_name(rest: str) -> str:
+        if rest.startswith("/values/"):
+            return "values" + (":append" if rest.endswith(":append") else "")
+        return rest.lstrip("/") or "metadata"
+
+    def _dispatch(self, method, spreadsheet_id, rest, body, params) -> FakeResponse:
+        spreadsheet = self.spreadsheets.get(spreadsheet_id)
+        if spreadsheet is None:
+            return FakeResponse(
+                {"error": {"code": 404, "message": "Requested entity was not found.", "status": "NOT_FOUND"}},
+                404,
+            )
+
+        if rest == "" and method == "GET":
+            return FakeResponse(spreadsheet.metadata())
+
+        if rest == ":batchUpdate":
+            replies = spreadsheet.batch_update(body.get("requests", []))
+            return FakeResponse({"spreadsheetId": spreadsheet_id, "replies": replies})
+
+        if rest == "/values:batchGet":
+            ranges = params.get("ranges", [])
+            ranges = [ranges] if isinstance(ranges, str) else ranges
+            return FakeResponse(
+                {
+                    "spreadsheetId": spreadsheet_id,
+                    "valueRanges": [
+                        {"range": r, "majorDimension": "ROWS", "values": spreadsheet.get_values(r)}
+                        for r in ranges
+                    ],
+                }
+            )
+
+        if rest == "/values:batchUpdate":
+            updated = sum(
+                spreadsheet.set_values(item["range"], item["values"])
+                for item in body.get("data", [])
+            )
+            return FakeResponse({"spreadsheetId": spreadsheet_id, "totalUpdatedCells": updated})
+
+        if rest.startswith("/values/"):
+            a1_range = unquote(rest[len("/values/") :])
+            if a1_range.endswith(":append"):
+                a1_range = a1_range[: -len(":append")]
+                sheet = spreadsheet.parse_range(a1_range)[0]
+                next_row = len(sheet["values"]) + 1
+                title = sheet["properties"]["title"]
+                updated = spreadsheet.set_values(f"'{title}'!A{next_row}", body.get("values", []))
+                return FakeResponse({"spreadsheetId": spreadsheet_id, "updates": {"updatedCells": updated}})
+            if method == "GET":
+                major_dimension = params.get("majorDimension", "ROWS")
+                return FakeResponse(
+                    {
+                        "range": a1_range,
+                        "majorDimension": major_dimension,
+                        "values": spreadsheet.get_values(a1_range, major_dimension),
+                    }
+                )
+            updated = spreadsheet.set_values(a1_range, body.get("values", []))
+            return FakeResponse(
+                {"spreadsheetId": spreadsheet_id, "updatedRange": a1_range, "updatedCells": updated}
+            )
+
+        return FakeResponse({"error": {"code": 400, "message": f"Unsupported {method} {rest}"}}, 400)
+
+
+def _column_letters(index: int) -> str:
+    """Convert a 0-based column index to letters (0 -> "A", 26 -> "AA")"""
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def _formatted(value) -> str:
+    """Render a cell value the way the API returns FORMATTED_VALUE"""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _json_dumps(payload) -> str:
+    return json.dumps(payload, default=str)
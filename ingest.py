@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Offline transaction import from a mail export.
+
+Reads an mbox file (e.g. Google Takeout), a Maildir or a directory of .eml
+files, extracts the transactions of the configured card and records them in
+the local transaction store.
+
+Usage:
+    uv run python ingest.py <path> [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+                                   [--workers N] [--upload]
+
+Examples:
+    uv run python ingest.py ~/Takeout/Mail/All\\ mail.mbox
+    uv run python ingest.py ~/Maildir --from 2024-01-01 --upload
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+import pytz
+
+from cards import CreditCardName
+from utils import load_env
+from utils.googlesheets import SheetManager
+from utils.ingest import ingest_messages
+from utils.pipeline import record_transactions, upload_pending
+from utils.store import TransactionStore
+
+load_env()
+
+cc_init = CreditCardName()
+
+
+def parse_date(value: str) -> datetime:
+    return pytz.timezone("Asia/Manila").localize(datetime.strptime(value, "%Y-%m-%d"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="mbox file, Maildir or directory of .eml files")
+    parser.add_argument("--from", dest="start_date", type=parse_date)
+    parser.add_argument("--to", dest="end_date", type=parse_date)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument(
+        "--upload",
+        action="store_true",
+        help="push the pending transactions to Google Sheets after the import",
+    )
+    args = parser.parse_args()
+
+    date_interval = None
+    if args.start_date or args.end_date:
+        date_interval = [
+            args.start_date or parse_date("1970-01-01"),
+            args.end_date or datetime.now(pytz.timezone("Asia/Manila")),
+        ]
+
+    print(f"Importing {args.path} for {cc_init.NICKNAME}")
+    records = ingest_messages(
+        args.path,
+        date_interval=date_interval,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        route_stats_path=os.getenv("ROUTE_STATS_PATH", "route_stats.json") or None,
+    )
+
+    with TransactionStore(os.getenv("TRANSACTION_DB_PATH", "transactions.db")) as store:
+        record_transactions(store, records, cc_init)
+
+        if args.upload:
+            sheet_client = SheetManager(os.getenv("GOOGLE_SHEET_CREDS_PATH"))
+            upload_pending(store, sheet_client, cc_init)
+
+
+if __name__ == "__main__":
+    main()
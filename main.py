@@ -1,96 +1,270 @@
+import argparse
 import os
 from datetime import datetime, timedelta
 
-import pandas as pd
-from dotenv import load_dotenv
-
+import cards
 from cards import CreditCardName
-from utils import update_env_file
-from utils.extractors import TransactionExtractor, get_extractor_for_merchant
+from utils import load_env
+from utils.backfill import WINDOW_SIZES, run_backfill
+from utils.extractors import TransactionExtractor
 from utils.gmail import Gmail
 from utils.googlesheets import SheetManager
+from utils.metrics import metrics
+from utils.pipeline import IncompleteRunError, upload_pending
+from utils.profiling import profiler
+from utils.retry import DEFAULT_RUN_DEADLINE, DEFAULT_TIMEOUT
+from utils.service import LoggerService, run_card
+from utils.store import TransactionStore
+from utils.watch import run_watch
 
-load_dotenv()
+load_env()
 
 cc_init = CreditCardName()
 
 
-def main():
-    gmail_client = Gmail(os.getenv("GMAIL_EMAIL"), os.getenv("GMAIL_APP_PASSWORD"))
-    sheet_client = SheetManager(os.getenv("GOOGLE_SHEET_CREDS_PATH"))
+def parse_args():
+    parser = argparse.ArgumentParser(description="Log credit card transactions")
+    parser.add_argument(
+        "--backfill",
+        nargs=2,
+        metavar=("FROM", "TO"),
+        type=lambda value: datetime.strptime(value, "%Y-%m-%d"),
+        help="fetch the transactions from FROM to TO (inclusive, YYYY-MM-DD) "
+        "instead of since the last runtime",
+    )
+    parser.add_argument(
+        "--window",
+        choices=WINDOW_SIZES.keys(),
+        default="week",
+        help="backfill window size (default: week)",
+    )
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=4,
+        help="number of concurrent IMAP connections (default: 4)",
+    )
+    parser.add_argument(
+        "--sequential",
+        action="store_true",
+        help="fetch, extract and upload one stage after the other instead of "
+        "overlapping them",
+    )
+    parser.add_argument(
+        "--extract-workers",
+        type=int,
+        default=2,
+        help="extraction threads of the staged pipeline (default: 2)",
+    )
+    parser.add_argument(
+        "--batch-rows",
+        type=int,
+        default=200,
+        help="transactions uploaded per batch by the staged pipeline (default: 200)",
+    )
+    parser.add_argument(
+        "--batch-seconds",
+        type=float,
+        default=5.0,
+        help="maximum seconds a staged pipeline batch waits before upload (default: 5)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="after catching up, keep running and log transactions as their "
+        "emails arrive (IMAP IDLE)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="keep running as a service with warm clients, running every card "
+        "of cards/cards.py on a schedule and on demand",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=15,
+        help="minutes between the scheduled runs of a card in service mode, "
+        "0 to run on demand only (default: 15)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="in service mode, accept run triggers on this local HTTP port "
+        "(POST /run, POST /run/<card>, GET /status)",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="write cProfile data per stage and extractor route to DIR "
+        "(runs the sequential pipeline)",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="also trace allocations per stage and route (slow)",
+    )
+    parser.add_argument(
+        "--profile-slowest",
+        type=int,
+        metavar="N",
+        help="also profile the N slowest emails on their own",
+    )
+    return parser.parse_args()
 
-    transaction_extractor = TransactionExtractor()
 
-    print("Hello from cc-transaction-logger-v2!")
-    print(f"Running extractor for {cc_init.NICKNAME}")
+def card_configurations() -> dict:
+    """Every card class of cards/cards.py, by class name"""
+    return {
+        name: value()
+        for name, value in vars(cards).items()
+        if isinstance(value, type)
+        and value.__module__ == "cards.cards"
+        and hasattr(value, "MERCHANTS")
+    }
 
-    # Determine time range for fetching emails
-    last_runtime = os.getenv(cc_init.LAST_RUN_TIME_ENV_NAME, None)
-    if last_runtime:
-        start_date = datetime.strptime(last_runtime, "%Y-%m-%d %H:%M:%S")
-    else:
-        start_date = datetime.now() - timedelta(days=7)
-    end_date = datetime.now()
-    date_interval = [start_date, end_date]
 
-    dfs = []
+def network_timeout() -> float | None:
+    """Seconds a network operation may take, None to wait forever"""
+    return float(os.getenv("NETWORK_TIMEOUT") or DEFAULT_TIMEOUT) or None
 
-    # Process each merchant
-    for merchant in cc_init.MERCHANTS:
-        print(f"Fetching emails from {merchant}...")
 
-        # Get the extractor to determine the merchant's email address
-        extractor = get_extractor_for_merchant(merchant)
+def run_options(args) -> dict:
+    """Options of run_card"""
+    deadline = float(os.getenv("RUN_DEADLINE") or DEFAULT_RUN_DEADLINE)
+    if args.sequential:
+        return {"sequential": True, "deadline": deadline}
+    return {
+        "deadline": deadline,
+        "connections": args.connections,
+        "extract_workers": args.extract_workers,
+        "batch_rows": args.batch_rows,
+        "batch_seconds": args.batch_seconds,
+    }
 
-        # Step 1: Fetch emails directly using the Gmail client
-        emails = gmail_client.read_emails_filtered(
-            sender=extractor.merchant_email, date_interval=date_interval, limit=10
-        )
 
-        if emails:
-            print(f"Found {len(emails)} emails for {merchant}")
+def serve(args, gmail_client, sheet_client, transaction_extractor):
+    service = LoggerService(
+        card_configurations() or {type(cc_init).__name__: cc_init},
+        gmail_client,
+        sheet_client,
+        transaction_extractor,
+        os.getenv("TRANSACTION_DB_PATH", "transactions.db"),
+        interval=args.interval * 60 or None,
+        **run_options(args),
+    )
+    server = service.serve_http(args.port) if args.port is not None else None
+    print(f"Serving {', '.join(service.cards)}")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped serving")
+    finally:
+        if server is not None:
+            server.shutdown()
+
 
-            # Step 2: Process the emails to extract transaction data
-            df = transaction_extractor.process_email_data(
-                merchant=merchant, emails_data=emails
+def run(args):
+    gmail_client = Gmail(
+        os.getenv("GMAIL_EMAIL"),
+        os.getenv("GMAIL_APP_PASSWORD"),
+        search_exclude=os.getenv("GMAIL_SEARCH_EXCLUDE"),
+        processed_label=os.getenv("GMAIL_PROCESSED_LABEL") or None,
+        # Logged in connections are reused by the runs of the service
+        keep_connections=args.connections if args.serve else 0,
+        timeout=network_timeout(),
+        compress=os.getenv("IMAP_COMPRESS", "1") != "0",
+    )
+    sheet_client = SheetManager(
+        os.getenv("GOOGLE_SHEET_CREDS_PATH"), timeout=network_timeout()
+    )
+
+    transaction_extractor = TransactionExtractor(
+        cache_path=os.getenv("EXTRACTION_CACHE_PATH") or None,
+        route_stats_path=os.getenv("ROUTE_STATS_PATH", "route_stats.json") or None,
+    )
+
+    print("Hello from cc-transaction-logger-v2!")
+
+    if args.serve:
+        try:
+            serve(args, gmail_client, sheet_client, transaction_extractor)
+        finally:
+            gmail_client.close()
+            transaction_extractor.close()
+        return
+
+    store = TransactionStore(os.getenv("TRANSACTION_DB_PATH", "transactions.db"))
+    print(f"Running extractor for {cc_init.NICKNAME}")
+
+    if args.backfill:
+        start_date, end_date = args.backfill
+        with metrics.span("pipeline.backfill"), profiler.scope("stage:backfill"):
+            run_backfill(
+                gmail_client,
+                transaction_extractor,
+                store,
+                cc_init,
+                date_interval=[start_date, end_date + timedelta(days=1)],
+                window=args.window,
+                connections=args.connections,
             )
+        with profiler.scope("stage:upload"):
+            upload_pending(store, sheet_client, cc_init)
+        store.close()
+        transaction_extractor.close()
+        return
 
-            if df is not None:
-                print(f"Extracted {len(df)} transactions from {merchant}")
-                dfs.append(df)
-            else:
-                print(f"No valid transactions found in {merchant} emails")
-        else:
-            print(f"No emails found for {merchant}")
-
-    # Process extracted transactions
-    if dfs:
-        df = pd.concat(dfs)
-        df = df.sort_values(by="date", ascending=True)
-        df = df[df["card_number"].astype(str) == cc_init.LAST_DIGITS]
-        print(df)
-
-        # Upload transactions to Google Sheets
-        print("Creating logger sheet...")
-        worksheet = sheet_client.create_logger_sheet(
-            prefix=cc_init.PREFIX,
-            spreadsheet_id=cc_init.GOOGLE_SHEET_ID,
-            statement_day=int(cc_init.STATEMENT_DATE),
-        )
-        print("Uploading transactions to Google Sheets...")
-        sheet_client.update_logger_sheet(
-            worksheet=worksheet,
-            df=df,
-            end_date=end_date,
+    # Fetch the emails since the last runtime, then update it
+    run_card(
+        cc_init,
+        gmail_client,
+        sheet_client,
+        transaction_extractor,
+        store,
+        **run_options(args),
+    )
+
+    if args.watch:
+        # New emails are fetched by UID from now on, on the same clients
+        try:
+            run_watch(cc_init, gmail_client, sheet_client, transaction_extractor, store)
+        except KeyboardInterrupt:
+            print("Stopped watching")
+    store.close()
+    transaction_extractor.close()
+
+
+def main():
+    args = parse_args()
+
+    # Per run metrics are only collected when a report is requested
+    report_path = os.getenv("METRICS_REPORT_PATH")
+    prometheus_path = os.getenv("METRICS_PROMETHEUS_PATH")
+    if report_path or prometheus_path:
+        metrics.enable()
+
+    if args.profile:
+        profiler.enable(
+            args.profile, memory=args.profile_memory, slowest=args.profile_slowest
         )
-        print("Done!")
-    else:
-        print("No transactions found, skipping upload to Google Sheets")
 
-    # Update last runtime
-    update_env_file(
-        cc_init.LAST_RUN_TIME_ENV_NAME, end_date.strftime("%Y-%m-%d %H:%M:%S")
-    )
+    try:
+        run(args)
+    except IncompleteRunError as e:
+        print(f"{e}, the last runtime was not updated")
+        raise SystemExit(1)
+    finally:
+        if args.profile:
+            summary_path = profiler.write_report(
+                replay=TransactionExtractor(cache_size=0).extract_transaction
+            )
+            profiler.disable()
+            print(f"Profile written to {summary_path}")
+        if report_path:
+            metrics.write_report(report_path)
+        if prometheus_path:
+            metrics.write_prometheus(prometheus_path)
 
 
 if __name__ == "__main__":
@@ -6,24 +6,27 @@ This script allows you to test any email extractor (Foodpanda, Grab, Metrobank,
 with real emails from your Gmail account.
 
 Usage:
-    uv run python test_extractor.py <merchant> [days_back]
+    uv run python test_extractor.py <merchant> [days_back] [--profile DIR]
+                                    [--profile-memory] [--profile-slowest N]
 
 Examples:
     uv run python test_extractor.py Foodpanda
     uv run python test_extractor.py Grab 7
     uv run python test_extractor.py Metrobank 14
+    uv run python test_extractor.py Foodpanda 30 --profile profile --profile-slowest 5
 """
 
 import os
 import sys
+import time
 from datetime import datetime, timedelta
 
-from dotenv import load_dotenv
-
+from utils import load_env
 from utils.extractors import TransactionExtractor, get_extractor_for_merchant, EXTRACTOR_REGISTRY
 from utils.gmail import Gmail
+from utils.profiling import profiler
 
-load_dotenv()
+load_env()
 
 
 def test_merchant_extractor(merchant_name, days_back=3):
@@ -48,7 +51,9 @@ def test_merchant_extractor(merchant_name, days_back=3):
     # Initialize clients
     try:
         gmail_client = Gmail(os.getenv("GMAIL_EMAIL"), os.getenv("GMAIL_APP_PASSWORD"))
-        transaction_extractor = TransactionExtractor()
+        transaction_extractor = TransactionExtractor(
+            cache_path=os.getenv("EXTRACTION_CACHE_PATH") or None
+        )
     except Exception as e:
         print(f"❌ Error initializing clients: {e}")
         print("Make sure your .env file has GMAIL_EMAIL and GMAIL_APP_PASSWORD set correctly")
@@ -71,11 +76,12 @@ def test_merchant_extractor(merchant_name, days_back=3):
     # Fetch emails
     print(f"\n🔎 Fetching emails from {merchant_name}...")
     try:
-        emails = gmail_client.read_emails_filtered(
-            sender=extractor.merchant_email,
-            date_interval=[start_date, end_date],
-            limit=20  # Reasonable limit to avoid too many results
-        )
+        with profiler.scope("stage:fetch"):
+            emails = gmail_client.read_emails_filtered(
+                sender=extractor.merchant_email,
+                date_interval=[start_date, end_date],
+                limit=20  # Reasonable limit to avoid too many results
+            )
     except Exception as e:
         print(f"❌ Error fetching emails: {e}")
         return
@@ -104,11 +110,14 @@ def test_merchant_extractor(merchant_name, days_back=3):
         
         # Try extraction
         try:
-            result = transaction_extractor.extract_from_email(
-                merchant=merchant_name,
-                email_body=email_data["body"],
-                email_subject=email_data["subject"]
-            )
+            start = time.perf_counter()
+            with profiler.scope("stage:extract"):
+                result = transaction_extractor.extract_from_email(
+                    merchant=merchant_name,
+                    email_body=email_data["body"],
+                    email_subject=email_data["subject"]
+                )
+            profiler.record_email(merchant_name, email_data, time.perf_counter() - start)
             
             print(f"\n🔍 Extraction Results:")
             print(f"  💳 Card Number: {result.card_number}")
@@ -138,15 +147,23 @@ def test_merchant_extractor(merchant_name, days_back=3):
         print(f"\n⚠️  No valid extractions found. The {merchant_name} extractor may need updates.")
         print(f"💡 Consider examining the email format and updating the extractor logic.")
 
+    transaction_extractor.close()
+
 
 def show_usage():
     """Show usage information."""
-    print("Usage: python test_extractor.py <merchant> [days_back]")
+    print("Usage: python test_extractor.py <merchant> [days_back] [--profile DIR]")
+    print("                                  [--profile-memory] [--profile-slowest N]")
     print()
     print("Arguments:")
     print("  merchant    : Name of the merchant to test (required)")
     print("  days_back   : Number of days to look back for emails (default: 3)")
     print()
+    print("Options:")
+    print("  --profile DIR       : Write cProfile data per stage and extractor route to DIR")
+    print("  --profile-memory    : Also trace allocations per stage and route (slow)")
+    print("  --profile-slowest N : Also profile the N slowest emails on their own")
+    print()
     print("Available merchants:")
     for merchant in EXTRACTOR_REGISTRY.keys():
         print(f"  • {merchant}")
@@ -157,7 +174,27 @@ def show_usage():
     print("  python test_extractor.py Metrobank 14")
 
 
+def pop_option(args, name, has_value=True):
+    """Remove an option (and its value) from the arguments and return its value."""
+    if name not in args:
+        return None
+    index = args.index(name)
+    if not has_value:
+        del args[index]
+        return True
+    if index + 1 >= len(args):
+        print(f"❌ Error: {name} requires a value")
+        sys.exit(1)
+    value = args[index + 1]
+    del args[index : index + 2]
+    return value
+
+
 if __name__ == "__main__":
+    profile_dir = pop_option(sys.argv, "--profile")
+    profile_memory = pop_option(sys.argv, "--profile-memory", has_value=False)
+    profile_slowest = pop_option(sys.argv, "--profile-slowest")
+
     if len(sys.argv) < 2:
         print("❌ Error: Merchant name is required")
         print()
@@ -177,4 +214,19 @@ if __name__ == "__main__":
             print("Days must be a positive integer")
             sys.exit(1)
     
-    test_merchant_extractor(merchant, days)
\ No newline at end of file
+    if profile_dir:
+        try:
+            slowest = int(profile_slowest) if profile_slowest else None
+        except ValueError:
+            print(f"❌ Error: Invalid --profile-slowest value: {profile_slowest}")
+            sys.exit(1)
+        profiler.enable(profile_dir, memory=bool(profile_memory), slowest=slowest)
+
+    test_merchant_extractor(merchant, days)
+
+    if profile_dir:
+        summary_path = profiler.write_report(
+            replay=TransactionExtractor(cache_size=0).extract_transaction
+        )
+        profiler.disable()
+        print(f"\n🧪 Profile written to {summary_path}")
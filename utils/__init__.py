@@ -1,5 +1,25 @@
 import os
 
+_env_loaded = False
+
+
+def load_env() -> None:
+    """
+    Load the .env file into the environment, once per process
+
+    Entry points call this on startup; modules that read configuration call
+    it before their first lookup so they also work when imported on their own.
+    Variables already set in the environment take precedence.
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
 
 def update_env_file(key: str, value: str):
     """
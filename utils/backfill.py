@@ -0,0 +1,182 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import List
+
+from utils.extractors import (
+    TransactionExtractor,
+    group_merchants_by_sender,
+    route_emails,
+    search_subjects,
+)
+from utils.gmail import Gmail
+from utils.pipeline import record_transactions
+from utils.store import TransactionStore
+
+WINDOW_SIZES = {
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+
+
+def split_windows(
+    start_date: datetime, end_date: datetime, window: str = "week"
+) -> List[List[datetime]]:
+    """
+    Split a date range into consecutive [from_date, to_date] windows
+
+    Args:
+        start_date (datetime): Start of the range
+        end_date (datetime): End of the range
+        window (str): Window size, "day" or "week" (default: "week")
+
+    Returns:
+        List[List[datetime]]: The windows, the last one ends at end_date
+    """
+    if window not in WINDOW_SIZES:
+        raise ValueError(f"Invalid window size: {window}")
+
+    windows = []
+    window_start = start_date
+    while window_start < end_date:
+        window_end = min(window_start + WINDOW_SIZES[window], end_date)
+        windows.append([window_start, window_end])
+        window_start = window_end
+    return windows
+
+
+class BackfillCheckpoint:
+    """
+    JSON file of the windows of a backfill whose transactions are already
+    recorded in the transaction store, so an interrupted backfill resumes
+    where it stopped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                self.done = set(json.load(file).get("done", []))
+
+    @staticmethod
+    def window_key(window: List[datetime]) -> str:
+        return f"{window[0].isoformat()}/{window[1].isoformat()}"
+
+    def is_done(self, window: List[datetime]) -> bool:
+        return self.window_key(window) in self.done
+
+    def mark_done(self, window: List[datetime]) -> None:
+        self.done.add(self.window_key(window))
+
+        # Write to a temporary file first so an interruption never corrupts it
+        with open(f"{self.path}.tmp", "w") as file:
+            json.dump({"done": sorted(self.done)}, file, indent=2)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def fetch_window(
+    gmail_client: Gmail,
+    transaction_extractor: TransactionExtractor,
+    merchants: list,
+    window: List[datetime],
+) -> list:
+    """
+    Fetch and extract the transactions of every merchant inside a window
+
+    Fetch errors are raised so the window is not marked as done.
+
+    Returns:
+        list: The extracted transaction records
+    """
+    records = []
+    for sender, sender_merchants in group_merchants_by_sender(merchants).items():
+        subjects, excluded_subjects = search_subjects(sender_merchants)
+        emails = gmail_client.read_emails_filtered(
+            sender=sender,
+            date_interval=window,
+            limit=None,
+            raise_errors=True,
+            subjects=subjects,
+            excluded_subjects=excluded_subjects,
+        )
+        for merchant, merchant_emails in route_emails(
+            sender, emails or [], sender_merchants
+        ).items():
+            records.extend(
+                transaction_extractor.extract_records(
+                    merchant=merchant, emails_data=merchant_emails
+                )
+            )
+    return records
+
+
+def run_backfill(
+    gmail_client: Gmail,
+    transaction_extractor: TransactionExtractor,
+    store: TransactionStore,
+    card,
+    date_interval: List[datetime],
+    window: str = "week",
+    connections: int = 4,
+    checkpoint_path: str | None = None,
+) -> int:
+    """
+    Fetch a long date range window by window over several IMAP connections
+
+    Every window is fetched on its own connection, its transactions are
+    recorded in the store and the window is checkpointed. Rerunning the same
+    backfill skips the checkpointed windows.
+
+    Args:
+        gmail_client: The Gmail client
+        transaction_extractor: The transaction extractor
+        store: The local transaction store
+        card: The credit card configuration (see cards/_template.py)
+        date_interval (List[datetime]): List containing [from_date, to_date]
+        window (str): Window size, "day" or "week" (default: "week")
+        connections (int): Number of concurrent IMAP connections (default: 4)
+        checkpoint_path (str, optional): Checkpoint file (default: .backfill_<card env name>.json)
+
+    Returns:
+        int: Number of new transactions recorded
+    """
+    checkpoint = BackfillCheckpoint(
+        checkpoint_path or f".backfill_{card.LAST_RUN_TIME_ENV_NAME}.json"
+    )
+    windows = [
+        w
+        for w in split_windows(date_interval[0], date_interval[1], window)
+        if not checkpoint.is_done(w)
+    ]
+    print(f"Backfilling {len(windows)} {window} windows for {card.NICKNAME}")
+
+    added = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        futures = {
+            pool.submit(
+                fetch_window, gmail_client, transaction_extractor, card.MERCHANTS, w
+            ): w
+            for w in windows
+        }
+        for future in as_completed(futures):
+            w = futures[future]
+            label = f"{w[0]:%Y-%m-%d} to {w[1]:%Y-%m-%d}"
+            try:
+                records = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Failed to fetch {label}, it will be retried next run: {e}")
+                continue
+
+            # Record before checkpointing so a completed window is never lost
+            added += record_transactions(store, records, card)
+            checkpoint.mark_done(w)
+            print(f"Backfilled {label}")
+
+    if failed:
+        print(f"{failed} windows failed, rerun the same backfill to resume")
+
+    return added
@@ -0,0 +1,280 @@
+"""
+HTTP service extracting transactions from bank and merchant notification emails.
+
+Other tools post raw emails and get the `TransactionData` of each back as
+JSON, without importing the extractors. Extraction runs in a pool of worker
+processes started and warmed (every extractor constructed) before the first
+request. The service keeps no state between requests, so instances can be
+added behind a load balancer.
+
+Endpoints:
+    POST /extract: One email, as a raw RFC822 message (Content-Type
+        message/rfc822) or a JSON email object, or a batch as
+        {"emails": [email objects]}
+    GET /health: Worker count
+
+Email objects are {"raw": "<RFC822 message>"}, {"raw_base64": "..."} or
+{"body": "...", "subject": "...", "from": "..."}. The extractor is chosen by
+sender and subject, or named with "merchant". Every result is
+{"extractor": ..., "card_number": ..., "amount": ..., "merchant": ...,
+"category": ...}, or {"extractor": ..., "error": "..."}; a batch returns
+{"results": [...]} in the order of its emails.
+
+Usage:
+    uv run python -m utils.extraction_service [--port 8766] [--workers N]
+"""
+
+import argparse
+import base64
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Union
+
+from utils.metrics import metrics
+
+# Requests above this many bytes are rejected with 413
+DEFAULT_MAX_REQUEST_BYTES = 10 * 1024 * 1024
+
+_worker_extractor = None
+
+
+def _init_worker(route_stats_path: Union[str, None] = None) -> None:
+    """Construct the extractor and every registered extractor of a worker process"""
+    global _worker_extractor
+    from utils.extractors import EXTRACTOR_REGISTRY, TransactionExtractor
+    from utils.extractors.route_stats import route_stats
+
+    _worker_extractor = TransactionExtractor()
+    # Workers only read the learned route order, the service keeps no state
+    if route_stats_path:
+        route_stats.load(route_stats_path)
+    for merchant in EXTRACTOR_REGISTRY:
+        EXTRACTOR_REGISTRY[merchant]
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+def extract_email(item: Union[Dict, bytes]) -> Dict:
+    """
+    Extract the transaction of an email object inside a worker process
+
+    Args:
+        item (Dict | bytes): The email object, see the module documentation,
+            or a raw RFC822 message
+
+    Returns:
+        Dict: The result, see the module documentation
+    """
+    from utils.extractors import TIMED_OUT, TransactionExtractor, get_merchant_for_email
+    from utils.gmail import parse_email
+
+    extractor = _worker_extractor or TransactionExtractor()
+    merchant = item.get("merchant") if isinstance(item, dict) else None
+    try:
+        if isinstance(item, bytes):
+            raw_email = item
+        elif not isinstance(item, dict):
+            raise ValueError("An email must be a JSON object")
+        elif "raw_base64" in item:
+            raw_email = base64.b64decode(item["raw_base64"])
+        elif "raw" in item:
+            raw_email = item["raw"].encode("utf-8", errors="replace")
+        else:
+            raw_email = None
+
+        if raw_email is not None:
+            email_data = parse_email(raw_email)
+            body, subject, sender = (
+                email_data["body"],
+                email_data["subject"],
+                email_data["from"],
+            )
+        elif "body" in item:
+            body, subject, sender = item["body"], item.get("subject"), item.get("from")
+        else:
+            raise ValueError('An email needs "raw", "raw_base64" or "body"')
+
+        merchant = merchant or get_merchant_for_email(sender, subject)
+        if not merchant:
+            return {"extractor": None, "error": f"No extractor for sender {sender}"}
+        result = extractor.extract_from_email(merchant, body, subject)
+        if result is TIMED_OUT:
+            return {"extractor": merchant, "error": "Extraction timed out"}
+        return {"extractor": merchant, **asdict(result)}
+    except Exception as e:
+        return {"extractor": merchant, "error": f"{type(e).__name__}: {e}"}
+
+
+class ExtractionService:
+    """A warm pool of extraction processes, served over HTTP by make_server"""
+
+    def __init__(
+        self,
+        workers: Union[int, None] = None,
+        max_request_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+        route_stats_path: Union[str, None] = None,
+    ):
+        """
+        Args:
+            workers (int, optional): Worker processes (default: one per CPU)
+            max_request_bytes (int): Largest accepted request body
+                (default: DEFAULT_MAX_REQUEST_BYTES)
+            route_stats_path (str, optional): Route statistics the workers
+                order the extractor routes with, see route_stats
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_request_bytes = max_request_bytes
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(route_stats_path,),
+        )
+        # Start every worker now, rather than on the first requests
+        for future in [self.pool.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def extract(self, items: List[Union[Dict, bytes]]) -> List[Dict]:
+        """
+        Extract a batch of emails across the worker processes
+
+        Args:
+            items: The email objects or raw RFC822 messages
+
+        Returns:
+            List[Dict]: One result per email, in order
+        """
+        chunksize = max(1, len(items) // (self.workers * 4))
+        return list(self.pool.map(extract_email, items, chunksize=chunksize))
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def make_server(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Create the HTTP server of the service, started by the caller
+
+        Args:
+            port (int): Port to listen on, 0 for any free port
+            host (str): Address to listen on (default: 127.0.0.1)
+
+        Returns:
+            ThreadingHTTPServer: The server
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive connections for clients sending many requests; the
+            # headers and the body are separate writes, which Nagle's
+            # algorithm would hold back until the client's delayed ACK
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = self.headers.get("Content-Length")
+                if self.path.rstrip("/") != "/extract":
+                    # The body is left unread
+                    self.close_connection = True
+                    return self._send(404, {"error": "Not found"})
+                if length is None or not length.isdigit():
+                    self.close_connection = True
+                    return self._send(411, {"error": "Content-Length required"})
+                if int(length) > service.max_request_bytes:
+                    self.close_connection = True
+                    return self._send(
+                        413, {"error": f"Requests are limited to {service.max_request_bytes} bytes"}
+                    )
+                content = self.rfile.read(int(length))
+
+                content_type = self.headers.get_content_type()
+                if content_type == "message/rfc822":
+                    items, batch = [content], False
+                elif content_type == "application/json":
+                    try:
+                        request = json.loads(content)
+                    except ValueError as e:
+                        return self._send(400, {"error": f"Invalid JSON: {e}"})
+                    batch = isinstance(request, dict) and "emails" in request
+                    items = request["emails"] if batch else [request]
+                    if not isinstance(items, list):
+                        return self._send(400, {"error": '"emails" must be a list'})
+                else:
+                    return self._send(
+                        415, {"error": "Use application/json or message/rfc822"}
+                    )
+
+                with metrics.span("extraction_service.request"):
+                    results = service.extract(items)
+                metrics.incr("extraction_service.emails", len(items))
+                self._send(200, {"results": results} if batch else results[0])
+
+            def do_GET(self):
+                if self.path.rstrip("/") != "/health":
+                    return self._send(404, {"error": "Not found"})
+                self._send(200, {"status": "ok", "workers": service.workers})
+
+            def _send(self, code: int, body: Dict) -> None:
+                metrics.incr("extraction_service.responses", status=str(code))
+                content = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    from utils import load_env
+
+    load_env()
+    parser = argparse.ArgumentParser(description="Transaction extraction HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: one per CPU)"
+    )
+    parser.add_argument(
+        "--max-request-bytes",
+        type=int,
+        default=int(
+            os.getenv("EXTRACTION_SERVICE_MAX_BYTES") or DEFAULT_MAX_REQUEST_BYTES
+        ),
+        help="largest accepted request body (default: EXTRACTION_SERVICE_MAX_BYTES or 10 MiB)",
+    )
+    args = parser.parse_args()
+
+    with ExtractionService(
+        args.workers,
+        args.max_request_bytes,
+        route_stats_path=os.getenv("ROUTE_STATS_PATH", "route_stats.json") or None,
+    ) as service:
+        server = service.make_server(args.port, args.host)
+        print(
+            f"Extracting on http://{args.host}:{server.server_address[1]}/extract "
+            f"with {service.workers} workers"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Stopped")
+        finally:
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
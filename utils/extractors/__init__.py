@@ -1,24 +1,40 @@
-import pandas as pd
+import os
+import time
+from email.utils import parseaddr
+from typing import TYPE_CHECKING
 
-from utils.extractors.base import TransactionData
+from utils.extractors.base import ExtractionTimeout, TransactionData, time_budget
+from utils.extractors.cache import ExtractionCache
+from utils.extractors.registry import ENTRY_POINT_GROUP, ExtractorRegistry
+from utils.extractors.route_stats import route_stats
+from utils.metrics import metrics
+from utils.profiling import profiler
+from utils.records import TransactionRecord, to_dataframe
 
-from .foodpanda import FoodpandaEmailExtractor
-from .grab import GrabEmailExtractor
-from .greengsm import GreenGSMEmailExtractor
-from .metrobank import MetrobankEmailExtractor
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Seconds an email may take to extract, see TransactionExtractor
+DEFAULT_TIME_BUDGET = 2.0
+
+# Budget of the one retry of a timed out email, as a multiple of the time budget
+RETRY_BUDGET_FACTOR = 4.0
+
+# Result of emails skipped for running past the time budget
+TIMED_OUT = TransactionData()
 
 # Registry of available extractors
+# Merchants, their sender addresses and their extractor classes are listed in
+# manifest.json, and installed packages can add more through the
+# "cc_transaction_logger.extractors" entry point group. Extractor modules are
+# only imported when a run routes an email to them.
 # To add a new extractor:
 # 1. Create a new extractor class (see _template_extractor.py for reference)
-# 2. Import it here
-# 3. Add it to this registry
-EXTRACTOR_REGISTRY = {
-    "Grab": GrabEmailExtractor(),
-    "Metrobank": MetrobankEmailExtractor(),
-    "Foodpanda": FoodpandaEmailExtractor(),
-    "GreenGSM": GreenGSMEmailExtractor(),
-    # "YourNewMerchant": YourNewMerchantExtractor(),
-}
+# 2. Add its merchant name, sender and "module:Class" path to manifest.json
+EXTRACTOR_REGISTRY = ExtractorRegistry.from_manifest(
+    os.path.join(os.path.dirname(__file__), "manifest.json"),
+    entry_point_group=ENTRY_POINT_GROUP,
+)
 
 
 def get_extractor_for_merchant(merchant: str):
@@ -29,14 +45,156 @@ def get_extractor_for_merchant(merchant: str):
     return extractor
 
 
+def get_merchant_for_sender(sender: str | None) -> str | None:
+    """
+    Get the merchant whose extractor handles emails from a sender
+
+    Args:
+        sender (str): The From header or address of the email
+
+    Returns:
+        str | None: The merchant name or None if no extractor handles the sender
+    """
+    address = parseaddr(sender or "")[1].lower()
+    if not address:
+        return None
+    return EXTRACTOR_REGISTRY.merchant_for_sender(address)
+
+
+def get_merchant_for_email(sender: str | None, subject: str | None) -> str | None:
+    """
+    Get the merchant whose extractor handles an email, by sender then subject
+
+    Args:
+        sender (str): The From header or address of the email
+        subject (str): The subject of the email
+
+    Returns:
+        str | None: The merchant name or None if no extractor handles the email
+    """
+    address = parseaddr(sender or "")[1].lower()
+    if not address:
+        return None
+    return EXTRACTOR_REGISTRY.merchant_for_email(address, subject)
+
+
+def group_merchants_by_sender(merchants: list[str]) -> dict[str, list[str]]:
+    """
+    Group merchants by the address their emails come from
+
+    Merchants sharing a sender (e.g. a payment processor) are in one group,
+    so their emails are fetched once and split with route_emails.
+
+    Args:
+        merchants (list[str]): Merchant names
+
+    Returns:
+        dict[str, list[str]]: The merchants of each lowercase sender address
+    """
+    return EXTRACTOR_REGISTRY.group_by_sender(merchants)
+
+
+def search_subjects(merchants: list[str]) -> tuple[list[str], list[str]]:
+    """
+    Subject filter of the Gmail search of merchants sharing a sender
+
+    Args:
+        merchants (list[str]): Merchant names
+
+    Returns:
+        tuple[list[str], list[str]]: Subject phrases to search, empty to search
+            every email, and subjects to exclude
+    """
+    extractors = [get_extractor_for_merchant(merchant) for merchant in merchants]
+    subjects = [extractor.subject_filter() for extractor in extractors]
+    included = []
+    # A merchant reading every email of the sender needs them all
+    if all(subjects):
+        included = list(dict.fromkeys(phrase for phrases in subjects for phrase in phrases))
+
+    # Only subjects no merchant of the sender reads are excluded
+    excluded = set(extractors[0].excluded_subjects) if extractors else set()
+    for extractor in extractors[1:]:
+        excluded &= set(extractor.excluded_subjects)
+    return included, sorted(excluded)
+
+
+def route_emails(
+    sender: str, emails_data: list[dict], merchants: list[str]
+) -> dict[str, list[dict]]:
+    """
+    Dispatch the emails fetched from a sender to the merchants handling them
+
+    Args:
+        sender (str): Lowercase address the emails were fetched from
+        emails_data (list[dict]): Emails with a 'subject' key
+        merchants (list[str]): Merchants to keep, emails routed to other
+            merchants are dropped
+
+    Returns:
+        dict[str, list[dict]]: The emails of each merchant, in fetch order;
+            every email is in at most one list
+    """
+    routed = {merchant: [] for merchant in merchants}
+    for email_data in emails_data:
+        merchant = EXTRACTOR_REGISTRY.merchant_for_email(
+            sender, email_data.get("subject")
+        )
+        if merchant in routed:
+            routed[merchant].append(email_data)
+    return routed
+
+
 class TransactionExtractor:
     """
     Pure transaction extraction class that handles only the extraction logic
     without any email fetching functionality.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        cache_size: int = 1024,
+        cache_path: str | None = None,
+        time_budget: float | None = None,
+        route_stats_path: str | None = None,
+        retry_budget: float | None = None,
+    ):
+        """
+        Args:
+            cache_size (int): Number of extraction results memoized in memory,
+                0 disables the cache (default: 1024)
+            cache_path (str, optional): SQLite file persisting memoized results
+                between runs
+            time_budget (float, optional): Seconds an email may take to extract
+                before it is skipped, 0 for no limit (default: the
+                EXTRACTION_TIME_BUDGET environment variable or 2)
+            route_stats_path (str, optional): JSON file the route hit statistics
+                are loaded from and saved to on close, so the route order
+                learned by one run is used by the next (see route_stats)
+            retry_budget (float, optional): Seconds of the one retry of an
+                email that ran past the time budget, before it is skipped
+                (default: the EXTRACTION_RETRY_BUDGET environment variable or
+                RETRY_BUDGET_FACTOR times the time budget)
+        """
         self.extractors = EXTRACTOR_REGISTRY
+        if time_budget is None:
+            time_budget = float(
+                os.getenv("EXTRACTION_TIME_BUDGET") or DEFAULT_TIME_BUDGET
+            )
+        self.time_budget = time_budget
+        if retry_budget is None:
+            retry_budget = float(
+                os.getenv("EXTRACTION_RETRY_BUDGET") or time_budget * RETRY_BUDGET_FACTOR
+            )
+        self.retry_budget = retry_budget
+        self.route_stats_path = route_stats_path
+        if route_stats_path:
+            route_stats.load(route_stats_path)
+        self.cache = (
+            ExtractionCache(max_entries=cache_size, path=cache_path)
+            if cache_size or cache_path
+            else None
+        )
 
     def extract_from_email(
         self, merchant: str, email_body: str, email_subject: str | None = None
@@ -45,13 +203,85 @@ class TransactionExtractor:
         extractor = self.extractors.get(merchant)
         if not extractor:
             raise ValueError(f"No extractor for merchant: {merchant}")
-        return extractor.extract_payment_info(email_body, email_subject)
+        if self.cache is None:
+            return self._extract_within_budget(
+                merchant, extractor, email_body, email_subject
+            )
+
+        # Unchanged emails of an unchanged extractor are only hashed
+        key = ExtractionCache.key(extractor, email_body, email_subject)
+        result = self.cache.get(key)
+        metrics.incr("extractor.cache", result="miss" if result is None else "hit")
+        if result is None:
+            result = self._extract_within_budget(
+                merchant, extractor, email_body, email_subject
+            )
+            # A timed out email may extract on a less busy run, e.g. a backfill
+            if result is not TIMED_OUT:
+                self.cache.put(key, result)
+        return result
+
+    def _extract_within_budget(
+        self, merchant: str, extractor, email_body: str, email_subject: str | None
+    ) -> TransactionData:
+        """Extract an email, retrying it once with the retry budget if it runs
+        past the time budget, then skipping it"""
+        budgets = [self.time_budget]
+        if self.time_budget and self.retry_budget > self.time_budget:
+            budgets.append(self.retry_budget)
+        for attempt, budget in enumerate(budgets, start=1):
+            try:
+                with time_budget(budget):
+                    return extractor.extract_payment_info(email_body, email_subject)
+            except ExtractionTimeout as e:
+                metrics.incr(
+                    "extractor.timeouts", merchant=merchant, route=e.route, attempt=attempt
+                )
+                error = e
+        print(f"Skipped a {merchant} email: {error}")
+        return TIMED_OUT
+
+    def flush(self) -> None:
+        """Write pending results of the persistent extraction cache and the route statistics"""
+        if self.cache is not None:
+            self.cache.commit()
+        if self.route_stats_path:
+            route_stats.save(self.route_stats_path)
+
+    def close(self) -> None:
+        """Flush and close the persistent extraction cache"""
+        self.flush()
+        if self.cache is not None:
+            self.cache.close()
+
+    def extract_records(
+        self, merchant: str, emails_data: list[dict]
+    ) -> list[TransactionRecord]:
+        """
+        Extract the transactions of a list of emails
+
+        Args:
+            merchant (str): The merchant name for selecting the right extractor
+            emails_data (list[dict]): List of dictionaries containing email data
+                                     with 'body', 'subject', 'date' keys
+
+        Returns:
+            list[TransactionRecord]: The valid transactions, in email order
+        """
+        records = []
+        for email_data in emails_data:
+            record = self.extract_transaction(merchant, email_data)
+
+            # Only add valid transaction data
+            if record:
+                records.append(record)
+        return records
 
     def process_email_data(
         self, merchant: str, emails_data: list[dict]
-    ) -> pd.DataFrame | None:
+    ) -> "pd.DataFrame | None":
         """
-        Process a list of email data and extract transactions
+        Process a list of email data and extract transactions into a DataFrame
 
         Args:
             merchant (str): The merchant name for selecting the right extractor
@@ -61,36 +291,55 @@ class TransactionExtractor:
         Returns:
             pd.DataFrame | None: DataFrame with extracted transactions or None if no valid transactions
         """
-        if not emails_data:
-            return None
+        records = self.extract_records(merchant, emails_data or [])
+        return to_dataframe(records) if records else None
 
-        # Create a list to store transaction data
-        transaction_data_list = []
+    def extract_transaction(
+        self, merchant: str, email_data: dict
+    ) -> TransactionRecord | None:
+        """
+        Extract the transaction of a single email
 
-        # Process each email
-        for email_data in emails_data:
-            # Extract transaction data from the email content
+        Sets email_data["card_number"] to the card the transaction was paid
+        with, None when the email has no transaction, so the runs of a card
+        only label its own emails (see pipeline.processed_uids).
+
+        Args:
+            merchant (str): The merchant name for selecting the right extractor
+            email_data (dict): Email data with 'body', 'subject', 'date' keys
+
+        Returns:
+            TransactionRecord | None: The transaction or None if the email has no valid transaction
+        """
+        # Extract transaction data from the email content
+        start = time.perf_counter()
+        with metrics.span("extractor.extract", merchant=merchant):
             transaction_data = self.extract_from_email(
                 merchant=merchant,
                 email_body=email_data["body"],
                 email_subject=email_data.get("subject"),
             )
+        if profiler.slowest:
+            profiler.record_email(merchant, email_data, time.perf_counter() - start)
+        if transaction_data is TIMED_OUT:
+            # Not labeled, the run records it in the store instead (see
+            # pipeline.quarantine_timed_out)
+            email_data["timed_out"] = True
+        email_data["card_number"] = transaction_data.card_number
 
-            # Only add valid transaction data
-            if transaction_data.card_number:
-                # Convert TransactionData to dict for DataFrame
-                transaction_dict = {
-                    "date": email_data["date"],
-                    "subject": email_data.get("subject", ""),
-                    "card_number": transaction_data.card_number,
-                    "total_paid_amount": transaction_data.amount,
-                    "merchant": transaction_data.merchant,
-                    "category": transaction_data.category,
-                }
-                transaction_data_list.append(transaction_dict)
-
-        # Create DataFrame from the list of transaction data
-        if transaction_data_list:
-            return pd.DataFrame(transaction_data_list)
+        if not transaction_data.card_number:
+            metrics.incr("extractor.emails", merchant=merchant, result="skipped")
+            return None
+        metrics.incr("extractor.emails", merchant=merchant, result="extracted")
 
-        return None
+        return TransactionRecord(
+            message_id=email_data.get("message_id"),
+            date=email_data["date"],
+            subject=email_data.get("subject", ""),
+            card_number=transaction_data.card_number,
+            total_paid_amount=transaction_data.amount,
+            merchant=transaction_data.merchant,
+            category=transaction_data.category,
+            source=merchant,
+            sender=email_data.get("from"),
+        )
@@ -13,7 +13,7 @@ class TemplateExtractor(BaseEmailExtractor):
     3. Update the merchant_email parameter in __init__
     4. Implement your specific extraction methods
     5. Register your extraction methods in register_extractors()
-    6. Add your extractor to the EXTRACTOR_REGISTRY in __init__.py
+    6. Add your merchant, sender and "module:Class" path to manifest.json
     """
 
     def __init__(self, merchant_email: str = "example@merchant.com"):
@@ -39,6 +39,17 @@ class TemplateExtractor(BaseEmailExtractor):
             # Add more HTML extractors as needed
         }
 
+        # Optional: raw HTML texts inside the tables a route reads, so only
+        # those tables are parsed for it (the whole email is the fallback)
+        self.html_scopes = {
+            "OrderConfirmation": ("Order Total", "Paid with"),
+        }
+
+        # Optional: subject phrases of the transaction emails, so Gmail leaves
+        # the others out of the search. By default the route names above are
+        # used as subjects; set () to fetch every email of the sender.
+        self.search_subjects = ("Your order", "Your receipt")
+
         # Register text extractors - add methods for different email types
         self.text_extractors = {
             "TransactionReceipt": self._extract_transaction_receipt_text,
@@ -1,8 +1,77 @@
+import contextvars
+import hashlib
+import itertools
+import re
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Callable, Dict, Optional
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
 
-from bs4 import BeautifulSoup
+from utils.extractors.route_stats import route_stats
+from utils.metrics import metrics
+from utils.profiling import profiler
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# Parts of an HTML email no extractor reads: the head (with its styles and
+# metadata), styles and scripts in the body, and comments (including the
+# conditional comments of Outlook)
+BOILERPLATE_PATTERN = re.compile(
+    r"<head\b.*?</head\s*>|<style\b.*?</style\s*>|<script\b.*?</script\s*>|<!--.*?-->",
+    re.IGNORECASE | re.DOTALL,
+)
+TABLE_TAG_PATTERN = re.compile(r"<(/?)table\b[^>]*>", re.IGNORECASE)
+TAG_NAME_PATTERN = re.compile(r"<([a-zA-Z][a-zA-Z0-9]*)")
+
+# Layouts remembered per extractor, see BaseEmailExtractor.template_plans
+MAX_TEMPLATE_PLANS = 256
+
+# (deadline, budget) of the email extracted in the current thread, see time_budget
+_deadline: contextvars.ContextVar = contextvars.ContextVar(
+    "extraction_deadline", default=None
+)
+
+
+class ExtractionTimeout(Exception):
+    """The extraction of an email ran past its time budget"""
+
+    def __init__(self, extractor: str, route: str, elapsed: float, budget: float):
+        super().__init__(
+            f"{extractor} route {route!r} ran past the {budget:.3f}s extraction "
+            f"budget ({elapsed:.3f}s elapsed)"
+        )
+        self.extractor = extractor
+        self.route = route
+        self.elapsed = elapsed
+        self.budget = budget
+
+
+@contextmanager
+def time_budget(seconds: float | None):
+    """
+    Limit the time extracting an email may take
+
+    The budget is checked after trimming, after parsing and after every route,
+    so a run stops at the first step that ends past the deadline and raises
+    ExtractionTimeout naming that step. A step is never interrupted while it
+    runs: the patterns it uses must stay linear, see
+    test_data/regex_audit.py.
+
+    Args:
+        seconds (float | None): The budget, None or 0 for no limit
+    """
+    if not seconds:
+        yield
+        return
+    token = _deadline.set((time.perf_counter() + seconds, seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
 
 
 @dataclass
@@ -26,6 +95,23 @@ class BaseEmailExtractor(ABC):
         # Subclasses should override these dictionaries with their specific methods
         self.html_extractors: Dict[str, Callable] = {}
         self.text_extractors: Dict[str, Callable] = {}
+        # Optional per HTML route: texts found in the raw HTML of the tables
+        # the route reads. Only those tables are parsed for the route, see
+        # scope_html. Routes without a scope get the whole email.
+        self.html_scopes: Dict[str, Tuple[str, ...]] = {}
+        # Route that extracted each HTML layout seen so far, keyed by
+        # template_fingerprint, and whether it did so on its scoped tables.
+        # Least recently used layouts are evicted first; the lock guards them
+        # from the extraction threads of the staged pipeline
+        self.template_plans: "OrderedDict[str, Tuple[str, bool]]" = OrderedDict()
+        self.template_plans_lock = threading.Lock()
+        # Phrases the subjects of the transaction emails contain, searched by
+        # Gmail so other emails are never downloaded. None derives them from
+        # the route names, which name subjects (see _route_order); an empty
+        # tuple searches every email of the sender.
+        self.search_subjects: Tuple[str, ...] | None = None
+        # Subjects of emails never holding a transaction, excluded from the search
+        self.excluded_subjects: Tuple[str, ...] = ()
 
     def extract_payment_info(
         self, content: str, subject: str | None = None
@@ -45,15 +131,17 @@ class BaseEmailExtractor(ABC):
             or "<body" in content.lower()
             or "<div" in content.lower()
         ):
-            # Parse HTML content
-            soup = BeautifulSoup(content, "html.parser")
-            return self.extract_from_html(soup, subject)
+            html = trim_html(content)
+            self._check_budget("trim")
+            result = self._extract_from_html_source(html, subject)
         else:
             # Process as plain text
-            return self.extract_from_text(content, subject)
+            result = self.extract_from_text(content, subject)
+        route_stats.record_email(type(self).__name__, subject)
+        return result
 
     def extract_from_html(
-        self, soup: BeautifulSoup, subject: str | None = None
+        self, soup: "BeautifulSoup", subject: str | None = None
     ) -> TransactionData:
         """
         Extracts transaction details from HTML emails.
@@ -65,20 +153,129 @@ class BaseEmailExtractor(ABC):
         Returns:
             TransactionData: Object containing transaction information
         """
-        # First try if we have a specific extractor for this subject
-        if subject and subject in self.html_extractors:
-            result = self.html_extractors[subject](soup, subject)
-            if result and result.card_number:
-                return result
+        return self._search_soup(soup, subject)[1]
 
-        # If not, try all registered extractors
-        for extractor_name, extractor_method in self.html_extractors.items():
-            result = extractor_method(soup, subject)
-            if result and result.card_number:
+    def _extract_from_html_source(
+        self, html: str, subject: str | None = None
+    ) -> TransactionData:
+        """
+        Extract from HTML, following the plan of its layout when it is known
+
+        Merchants send a handful of templates, so the route that extracted
+        an email is remembered for its layout (see template_fingerprint) and
+        tried alone on the next emails with that layout. The search of every
+        route only runs for new layouts and when a plan stops matching; it
+        tries the scoped routes on their tables first (see html_scopes) and
+        parses the whole email, once, if none of them finds a card number
+        and an amount there.
+
+        Args:
+            html: The trimmed email HTML, see trim_html
+            subject: The subject of the email
+        Returns:
+            TransactionData: Object containing transaction information
+        """
+        fingerprint = template_fingerprint(html)
+        soup = None
+        with self.template_plans_lock:
+            plan = self.template_plans.get(fingerprint)
+            if plan is not None:
+                self.template_plans.move_to_end(fingerprint)
+        if plan is not None:
+            route, scoped = plan
+            if scoped:
+                result = self._try_scoped_route(route, html, subject)
+            else:
+                soup = self._parse_html(html, scope="full")
+                result = self._try_route(
+                    route, self.html_extractors[route], soup, subject
+                )
+            if metrics.enabled:
+                metrics.incr(
+                    "extractor.plan",
+                    extractor=type(self).__name__,
+                    result="hit" if result else "miss",
+                )
+            if result:
                 return result
+            # The layout is shared with emails the route does not handle
+            with self.template_plans_lock:
+                self.template_plans.pop(fingerprint, None)
+
+        route, scoped, result = self._search_routes(html, subject, soup)
+        if route is not None:
+            with self.template_plans_lock:
+                self.template_plans[fingerprint] = (route, scoped)
+                self.template_plans.move_to_end(fingerprint)
+                while len(self.template_plans) > MAX_TEMPLATE_PLANS:
+                    self.template_plans.popitem(last=False)
+        return result
+
+    def _search_routes(
+        self, html: str, subject: str | None, soup: "BeautifulSoup | None" = None
+    ) -> Tuple[str | None, bool, TransactionData]:
+        """
+        Try every route on an email, the scoped ones on their tables first
+
+        Args:
+            html: The trimmed email HTML
+            subject: The subject of the email
+            soup: The whole email if it is already parsed
+        Returns:
+            Tuple: The route that found a card number (None if none did),
+                whether it did on its tables, and the result
+        """
+        for extractor_name in self._route_order(self.html_extractors, subject):
+            result = self._try_scoped_route(extractor_name, html, subject)
+            if result:
+                return extractor_name, True, result
+
+        if soup is None:
+            soup = self._parse_html(html, scope="full")
+
+        route, result = self._search_soup(soup, subject)
+        return route, False, result
+
+    def _search_soup(
+        self, soup: "BeautifulSoup", subject: str | None
+    ) -> Tuple[str | None, TransactionData]:
+        """Try every route on a parsed email, returning the first one that hits"""
+        for extractor_name in self._route_order(self.html_extractors, subject):
+            result = self._try_route(
+                extractor_name, self.html_extractors[extractor_name], soup, subject
+            )
+            if result:
+                return extractor_name, result
 
         # If no extractor succeeds, return empty result
-        return TransactionData()
+        return None, TransactionData()
+
+    def _try_scoped_route(
+        self, route: str, html: str, subject: str | None
+    ) -> TransactionData | None:
+        """Run a route on its tables alone, None if it has no scope or misses"""
+        anchors = self.html_scopes.get(route)
+        fragment = scope_html(html, anchors) if anchors else None
+        if fragment is None:
+            return None
+        return self._try_route(
+            route,
+            self.html_extractors[route],
+            self._parse_html(fragment, scope="tables"),
+            subject,
+            scoped=True,
+        )
+
+    def _parse_html(self, html: str, scope: str) -> "BeautifulSoup":
+        from bs4 import BeautifulSoup
+
+        with metrics.span("extractor.parse", extractor=type(self).__name__, scope=scope):
+            soup = BeautifulSoup(html, "html.parser")
+        self._check_budget("parse")
+        metrics.incr(
+            "extractor.parsed_bytes", len(html), extractor=type(self).__name__, scope=scope
+        )
+        return soup
 
     def extract_from_text(
         self, text: str, subject: str | None = None
@@ -93,21 +290,100 @@ class BaseEmailExtractor(ABC):
         Returns:
             TransactionData: Object containing transaction information
         """
-        # First try if we have a specific extractor for this subject
-        if subject and subject in self.text_extractors:
-            result = self.text_extractors[subject](text, subject)
-            if result and result.card_number:
-                return result
-
-        # If not, try all registered extractors
-        for extractor_name, extractor_method in self.text_extractors.items():
-            result = extractor_method(text, subject)
-            if result and result.card_number:
+        for extractor_name in self._route_order(self.text_extractors, subject):
+            result = self._try_route(
+                extractor_name, self.text_extractors[extractor_name], text, subject
+            )
+            if result:
                 return result
 
         # If no extractor succeeds, return empty result
         return TransactionData()
 
+    def _try_route(
+        self,
+        route: str,
+        extractor_method: Callable,
+        content,
+        subject: str | None,
+        scoped: bool = False,
+    ) -> TransactionData | None:
+        """
+        Run a single extraction route, counting and profiling it
+
+        Args:
+            route: Name of the route in html_extractors or text_extractors
+            extractor_method: The extraction method of the route
+            content: BeautifulSoup object or plain text of the email
+            subject: The subject of the email
+            scoped: The content only holds the route's tables, the result then
+                also needs an amount and misses are counted as fallbacks
+        Returns:
+            TransactionData | None: The result if the route found a card number
+        """
+        with profiler.scope(f"route:{type(self).__name__}.{route}"):
+            result = extractor_method(content, subject)
+        self._check_budget(route)
+        hit = bool(result and result.card_number)
+        if scoped:
+            hit = hit and result.amount is not None
+            if metrics.enabled:
+                metrics.incr(
+                    "extractor.scoped",
+                    extractor=type(self).__name__,
+                    route=route,
+                    result="hit" if hit else "fallback",
+                )
+            if not hit:
+                # Retried on the whole email, where it is counted
+                return None
+        route_stats.record(type(self).__name__, subject, route, hit)
+        if metrics.enabled:
+            metrics.incr(
+                "extractor.route",
+                extractor=type(self).__name__,
+                route=route,
+                result="hit" if hit else "miss",
+            )
+        return result if hit else None
+
+    def _route_order(
+        self, extractors: Dict[str, Callable], subject: str | None
+    ) -> List[str]:
+        """
+        Route names in trial order
+
+        The route named after the subject comes first, then the others by
+        their observed hit rate for this subject (see route_stats).
+        """
+        others = route_stats.order(
+            type(self).__name__, subject, (name for name in extractors if name != subject)
+        )
+        if subject and subject in extractors:
+            return [subject] + others
+        return others
+
+    def subject_filter(self) -> Tuple[str, ...]:
+        """
+        Subject phrases of the emails to fetch for this extractor
+
+        Returns:
+            Tuple[str, ...]: The phrases, empty to fetch every email of the sender
+        """
+        if self.search_subjects is not None:
+            return tuple(self.search_subjects)
+        return subject_phrases([*self.html_extractors, *self.text_extractors])
+
+    def _check_budget(self, step: str) -> None:
+        """Raise ExtractionTimeout if the email is past its deadline after a step"""
+        deadline = _deadline.get()
+        if deadline is None:
+            return
+        end, budget = deadline
+        now = time.perf_counter()
+        if now > end:
+            raise ExtractionTimeout(type(self).__name__, step, budget + now - end, budget)
+
     @abstractmethod
     def register_extractors(self) -> None:
         """
@@ -116,3 +392,103 @@ class BaseEmailExtractor(ABC):
         and text_extractors dictionaries with their specific extraction methods.
         """
         pass
+
+
+def trim_html(html: str) -> str:
+    """
+    Remove the parts of an HTML email no extractor reads before parsing it
+
+    Args:
+        html: The email HTML
+    Returns:
+        str: The HTML without head, style, script and comments
+    """
+    return BOILERPLATE_PATTERN.sub("", html)
+
+
+def subject_phrases(subjects) -> Tuple[str, ...]:
+    """
+    Shortest phrases matching a list of subjects
+
+    Trailing punctuation is dropped, and a subject containing another one is
+    covered by it, e.g. "Card Transaction Notification" by "Transaction
+    Notification".
+
+    Args:
+        subjects: The subjects
+    Returns:
+        Tuple[str, ...]: The phrases, in first appearance order
+    """
+    phrases = list(dict.fromkeys(
+        subject.strip().rstrip(".!").replace('"', " ").strip() for subject in subjects
+    ))
+    return tuple(
+        phrase
+        for phrase in phrases
+        if phrase
+        and not any(
+            other != phrase and other.lower() in phrase.lower() for other in phrases if other
+        )
+    )
+
+
+def template_fingerprint(html: str) -> str:
+    """
+    Structural fingerprint of an HTML email, the same for emails of a template
+
+    The sequence of opening tag names is hashed, without attributes or text.
+    Consecutive identical table rows are counted once, so receipts listing a
+    different number of items keep the fingerprint of their template.
+
+    Args:
+        html: The email HTML
+    Returns:
+        str: Hex digest of the tag skeleton
+    """
+    skeleton = " ".join(TAG_NAME_PATTERN.findall(html)).lower()
+    rows = (row for row, _ in itertools.groupby(skeleton.split(" tr ")))
+    return hashlib.blake2b(
+        "\n".join(rows).encode(), digest_size=12
+    ).hexdigest()
+
+
+def scope_html(html: str, anchors: Tuple[str, ...]) -> str | None:
+    """
+    Cut out the innermost tables containing each anchor text
+
+    Args:
+        html: The email HTML
+        anchors: Texts to find in the raw HTML, e.g. a label or an attribute
+    Returns:
+        str | None: The tables in document order, or None if an anchor is
+            missing or outside any table
+    """
+    # Span of every complete table, nested ones included
+    tables: List[Tuple[int, int]] = []
+    open_tables: List[int] = []
+    for match in TABLE_TAG_PATTERN.finditer(html):
+        if not match.group(1):
+            open_tables.append(match.start())
+        elif open_tables:
+            tables.append((open_tables.pop(), match.end()))
+
+    spans = set()
+    for anchor in anchors:
+        position = html.find(anchor)
+        if position < 0:
+            return None
+        containing = [span for span in tables if span[0] <= position < span[1]]
+        if not containing:
+            return None
+        spans.add(max(containing))  # The innermost starts last
+
+    # Drop tables nested in another selected one
+    selected = [
+        span
+        for span in sorted(spans)
+        if not any(
+            other != span and other[0] <= span[0] and span[1] <= other[1]
+            for other in spans
+        )
+    ]
+    return "".join(html[start:end] for start, end in selected)
@@ -0,0 +1,207 @@
+import hashlib
+import inspect
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+
+from utils.extractors.base import BaseEmailExtractor, TransactionData
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    key TEXT PRIMARY KEY,
+    card_number TEXT,
+    amount REAL,
+    merchant TEXT,
+    category TEXT
+);
+"""
+
+# Commit the persistent tier every N new results instead of every result
+COMMIT_EVERY = 100
+
+_versions: Dict[int, Tuple[BaseEmailExtractor, str]] = {}
+_versions_lock = threading.Lock()
+
+
+def extractor_version(extractor: BaseEmailExtractor) -> str:
+    """
+    Get the code version of an extractor
+
+    The version hashes the source of the module of every class of the
+    extractor up to BaseEmailExtractor, so module-level code the classes use
+    (patterns, trim_html, scope_html) is covered too, and its plain
+    configuration attributes (such as the Foodpanda card number). Cached
+    results are invalidated whenever the extraction code or its
+    configuration changes.
+
+    Args:
+        extractor: The extractor instance
+
+    Returns:
+        str: A short hex digest
+    """
+    cached = _versions.get(id(extractor))
+    if cached is not None and cached[0] is extractor:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    modules = []
+    for cls in type(extractor).__mro__:
+        if cls is object or cls.__module__ == "abc":
+            continue
+        if cls.__module__ not in modules:
+            modules.append(cls.__module__)
+        digest.update(cls.__qualname__.encode())
+    for name in modules:
+        try:
+            digest.update(inspect.getsource(sys.modules[name]).encode())
+        except (KeyError, OSError, TypeError):
+            # No source available (e.g. frozen app): the class names remain
+            continue
+    for name, value in sorted(vars(extractor).items()):
+        if value is None or isinstance(value, (str, int, float, bool)):
+            digest.update(f"{name}={value!r}".encode())
+
+    version = digest.hexdigest()[:16]
+    with _versions_lock:
+        # Keep a reference so the id cannot be reused by another extractor
+        _versions[id(extractor)] = (extractor, version)
+    return version
+
+
+class ExtractionCache:
+    """
+    Memoized extraction results keyed by extractor version, subject and body.
+
+    Results are kept in an in-memory LRU and, if a path is given, in a
+    persistent SQLite tier shared between runs.
+    """
+
+    def __init__(self, max_entries: int = 1024, path: Union[str, None] = None):
+        """
+        Create an extraction cache
+
+        Args:
+            max_entries (int): Maximum number of results kept in memory (default: 1024)
+            path (str, optional): SQLite file of the persistent tier
+        """
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pending_writes = 0
+
+        self.connection = None
+        if path:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.executescript(SCHEMA)
+
+    @staticmethod
+    def key(
+        extractor: BaseEmailExtractor, email_body: str, email_subject: str | None
+    ) -> str:
+        """
+        Build the cache key of an email for an extractor
+
+        Args:
+            extractor: The extractor handling the email
+            email_body: The email content
+            email_subject: The subject of the email
+
+        Returns:
+            str: The cache key
+        """
+        body_digest = hashlib.sha256(email_body.encode("utf-8", "surrogatepass"))
+        body_digest.update(b"\0" + (email_subject or "").encode("utf-8", "surrogatepass"))
+        return (
+            f"{type(extractor).__name__}:{extractor_version(extractor)}:"
+            f"{body_digest.hexdigest()}"
+        )
+
+    def get(self, key: str) -> TransactionData | None:
+        """
+        Get a cached result
+
+        Args:
+            key (str): The cache key
+
+        Returns:
+            TransactionData | None: A copy of the cached result, None if not cached
+        """
+        with self.lock:
+            values = self.entries.get(key)
+            if values is not None:
+                self.entries.move_to_end(key)
+            elif self.connection is not None:
+                values = self.connection.execute(
+                    "SELECT card_number, amount, merchant, category "
+                    "FROM extraction_cache WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if values is not None:
+                    self._remember(key, values)
+
+            if values is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return TransactionData(*values)
+
+    def put(self, key: str, result: TransactionData) -> None:
+        """
+        Cache an extraction result
+
+        Args:
+            key (str): The cache key
+            result: The extraction result
+        """
+        values = result.to_tuple()
+        with self.lock:
+            self._remember(key, values)
+            if self.connection is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO extraction_cache VALUES (?, ?, ?, ?, ?)",
+                    (key, *values),
+                )
+                self.pending_writes += 1
+                if self.pending_writes >= COMMIT_EVERY:
+                    self.connection.commit()
+                    self.pending_writes = 0
+
+    def _remember(self, key: str, values: tuple) -> None:
+        self.entries[key] = values
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached result, including the persistent tier"""
+        with self.lock:
+            self.entries.clear()
+            if self.connection is not None:
+                self.connection.execute("DELETE FROM extraction_cache")
+                self.connection.commit()
+
+    def commit(self) -> None:
+        """Write pending results of the persistent tier"""
+        with self.lock:
+            if self.connection is not None:
+                self.connection.commit()
+                self.pending_writes = 0
+
+    def close(self) -> None:
+        """Write pending results of the persistent tier and close it"""
+        with self.lock:
+            if self.connection is not None:
+                self.connection.commit()
+                self.connection.close()
+                self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
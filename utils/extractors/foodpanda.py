@@ -2,11 +2,8 @@ import os
 import re
 
 from bs4 import BeautifulSoup
-from dotenv import load_dotenv
-
-load_dotenv()
-
 
+from utils import load_env
 from utils.extractors.base import BaseEmailExtractor, TransactionData
 
 
@@ -17,6 +14,7 @@ class FoodpandaEmailExtractor(BaseEmailExtractor):
         """
         super().__init__(merchant_email)
         ## Food panda does not provide card number in the email. So set the card number to what you use in payments
+        load_env()
         self.card_number = os.getenv("CARD_USED_FOR_FPND")
         self.merchant_category = "Food & Dining"
 
@@ -93,21 +91,11 @@ class FoodpandaEmailExtractor(BaseEmailExtractor):
             # If still not found, try a broader search in the entire email
             if not amount:
                 # Look for "Order Total" followed by price in the same line or nearby
-                # Handle new format where they might be on separate lines
-                matches = re.findall(
-                    r"Order\s+Total\s*[\s\n]*₱\s*([0-9,.]+)", str(soup), re.DOTALL
-                )
+                # (\s also matches newlines, so separate lines are covered too)
+                matches = re.findall(r"Order\s+Total\s*₱\s*([0-9,.]+)", str(soup))
                 if matches:
                     # Use the last match if multiple are found (usually the correct one)
                     amount = float(matches[-1].replace(",", ""))
-                else:
-                    # Try alternate pattern where Order Total and amount are on separate lines
-                    # Look for "Order Total" followed by "₱" and then the amount
-                    order_total_pattern = re.search(
-                        r"Order\s+Total[\s\n]*₱[\s\n]*([0-9,.]+)", str(soup), re.DOTALL
-                    )
-                    if order_total_pattern:
-                        amount = float(order_total_pattern.group(1).replace(",", ""))
 
             # Extract restaurant name (merchant)
             restaurant = None
@@ -120,7 +108,7 @@ class FoodpandaEmailExtractor(BaseEmailExtractor):
             )
             if restaurant_text:
                 restaurant_match = re.search(
-                    r"from\s+(.+?)\s+will be on its way", str(restaurant_text)
+                    r"from\s+(\S.{0,200}?)\s+will be on its way", str(restaurant_text)
                 )
                 if restaurant_match:
                     restaurant = restaurant_match.group(1)
@@ -128,7 +116,9 @@ class FoodpandaEmailExtractor(BaseEmailExtractor):
             # If not found, try new pattern: "Your order from [Restaurant] has been placed"
             if not restaurant:
                 restaurant_pattern = re.search(
-                    r"Your order from\s+(.+?)\s+has been placed", str(soup), re.DOTALL
+                    r"Your order from\s+(\S.{0,200}?)\s+has been placed",
+                    str(soup),
+                    re.DOTALL,
                 )
                 if restaurant_pattern:
                     restaurant = restaurant_pattern.group(1).strip()
@@ -17,6 +17,14 @@ class GrabEmailExtractor(BaseEmailExtractor):
             "GrabRide": self._extract_grabride,
             # Add more extractors as needed
         }
+        # Tables holding the card and the total of each route
+        self.html_scopes = {
+            "GrabFood": ("TOTAL (INCL. TAX)", "font-weight:bold; color:#000000;"),
+            "GrabRide": ('alt="MasterCard"', "Total Paid"),
+        }
+
+        # Routes are named after the service, every receipt has this subject
+        self.search_subjects = ("Your Grab E-Receipt",)
 
         # Currently no text extractors for Grab
         self.text_extractors = {}
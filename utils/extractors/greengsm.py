@@ -20,6 +20,13 @@ class GreenGSMEmailExtractor(BaseEmailExtractor):
         self.html_extractors = {
             "RECEIPT FOR YOUR PAYMENT TO GREEN AND SMART MOBILITY PHILIPPINES INC.": self._extract_payment_html,
         }
+        # The receipt table has the payment sentence and the card
+        self.html_scopes = {
+            "RECEIPT FOR YOUR PAYMENT TO GREEN AND SMART MOBILITY PHILIPPINES INC.": (
+                "PHP to",
+                "Paid via:",
+            ),
+        }
 
     def _extract_payment_html(
         self, soup: BeautifulSoup, subject: str | None = None
@@ -36,7 +43,7 @@ class GreenGSMEmailExtractor(BaseEmailExtractor):
 
             # --- Extract Merchant ---
             merchant_match = re.search(
-                r"payment of [0-9.]+\s*PHP to (.+?)\.", text, re.IGNORECASE
+                r"payment of [0-9.]+\s*PHP to ([^.]+)\.", text, re.IGNORECASE
             )
             merchant = merchant_match.group(1).strip() if merchant_match else None
 
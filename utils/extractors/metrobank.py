@@ -110,7 +110,7 @@ class MetrobankEmailExtractor(BaseEmailExtractor):
             else:
                 # Fallback: extract text between "for your" and "transaction"
                 merchant_match = re.search(
-                    r"for your\s+(.+?)\s+transaction", text, re.IGNORECASE
+                    r"for your\s+(\S.{0,200}?)\s+transaction", text, re.IGNORECASE
                 )
                 if merchant_match:
                     merchant_text = merchant_match.group(1).strip()
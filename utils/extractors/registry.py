@@ -0,0 +1,269 @@
+import importlib
+import json
+import re
+import threading
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List, Pattern, Set, Union
+
+from utils.extractors.base import BaseEmailExtractor
+
+ExtractorFactory = Union[str, Callable[[], BaseEmailExtractor]]
+
+# Entry point group third-party packages use to ship extractors, e.g. in their
+# pyproject.toml:
+#   [project.entry-points."cc_transaction_logger.extractors"]
+#   Shopee = "shopee_extractor:ShopeeEmailExtractor"
+ENTRY_POINT_GROUP = "cc_transaction_logger.extractors"
+
+
+class ExtractorRegistry(Mapping):
+    """
+    Mapping of merchant names to lazily constructed extractors.
+
+    Each merchant is registered with a factory: either a "module:Class" path
+    or a callable returning the extractor, and optionally its sender address.
+    Merchants come from manifest files and from the ENTRY_POINT_GROUP entry
+    points of installed packages. The extractor module is imported and the
+    extractor constructed on first access, then reused, so a run only pays for
+    the merchants it actually routes emails to.
+
+    Emails are routed by sender, then by subject when several merchants share
+    a sender (e.g. a payment processor sending receipts for many merchants):
+    each merchant of a shared sender declares a subject pattern, and a
+    merchant without one takes the emails no pattern matches.
+    """
+
+    def __init__(
+        self,
+        factories: Union[Dict[str, ExtractorFactory], None] = None,
+        entry_point_group: Union[str, None] = None,
+    ):
+        """
+        Args:
+            factories (dict, optional): Extractor factory per merchant name
+            entry_point_group (str, optional): Entry point group scanned for
+                more extractors the first time an unknown merchant is looked up
+                or the registry is listed
+        """
+        self.factories: Dict[str, ExtractorFactory] = dict(factories or {})
+        self.instances: Dict[str, BaseEmailExtractor] = {}
+        self.senders: Dict[str, List[str]] = {}
+        self.subjects: Dict[str, Pattern] = {}
+        # Merchants whose sender is only known once their extractor is built
+        self.unrouted: Set[str] = set()
+        self.entry_point_group = entry_point_group
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_manifest(
+        cls, path: str, entry_point_group: Union[str, None] = None
+    ) -> "ExtractorRegistry":
+        """
+        Create a registry from a manifest file
+
+        Args:
+            path (str): Path to the JSON manifest
+            entry_point_group (str, optional): See __init__
+
+        Returns:
+            ExtractorRegistry: The registry
+        """
+        registry = cls(entry_point_group=entry_point_group)
+        registry.load_manifest(path)
+        return registry
+
+    def load_manifest(self, path: str) -> None:
+        """
+        Register the extractors of a manifest file
+
+        The manifest holds an "extractors" list of objects with a "merchant"
+        name, the "extractor" "module:Class" path and, optionally, the
+        "sender" address of the merchant's emails and a "subject" regular
+        expression telling its emails apart from those of other merchants
+        with the same sender.
+
+        Args:
+            path (str): Path to the JSON manifest
+        """
+        with open(path) as file:
+            manifest = json.load(file)
+        for entry in manifest["extractors"]:
+            self.register(
+                entry["merchant"],
+                entry["extractor"],
+                entry.get("sender"),
+                entry.get("subject"),
+            )
+
+    def register(
+        self,
+        merchant: str,
+        factory: ExtractorFactory,
+        sender: Union[str, None] = None,
+        subject: Union[str, None] = None,
+    ) -> None:
+        """
+        Register (or replace) the extractor factory of a merchant
+
+        Args:
+            merchant (str): Merchant name
+            factory: "module:Class" path or callable returning the extractor
+            sender (str, optional): Address the merchant's emails come from,
+                to route emails without constructing the extractor
+            subject (str, optional): Regular expression searched in the
+                subject of the sender's emails, case-insensitively, to route
+                them to this merchant
+        """
+        with self.lock:
+            self.factories[merchant] = factory
+            self.instances.pop(merchant, None)
+            self.subjects.pop(merchant, None)
+            if subject:
+                self.subjects[merchant] = re.compile(subject, re.IGNORECASE)
+            for merchants in self.senders.values():
+                if merchant in merchants:
+                    merchants.remove(merchant)
+            self.unrouted.discard(merchant)
+            if sender:
+                self.senders.setdefault(sender.lower(), []).append(merchant)
+            else:
+                self.unrouted.add(merchant)
+
+    def merchant_for_sender(self, address: str) -> Union[str, None]:
+        """
+        Get the first merchant whose emails come from an address
+
+        Args:
+            address (str): Lowercase email address
+
+        Returns:
+            str | None: The merchant name or None if no extractor handles it
+        """
+        merchants = self.merchants_for_sender(address)
+        return merchants[0] if merchants else None
+
+    def merchants_for_sender(self, address: str) -> List[str]:
+        """
+        Get the merchants whose emails come from an address
+
+        Merchants registered without a sender are constructed to read their
+        merchant_email, but only when no registered sender matches.
+
+        Args:
+            address (str): Lowercase email address
+
+        Returns:
+            List[str]: The merchant names in registration order
+        """
+        merchants = self.senders.get(address)
+        if merchants:
+            return list(merchants)
+
+        self._discover()
+        for merchant in sorted(self.unrouted):
+            sender = self[merchant].merchant_email.lower()
+            with self.lock:
+                self.unrouted.discard(merchant)
+                self.senders.setdefault(sender, []).append(merchant)
+        return list(self.senders.get(address, []))
+
+    def merchant_for_email(
+        self, address: str, subject: Union[str, None]
+    ) -> Union[str, None]:
+        """
+        Get the one merchant that handles an email
+
+        Among the merchants of the sender, the first whose subject pattern
+        matches gets the email, otherwise the first without a pattern.
+
+        Args:
+            address (str): Lowercase sender address
+            subject (str): Subject of the email
+
+        Returns:
+            str | None: The merchant name or None if no extractor handles it
+        """
+        fallback = None
+        for merchant in self.merchants_for_sender(address):
+            pattern = self.subjects.get(merchant)
+            if pattern is None:
+                fallback = fallback or merchant
+            elif pattern.search(subject or ""):
+                return merchant
+        return fallback
+
+    def sender_of(self, merchant: str) -> str:
+        """Lowercase address the emails of a merchant come from"""
+        for sender, merchants in self.senders.items():
+            if merchant in merchants:
+                return sender
+        return self[merchant].merchant_email.lower()
+
+    def group_by_sender(self, merchants: List[str]) -> Dict[str, List[str]]:
+        """
+        Group merchants by the address their emails come from
+
+        Args:
+            merchants (List[str]): Merchant names
+
+        Returns:
+            Dict[str, List[str]]: The merchants of each sender, in input order,
+                so emails of a shared sender can be fetched once
+        """
+        groups: Dict[str, List[str]] = {}
+        for merchant in merchants:
+            groups.setdefault(self.sender_of(merchant), []).append(merchant)
+        return groups
+
+    def is_loaded(self, merchant: str) -> bool:
+        """Check whether the extractor of a merchant has been constructed"""
+        return merchant in self.instances
+
+    def _discover(self) -> None:
+        """Register the extractors of the entry point group, once"""
+        if self.entry_point_group is None:
+            return
+        with self.lock:
+            group, self.entry_point_group = self.entry_point_group, None
+            from importlib.metadata import entry_points
+
+            for entry_point in entry_points(group=group):
+                # Merchants registered explicitly take precedence
+                if entry_point.name not in self.factories:
+                    self.factories[entry_point.name] = entry_point.value
+                    self.unrouted.add(entry_point.name)
+
+    def __getitem__(self, merchant: str) -> BaseEmailExtractor:
+        extractor = self.instances.get(merchant)
+        if extractor is not None:
+            return extractor
+
+        if merchant not in self.factories:
+            self._discover()
+        factory = self.factories[merchant]
+        with self.lock:
+            # Another thread may have constructed it while we waited
+            extractor = self.instances.get(merchant)
+            if extractor is None:
+                extractor = self.instances[merchant] = _resolve(factory)()
+        return extractor
+
+    def __iter__(self) -> Iterator[str]:
+        self._discover()
+        return iter(list(self.factories))
+
+    def __len__(self) -> int:
+        self._discover()
+        return len(self.factories)
+
+    def __contains__(self, merchant) -> bool:
+        if merchant not in self.factories:
+            self._discover()
+        return merchant in self.factories
+
+
+def _resolve(factory: ExtractorFactory) -> Callable[[], BaseEmailExtractor]:
+    if callable(factory):
+        return factory
+    module_name, _, class_name = factory.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)
@@ -0,0 +1,224 @@
+"""
+Observed hits of the extractor routes, used to order route fallbacks.
+
+When the subject of an email is not the name of a route, an extractor tries
+its routes one after the other. Hits and misses are recorded per extractor,
+subject pattern and route, so the route most likely to match an email with
+that subject is tried first. The statistics are persisted between runs as
+JSON.
+
+Usage:
+    uv run python -m utils.extractors.route_stats [PATH]
+
+prints the learned route order of every extractor and subject pattern.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+# Counts are halved past this many attempts per subject pattern, so the order
+# keeps adapting when a merchant's mix of emails changes
+MAX_ATTEMPTS = 10000
+
+DIGITS_PATTERN = re.compile(r"\d+")
+
+
+def subject_pattern(subject: str | None) -> str:
+    """Subject with its numbers (order IDs, amounts, dates) masked"""
+    return DIGITS_PATTERN.sub("#", (subject or "").strip())
+
+
+class RouteStats:
+    """Hits, misses and emails per extractor and subject pattern"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # extractor -> subject pattern -> route -> [hits, misses]
+        self.routes: Dict[str, Dict[str, Dict[str, List[int]]]] = {}
+        # extractor -> subject pattern -> [emails, attempts]
+        self.emails: Dict[str, Dict[str, List[int]]] = {}
+        # Files already added, see load
+        self.loaded: set = set()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.routes = {}
+            self.emails = {}
+            self.loaded = set()
+
+    def record(self, extractor: str, subject: str | None, route: str, hit: bool) -> None:
+        """
+        Record the outcome of a route attempt
+
+        Args:
+            extractor (str): Extractor class name
+            subject (str): Subject of the email
+            route (str): Name of the route
+            hit (bool): The route found a card number
+        """
+        pattern = subject_pattern(subject)
+        with self.lock:
+            counts = (
+                self.routes.setdefault(extractor, {})
+                .setdefault(pattern, {})
+                .setdefault(route, [0, 0])
+            )
+            counts[0 if hit else 1] += 1
+            emails = self.emails.setdefault(extractor, {}).setdefault(pattern, [0, 0])
+            emails[1] += 1
+
+    def record_email(self, extractor: str, subject: str | None) -> None:
+        """Count an extracted email, the denominator of the attempts per email"""
+        pattern = subject_pattern(subject)
+        with self.lock:
+            emails = self.emails.setdefault(extractor, {}).setdefault(pattern, [0, 0])
+            emails[0] += 1
+            if emails[1] > MAX_ATTEMPTS:
+                self._decay(extractor, pattern)
+
+    def order(self, extractor: str, subject: str | None, routes: Iterable[str]) -> List[str]:
+        """
+        Sort routes by how many emails with a subject they matched, most first
+
+        Hits are compared rather than hit rates: a route tried after another
+        one only sees the emails the first one missed, so its hit rate is
+        inflated, while every email is matched by at most one route. Ties,
+        including routes without statistics, keep the registration order.
+
+        Args:
+            extractor (str): Extractor class name
+            subject (str): Subject of the email
+            routes: Route names in registration order
+
+        Returns:
+            List[str]: The routes in trial order
+        """
+        routes = list(routes)
+        stats = self.routes.get(extractor, {}).get(subject_pattern(subject))
+        if not stats or len(routes) < 2:
+            return routes
+        return sorted(routes, key=lambda route: stats.get(route, (0, 0))[0], reverse=True)
+
+    def attempts_per_email(self, extractor: str, subject: str | None) -> float:
+        emails, attempts = self.emails.get(extractor, {}).get(
+            subject_pattern(subject), (0, 0)
+        )
+        return attempts / emails if emails else 0.0
+
+    def load(self, path: str) -> None:
+        """
+        Add the statistics of a JSON file, if it exists
+
+        A file is only added once: the counts in memory already include it
+        when another extractor of the process loads it again, and save then
+        writes them back without counting it twice.
+
+        Args:
+            path (str): The JSON file, see save
+        """
+        key = os.path.abspath(path)
+        with self.lock:
+            if key in self.loaded:
+                return
+            self.loaded.add(key)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable route statistics {path}: {e}")
+            return
+
+        with self.lock:
+            for extractor, patterns in data.get("routes", {}).items():
+                for pattern, routes in patterns.items():
+                    for route, (hits, misses) in routes.items():
+                        counts = (
+                            self.routes.setdefault(extractor, {})
+                            .setdefault(pattern, {})
+                            .setdefault(route, [0, 0])
+                        )
+                        counts[0] += hits
+                        counts[1] += misses
+            for extractor, patterns in data.get("emails", {}).items():
+                for pattern, (emails, attempts) in patterns.items():
+                    counts = self.emails.setdefault(extractor, {}).setdefault(
+                        pattern, [0, 0]
+                    )
+                    counts[0] += emails
+                    counts[1] += attempts
+
+    def save(self, path: str) -> None:
+        """Write the statistics to a JSON file"""
+        with self.lock:
+            content = json.dumps(
+                {"routes": self.routes, "emails": self.emails}, indent=2, sort_keys=True
+            )
+        # Write to a temporary file first so an interruption never corrupts it
+        with open(f"{path}.tmp", "w") as file:
+            file.write(content)
+        os.replace(f"{path}.tmp", path)
+
+    def summary(self) -> List[Tuple[str, str, float, List[Tuple[str, int, int]]]]:
+        """
+        Get the learned order of every extractor and subject pattern
+
+        Returns:
+            List of (extractor, subject pattern, attempts per email,
+            [(route, hits, misses)] in trial order)
+        """
+        rows = []
+        for extractor in sorted(self.routes):
+            for pattern in sorted(self.routes[extractor]):
+                stats = self.routes[extractor][pattern]
+                ordered = self.order(extractor, pattern, stats)
+                rows.append(
+                    (
+                        extractor,
+                        pattern,
+                        self.attempts_per_email(extractor, pattern),
+                        [(route, *stats[route]) for route in ordered],
+                    )
+                )
+        return rows
+
+    def _decay(self, extractor: str, pattern: str) -> None:
+        for counts in self.routes.get(extractor, {}).get(pattern, {}).values():
+            counts[0] //= 2
+            counts[1] //= 2
+        emails = self.emails[extractor][pattern]
+        emails[0] //= 2
+        emails[1] //= 2
+
+
+# Shared by every extractor of the process
+route_stats = RouteStats()
+
+
+def main():
+    from utils import load_env
+
+    load_env()
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getenv(
+        "ROUTE_STATS_PATH", "route_stats.json"
+    )
+    stats = RouteStats()
+    stats.load(path)
+    rows = stats.summary()
+    if not rows:
+        print(f"No route statistics in {path}")
+        return
+    for extractor, pattern, attempts, routes in rows:
+        print(f"{extractor} {pattern!r}: {attempts:.2f} attempts per email")
+        for route, hits, misses in routes:
+            rate = hits / (hits + misses) if hits + misses else 0.0
+            print(f"  {route:<50} {hits:>7} hits {misses:>7} misses {rate:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
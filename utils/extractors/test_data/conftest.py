@@ -5,6 +5,8 @@ Pytest configuration for email extractor tests.
 import importlib
 import os
 import sys
+import time
+from types import SimpleNamespace
 
 import pytest
 
@@ -15,6 +17,7 @@ sys.path.insert(
 
 from utils.extractors import EXTRACTOR_REGISTRY
 from utils.extractors.test_data import available_tests
+from utils.metrics import metrics
 
 
 @pytest.fixture
@@ -23,6 +26,51 @@ def extractor_registry():
     return EXTRACTOR_REGISTRY
 
 
+@pytest.fixture
+def make_card():
+    """
+    Fixture to build card configurations (see cards/_template.py)
+
+    Attributes given as keywords replace the defaults, e.g.
+    make_card(MERCHANTS=["Grab"], LAST_RUN_TIME_ENV_NAME="TEST_X_LAST_RUNTIME").
+    Tests running run_card give each card its own LAST_RUN_TIME_ENV_NAME,
+    which the run sets in the environment.
+    """
+
+    def make_card(**attributes) -> SimpleNamespace:
+        defaults = {
+            "NICKNAME": "Test",
+            "MERCHANTS": ["Grab", "Metrobank"],
+            "LAST_DIGITS": "4321",
+            "STATEMENT_DATE": "15",
+            "PREFIX": "TEST",
+            "GOOGLE_SHEET_ID": None,
+            "LAST_RUN_TIME_ENV_NAME": "TEST_LAST_RUNTIME",
+        }
+        return SimpleNamespace(**{**defaults, **attributes})
+
+    return make_card
+
+
+def wait_for(condition, timeout: float = 10.0) -> bool:
+    """Poll a condition of a background thread until it holds or the timeout passes"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def enabled_metrics():
+    """Fixture to collect the run metrics during a test."""
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+    metrics.reset()
+
+
 @pytest.fixture
 def test_data_modules():
     """Fixture to provide access to all test data modules."""
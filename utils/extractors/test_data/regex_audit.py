@@ -0,0 +1,272 @@
+"""
+Static check of the regular expressions used by the extractors.
+
+Finds the patterns passed as literals to the `re` functions in extractor
+modules and flags the constructs that make a backtracking match super-linear
+in the input length:
+
+- nested quantifiers, e.g. `(a+)+` (exponential)
+- two adjacent unbounded quantifiers that can match the same characters,
+  e.g. `\\s*[\\s\\n]*` or `(.+?)\\s+` (quadratic when the rest of the pattern
+  fails to match)
+
+Bounded quantifiers such as `.{1,200}?` are accepted: they cap the work per
+starting position.
+
+Usage:
+    uv run python -m utils.extractors.test_data.regex_audit
+"""
+
+import ast
+import inspect
+import re
+from dataclasses import dataclass
+
+try:  # Python 3.11+
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:  # pragma: no cover
+    import sre_constants
+    import sre_parse
+
+RE_FUNCTIONS = {
+    "compile",
+    "search",
+    "match",
+    "fullmatch",
+    "findall",
+    "finditer",
+    "sub",
+    "subn",
+    "split",
+}
+
+# Possessive repeats (Python 3.11+) never backtrack, so only these are checked
+BACKTRACKING_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+REPEATS = BACKTRACKING_REPEATS + tuple(
+    getattr(sre_constants, name)
+    for name in ("POSSESSIVE_REPEAT",)
+    if hasattr(sre_constants, name)
+)
+
+# Characters tried to decide whether two character classes overlap
+SAMPLE_CHARACTERS = [chr(code) for code in range(384)] + ["₱", "•", " ", "　"]
+
+
+@dataclass
+class Finding:
+    location: str
+    pattern: str
+    problem: str
+
+    def __str__(self) -> str:
+        return f"{self.location}: {self.pattern!r}: {self.problem}"
+
+
+def patterns_in_source(
+    source: str, filename: str = "<source>"
+) -> list[tuple[str, str, int]]:
+    """
+    Find the literal patterns passed to the `re` functions in Python source
+
+    Args:
+        source (str): The module source
+        filename (str): Name used in the locations
+
+    Returns:
+        list[tuple[str, str, int]]: (location, pattern, flags) of every pattern
+    """
+    found = []
+    for node in ast.walk(ast.parse(source)):
+        if not (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "re"
+            and node.func.attr in RE_FUNCTIONS
+            and node.args
+            and isinstance(node.args[0], ast.Constant)
+            and isinstance(node.args[0].value, (str, bytes))
+        ):
+            continue
+        flags_node = next((kw.value for kw in node.keywords if kw.arg == "flags"), None)
+        if flags_node is None and node.func.attr == "compile" and len(node.args) > 1:
+            flags_node = node.args[1]
+        elif flags_node is None and len(node.args) > 2:
+            flags_node = node.args[-1]
+        found.append((f"{filename}:{node.lineno}", node.args[0].value, _flags(flags_node)))
+    return found
+
+
+def audit_pattern(pattern, flags: int = 0) -> list[str]:
+    """
+    Check a pattern for super-linear backtracking constructs
+
+    Args:
+        pattern (str | bytes): The regular expression
+        flags (int): Its `re` flags
+
+    Returns:
+        list[str]: Description of every problem, empty if the pattern is safe
+    """
+    parsed = sre_parse.parse(pattern, flags)
+    dotall = bool(parsed.state.flags & re.DOTALL)
+    problems = []
+    _check_nested(list(parsed), problems, inside_unbounded=False)
+    _check_adjacent(_flatten(list(parsed)), dotall, problems)
+    return list(dict.fromkeys(problems))
+
+
+def audit_module(module) -> list[Finding]:
+    """Audit every literal pattern of a module"""
+    filename = inspect.getsourcefile(module)
+    findings = []
+    for location, pattern, flags in patterns_in_source(inspect.getsource(module), filename):
+        for problem in audit_pattern(pattern, flags):
+            findings.append(Finding(location, pattern, problem))
+    return findings
+
+
+def audit_registered_extractors(registry) -> list[Finding]:
+    """Audit the modules of every extractor of a registry and of their base classes"""
+    modules = {}
+    for merchant in registry:
+        for cls in type(registry[merchant]).__mro__:
+            module = inspect.getmodule(cls)
+            if module is not None and module.__name__.startswith("utils."):
+                modules[module.__name__] = module
+    return [finding for name in sorted(modules) for finding in audit_module(modules[name])]
+
+
+def _flags(node) -> int:
+    """Evaluate flag expressions such as re.IGNORECASE | re.DOTALL"""
+    if node is None:
+        return 0
+    if (
+        isinstance(node, ast.Attribute)
+        and isinstance(node.value, ast.Name)
+        and node.value.id == "re"
+    ):
+        return int(getattr(re, node.attr))
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        return _flags(node.left) | _flags(node.right)
+    return 0
+
+
+def _is_unbounded(item) -> bool:
+    op, value = item
+    return op in BACKTRACKING_REPEATS and value[1] == sre_constants.MAXREPEAT
+
+
+def _children(item) -> list[list]:
+    """Sub-sequences of a parsed item"""
+    op, value = item
+    if op in REPEATS:
+        return [list(value[2])]
+    if op == sre_constants.SUBPATTERN:
+        return [list(value[-1])]
+    if op == sre_constants.BRANCH:
+        return [list(branch) for branch in value[1]]
+    if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return [list(value[1])]
+    if hasattr(sre_constants, "ATOMIC_GROUP") and op == sre_constants.ATOMIC_GROUP:
+        return [list(value)]
+    return []
+
+
+def _check_nested(items: list, problems: list, inside_unbounded: bool) -> None:
+    for item in items:
+        unbounded = _is_unbounded(item)
+        if unbounded and inside_unbounded:
+            problems.append("nested unbounded quantifiers (exponential backtracking)")
+            return
+        for child in _children(item):
+            _check_nested(child, problems, inside_unbounded or unbounded)
+
+
+def _flatten(items: list) -> list:
+    """Inline groups so that items matched one after the other are adjacent"""
+    flat = []
+    for op, value in items:
+        if op == sre_constants.SUBPATTERN:
+            flat.extend(_flatten(list(value[-1])))
+        elif op == sre_constants.AT:
+            continue  # Zero width
+        else:
+            flat.append((op, value))
+    return flat
+
+
+def _check_adjacent(items: list, dotall: bool, problems: list) -> None:
+    for first, second in zip(items, items[1:]):
+        if not (_is_unbounded(first) and _is_unbounded(second)):
+            continue
+        first_chars = _character_test(first[1][2], dotall)
+        second_chars = _character_test(second[1][2], dotall)
+        if first_chars is None or second_chars is None:
+            problems.append("adjacent unbounded quantifiers (polynomial backtracking)")
+        elif any(first_chars(c) and second_chars(c) for c in SAMPLE_CHARACTERS):
+            problems.append(
+                "adjacent unbounded quantifiers over overlapping characters "
+                "(polynomial backtracking)"
+            )
+    for item in items:
+        for child in _children(item):
+            _check_adjacent(_flatten(child), dotall, problems)
+
+
+def _character_test(body, dotall: bool):
+    """Predicate of the characters a single character item matches, None if not one"""
+    body = list(body)
+    if len(body) != 1:
+        return None
+    op, value = body[0]
+    if op == sre_constants.LITERAL:
+        return lambda c: ord(c) == value
+    if op == sre_constants.NOT_LITERAL:
+        return lambda c: ord(c) != value
+    if op == sre_constants.ANY:
+        return lambda c: dotall or c != "\n"
+    if op == sre_constants.IN:
+        return lambda c: _in_set(value, c)
+    return None
+
+
+CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: str.isdigit,
+    sre_constants.CATEGORY_NOT_DIGIT: lambda c: not c.isdigit(),
+    sre_constants.CATEGORY_SPACE: str.isspace,
+    sre_constants.CATEGORY_NOT_SPACE: lambda c: not c.isspace(),
+    sre_constants.CATEGORY_WORD: lambda c: c.isalnum() or c == "_",
+    sre_constants.CATEGORY_NOT_WORD: lambda c: not (c.isalnum() or c == "_"),
+}
+
+
+def _in_set(items, c: str) -> bool:
+    negate = False
+    matched = False
+    for op, value in items:
+        if op == sre_constants.NEGATE:
+            negate = True
+        elif op == sre_constants.LITERAL:
+            matched = matched or ord(c) == value
+        elif op == sre_constants.RANGE:
+            matched = matched or value[0] <= ord(c) <= value[1]
+        elif op == sre_constants.CATEGORY:
+            matched = matched or CATEGORIES.get(value, lambda _: True)(c)
+        else:
+            matched = True  # Unknown set item: assume it overlaps
+    return matched != negate
+
+
+def main():
+    from utils.extractors import EXTRACTOR_REGISTRY
+
+    findings = audit_registered_extractors(EXTRACTOR_REGISTRY)
+    for finding in findings:
+        print(finding)
+    print(f"{len(findings)} super-linear patterns found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+Synthetic email corpus for email extractors.
+
+Generates realistic, anonymized emails for every registered extractor route
+together with the expected extraction results. The corpus is deterministic
+for a given seed so benchmarks and tests are reproducible.
+
+Usage:
+    from utils.extractors.test_data.synthetic import generate_corpus
+
+    for email in generate_corpus(count=1000, seed=42):
+        print(email["merchant"], email["route"], email["subject"])
+"""
+
+import random
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import format_datetime
+
+import pytz
+
+# Card number used for Foodpanda emails (see CARD_USED_FOR_FPND)
+FOODPANDA_CARD = "FPND"
+
+RESTAURANTS = [
+    "Test Burger House",
+    "Sample Noodle Bar",
+    "Demo Pizza Co.",
+    "Example Milk Tea",
+    "Mock Chicken Express",
+    "Placeholder Bakery",
+]
+
+SHOPS = [
+    "SAMPLE GROCERY MAKATI",
+    "DEMO PHARMACY BGC",
+    "TEST COFFEE ORTIGAS",
+    "EXAMPLE HARDWARE QC",
+    "MOCK ONLINE STORE",
+]
+
+HTML_HEAD = """<head>
+<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<style type="text/css">
+  body {{ margin:0; padding:0; font-family: Helvetica, Arial, sans-serif; }}
+  table {{ border-collapse: collapse; }}
+  .footer a {{ color:#9b9b9b; text-decoration:none; }}
+  @media only screen and (max-width: 600px) {{
+    .container {{ width:100% !important; }}
+    .hide-mobile {{ display:none !important; }}
+  }}
+</style>
+<!--[if mso]><style>table {{ border-collapse: collapse; }}</style><![endif]-->
+</head>"""
+
+HTML_FOOTER = """<table class="footer" width="100%" cellpadding="0" cellspacing="0">
+  <tr><td style="font-size:11px; color:#9b9b9b; padding:24px;">
+    This is an automatically generated email. Please do not reply.<br>
+    <a href="https://example.com/help">Help Centre</a> |
+    <a href="https://example.com/privacy">Privacy Policy</a> |
+    <a href="https://example.com/unsubscribe">Unsubscribe</a>
+  </td></tr>
+</table>
+<img src="https://tracking.example.com/open.gif?id={tracking_id}" width="1" height="1" alt="">
+<script type="application/ld+json">{{"@context": "http://schema.org", "@type": "Order"}}</script>"""
+
+
+def _html_document(title: str, content: str, rng: random.Random) -> str:
+    return (
+        "<!DOCTYPE html>\n<html>\n"
+        + HTML_HEAD.format(title=title)
+        + '\n<body>\n<table class="container" width="600" align="center">'
+        + "<tr><td>\n"
+        + content
+        + "\n</td></tr></table>\n"
+        + HTML_FOOTER.format(tracking_id=rng.getrandbits(64))
+        + "\n</body>\n</html>"
+    )
+
+
+def _amount(rng: random.Random, low: float = 50, high: float = 15000) -> float:
+    return round(rng.uniform(low, high), 2)
+
+
+def _card(rng: random.Random) -> str:
+    return f"{rng.randint(0, 9999):04d}"
+
+
+def grabfood(rng: random.Random, card_number: str | None = None) -> dict:
+    card = card_number or _card(rng)
+    amount = _amount(rng, 150, 3000)
+    content = f"""
+<table width="100%"><tr><td style="font-size:24px;">Thanks for ordering, Test User</td></tr>
+<tr><td>Order from {rng.choice(RESTAURANTS)}</td></tr></table>
+<table width="100%" cellpadding="4">
+  <tr><td>1x Sample Meal</td><td align="right">P {amount - 49:,.2f}</td></tr>
+  <tr><td>Delivery fee</td><td align="right">P 49.00</td></tr>
+  <tr><td><span style="font-weight:bold;">TOTAL (INCL. TAX)</span></td>
+      <td align="right"><span style="font-weight:bold;">P {amount:,.2f}</span></td></tr>
+</table>
+<table width="100%"><tr><td>Paid by</td>
+  <td><span style="font-weight:bold; color:#000000;">Mastercard •••• {card}</span></td></tr></table>"""
+    return {
+        "from": "Grab <no-reply@grab.com>",
+        "subject": "Your Grab E-Receipt",
+        "body": _html_document("Your Grab E-Receipt", content, rng),
+        "route": "GrabFood",
+        "expected": {
+            "card_number": card,
+            "amount": amount,
+            "merchant": "GrabFood",
+        },
+    }
+
+
+def grabride(rng: random.Random, card_number: str | None = None) -> dict:
+    card = card_number or _card(rng)
+    amount = _amount(rng, 90, 1500)
+    content = f"""
+<table width="100%"><tr><td style="font-size:24px;">Hope you enjoyed your ride!</td></tr>
+<tr><td>Pick-up: Sample Street, Makati</td></tr><tr><td>Drop-off: Example Avenue, Taguig</td></tr></table>
+<table width="100%" cellpadding="4">
+  <tr><td>Fare</td><td align="right">P {amount:,.2f}</td></tr>
+  <tr><td>Total Paid</td><td align="right">P {amount:,.2f}</td></tr>
+</table>
+<table width="100%"><tr>
+  <td><img src="https://example.com/mastercard.png" alt="MasterCard" width="24"></td>
+  <td> {card} </td></tr></table>"""
+    return {
+        "from": "Grab <no-reply@grab.com>",
+        "subject": "Your Grab E-Receipt",
+        "body": _html_document("Your Grab E-Receipt", content, rng),
+        "route": "GrabRide",
+        "expected": {
+            "card_number": card,
+            "amount": amount,
+            "merchant": "GrabRide",
+        },
+    }
+
+
+def metrobank_transaction(rng: random.Random, card_number: str | None = None) -> dict:
+    card = card_number or _card(rng)
+    amount, shop = _amount(rng), rng.choice(SHOPS)
+    body = (
+        "Dear Cardholder,\n\n"
+        f"Your Metrobank Card ending in {card} was used for a purchase "
+        f"at {shop} for PHP {amount:,.2f} on {rng.randint(1, 28):02d}/01/2024.\n\n"
+        "If you did not make this purchase, please call our 24-hour hotline.\n\n"
+        "This is a system-generated email. Please do not reply.\n"
+    )
+    return {
+        "from": "Metrobank Card <Customerservice@metrobankcard.com>",
+        "subject": "Transaction Notification",
+        "body": body,
+        "route": "Transaction Notification",
+        "expected": {"card_number": card, "amount": amount, "merchant": shop},
+    }
+
+
+def metrobank_card_transaction(rng: random.Random, card_number: str | None = None) -> dict:
+    card = card_number or _card(rng)
+    amount = _amount(rng, 500, 8000)
+    body = (
+        "Dear Cardholder,\n\n"
+        f"Thank you for using your Metrobank Card ending in {card} for your "
+        f"PayBills transaction amounting to PHP {amount:,.2f}.\n\n"
+        "Your payment will be posted within 3 banking days.\n"
+    )
+    return {
+        "from": "Metrobank Card <Customerservice@metrobankcard.com>",
+        "subject": "Metrobank Card Transaction Notification",
+        "body": body,
+        "route": "Metrobank Card Transaction Notification",
+        "expected": {
+            "card_number": card,
+            "amount": amount,
+            "merchant": "pay bills option",
+        },
+    }
+
+
+def foodpanda_order(rng: random.Random, card_number: str | None = None) -> dict:
+    amount, restaurant = _amount(rng, 150, 2500), rng.choice(RESTAURANTS)
+    body = f"""
+foodpanda
+
+Order info
+
+Summary:
+Order number: {rng.getrandbits(32):08x}
+Order time: 2024-01-01 12:00:00
+
+Hey Test User,
+
+You're all set! Your order from {restaurant} will be on its way soon.
+
+Qty | Item | Price
+1 X | Sample Meal | ₱ {amount - 50:,.2f}
+
+Subtotal: ₱ {amount - 50:,.2f}
+Incl. delivery fee: ₱ 50.00
+
+Order Total
+
+ ₱
+{amount:,.2f}
+
+Privacy | Terms and Conditions
+"""
+    return {
+        "from": "foodpanda <info@mail.foodpanda.ph>",
+        "subject": "Your order has been placed",
+        "body": body,
+        "route": "Your order has been placed",
+        "expected": {
+            "card_number": card_number or FOODPANDA_CARD,
+            "amount": amount,
+            "merchant": restaurant,
+        },
+    }
+
+
+def greengsm_receipt(rng: random.Random, card_number: str | None = None) -> dict:
+    card = card_number or _card(rng)
+    amount = _amount(rng, 100, 900)
+    content = f"""
+<table width="100%" cellpadding="6">
+  <tr><td style="font-size:20px;">RECEIPT FOR YOUR PAYMENT</td></tr>
+  <tr><td>Thank you for your payment of {amount:.2f} PHP to GREEN AND SMART MOBILITY PHILIPPINES INC. Please keep this receipt for your records.</td></tr>
+  <tr><td>Invoice No: INV{rng.getrandbits(24):08d}</td></tr>
+  <tr><td>Amount: {amount:.2f} PHP</td></tr>
+  <tr><td>Paid via: MasterCard 512345XXXXXX{card}</td></tr>
+</table>"""
+    subject = "RECEIPT FOR YOUR PAYMENT TO GREEN AND SMART MOBILITY PHILIPPINES INC."
+    return {
+        "from": "2C2P <noreply@2c2p.com>",
+        "subject": subject,
+        "body": _html_document(subject, content, rng),
+        "route": subject,
+        "expected": {
+            "card_number": card,
+            "amount": amount,
+            "merchant": "GREEN AND SMART MOBILITY PHILIPPINES INC",
+        },
+    }
+
+
+def marketing(sender: str, subject: str):
+    """Build a generator of promotional emails that contain no transaction"""
+
+    def generate(rng: random.Random, card_number: str | None = None) -> dict:
+        content = f"""
+<table width="100%"><tr><td style="font-size:28px;">{subject}</td></tr>
+<tr><td>Use code SAMPLE{rng.randint(10, 99)} to get {rng.randint(10, 50)}% off your next order.</td></tr>
+<tr><td><a href="https://example.com/promo">Order now</a></td></tr></table>"""
+        return {
+            "from": sender,
+            "subject": subject,
+            "body": _html_document(subject, content, rng),
+            "route": "noise",
+            "expected": None,
+        }
+
+    return generate
+
+
+# Generators of every route, per merchant
+GENERATORS = {
+    "Grab": {
+        "GrabFood": grabfood,
+        "GrabRide": grabride,
+        "noise": marketing("Grab <no-reply@grab.com>", "Your weekend treats are here"),
+    },
+    "Metrobank": {
+        "Transaction Notification": metrobank_transaction,
+        "Metrobank Card Transaction Notification": metrobank_card_transaction,
+    },
+    "Foodpanda": {
+        "Your order has been placed": foodpanda_order,
+        "noise": marketing("foodpanda <info@mail.foodpanda.ph>", "Craving something?"),
+    },
+    "GreenGSM": {
+        "RECEIPT FOR YOUR PAYMENT TO GREEN AND SMART MOBILITY PHILIPPINES INC.": greengsm_receipt,
+    },
+}
+
+
+def generate_emails(
+    merchant: str,
+    route: str,
+    count: int,
+    seed: int = 0,
+    start_date: datetime = datetime(2024, 1, 1),
+    card_number: str | None = None,
+) -> list[dict]:
+    """
+    Generate synthetic emails of a single extractor route
+
+    Args:
+        merchant (str): Merchant name as in EXTRACTOR_REGISTRY
+        route (str): Route name as in GENERATORS[merchant]
+        count (int): Number of emails to generate
+        seed (int): Random seed (default: 0)
+        start_date (datetime): Date of the first email (default: 2024-01-01)
+        card_number (str, optional): Use these card digits in every email instead
+            of random ones (Foodpanda expects CARD_USED_FOR_FPND to match)
+
+    Returns:
+        list[dict]: Email data with 'message_id', 'from', 'subject', 'date', 'body',
+            'merchant', 'route' and 'expected' keys
+    """
+    rng = random.Random(f"{seed}:{merchant}:{route}")
+    generator = GENERATORS[merchant][route]
+    route_index = list(GENERATORS[merchant]).index(route)
+    date = pytz.timezone("Asia/Manila").localize(start_date)
+
+    emails = []
+    for i in range(count):
+        email_data = generator(rng, card_number)
+        date += timedelta(minutes=rng.randint(1, 720))
+        email_data.update(
+            {
+                "message_id": f"<synthetic-{seed}-{merchant}-{route_index}-{i}@example.com>",
+                "date": date,
+                "merchant": merchant,
+            }
+        )
+        emails.append(email_data)
+    return emails
+
+
+def generate_corpus(
+    count: int, seed: int = 0, noise: bool = True, card_number: str | None = None
+) -> list[dict]:
+    """
+    Generate a mixed corpus of synthetic emails across every extractor route
+
+    Args:
+        count (int): Total number of emails to generate
+        seed (int): Random seed (default: 0)
+        noise (bool): Include promotional emails without transactions (default: True)
+        card_number (str, optional): Use these card digits in every email (see generate_emails)
+
+    Returns:
+        list[dict]: Email data sorted by date (see generate_emails)
+    """
+    routes = [
+        (merchant, route)
+        for merchant, generators in GENERATORS.items()
+        for route in generators
+        if noise or route != "noise"
+    ]
+    emails = []
+    for i, (merchant, route) in enumerate(routes):
+        route_count = count // len(routes) + (1 if i < count % len(routes) else 0)
+        emails.extend(
+            generate_emails(
+                merchant, route, route_count, seed=seed, card_number=card_number
+            )
+        )
+    return sorted(emails, key=lambda email_data: email_data["date"])
+
+
+def to_rfc822(email_data: dict) -> bytes:
+    """
+    Convert synthetic email data into a raw RFC822 email
+
+    Args:
+        email_data (dict): Email data as returned by generate_emails
+
+    Returns:
+        bytes: The raw email
+    """
+    message = EmailMessage()
+    message["Message-ID"] = email_data["message_id"]
+    message["From"] = email_data["from"]
+    message["To"] = "test.user@example.com"
+    message["Subject"] = email_data["subject"]
+    message["Date"] = format_datetime(email_data["date"])
+    subtype = "html" if email_data["body"].lstrip().startswith("<!DOCTYPE") else "plain"
+    message.set_content(email_data["body"], subtype=subtype)
+    return message.as_bytes()
@@ -0,0 +1,96 @@
+"""
+Pytest tests for windowed backfills and their checkpoints against the fake IMAP server.
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks.fake_imap import FakeIMAPServer
+from utils.backfill import BackfillCheckpoint, run_backfill, split_windows
+from utils.extractors import TransactionExtractor
+from utils.extractors.test_data.synthetic import generate_emails, to_rfc822
+from utils.gmail import Gmail
+from utils.retry import RetryPolicy
+from utils.store import TransactionStore
+
+
+def test_split_windows():
+    """Test that windows are consecutive and the last one ends at the end date."""
+    start = datetime(2024, 1, 1)
+    windows = split_windows(start, datetime(2024, 1, 17, 12), "week")
+
+    assert windows == [
+        [start, datetime(2024, 1, 8)],
+        [datetime(2024, 1, 8), datetime(2024, 1, 15)],
+        [datetime(2024, 1, 15), datetime(2024, 1, 17, 12)],
+    ]
+    assert len(split_windows(start, datetime(2024, 1, 3), "day")) == 2
+    assert split_windows(start, start) == []
+    with pytest.raises(ValueError):
+        split_windows(start, datetime(2024, 2, 1), "month")
+
+
+def test_backfill_resumes_with_the_failed_windows(tmp_path, make_card):
+    """Test that a failed window is not checkpointed and only it is fetched again."""
+    card = make_card(
+        MERCHANTS=["Grab"], LAST_RUN_TIME_ENV_NAME="TEST_BACKFILL_LAST_RUNTIME"
+    )
+    start = datetime(2024, 1, 1)
+    emails = [
+        email_data
+        for week in range(3)
+        for email_data in generate_emails(
+            "Grab",
+            "GrabRide",
+            count=2,
+            seed=week,
+            start_date=start + timedelta(weeks=week),
+            card_number=card.LAST_DIGITS,
+        )
+    ]
+    date_interval = [start, start + timedelta(weeks=3)]
+    checkpoint_path = str(tmp_path / "backfill.json")
+    retry_policy = RetryPolicy(attempts=2, initial_delay=0.01, max_delay=0.01)
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in emails) as server:
+        gmail_client = Gmail(
+            "test@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+            retry_policy=retry_policy,
+        )
+        with TransactionStore(str(tmp_path / "transactions.db")) as store:
+            args = (gmail_client, TransactionExtractor(), store, card, date_interval)
+
+            # One connection fetches the windows in order: every attempt of
+            # the first one loses its connection
+            server.failures["UID SEARCH"] = retry_policy.attempts
+            added = run_backfill(*args, connections=1, checkpoint_path=checkpoint_path)
+            with open(checkpoint_path) as file:
+                done = json.load(file)["done"]
+
+            server.reset_counters()
+            added += run_backfill(*args, connections=1, checkpoint_path=checkpoint_path)
+            searches = server.counters["UID SEARCH"]
+
+            # Every window is done, a third run fetches nothing
+            server.reset_counters()
+            assert run_backfill(*args, connections=1, checkpoint_path=checkpoint_path) == 0
+            assert server.counters["UID SEARCH"] == 0
+
+            transactions = store.transactions(card.LAST_DIGITS)
+
+    windows = split_windows(*date_interval)
+    assert done == [BackfillCheckpoint.window_key(window) for window in windows[1:]]
+    assert searches == 1
+    assert added == len(emails)
+    assert sorted(record.message_id for record in transactions) == sorted(
+        email_data["message_id"] for email_data in emails
+    )
+    assert BackfillCheckpoint(checkpoint_path).done == {
+        BackfillCheckpoint.window_key(window) for window in windows
+    }
@@ -0,0 +1,55 @@
+"""
+Pytest tests for IMAP COMPRESS=DEFLATE against the fake IMAP server.
+"""
+
+from benchmarks.fake_imap import FakeIMAPServer
+from utils.extractors.test_data.synthetic import generate_emails, to_rfc822
+from utils.gmail import Gmail
+
+
+def _fetch(compress: bool, server_compress: bool = True) -> tuple[list[dict], FakeIMAPServer]:
+    emails = generate_emails("Grab", "GrabRide", count=20, seed=1)
+    raw_emails = (to_rfc822(email_data) for email_data in emails)
+    with FakeIMAPServer(raw_emails, compress=server_compress) as server:
+        gmail_client = Gmail(
+            "test@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+            compress=compress,
+        )
+        fetched = gmail_client.read_emails(search_string="ALL", limit=None, raise_errors=True)
+    return fetched, server
+
+
+def test_compressed_fetch_moves_fewer_bytes(enabled_metrics):
+    """Test that a compressed fetch returns the same emails over fewer bytes."""
+    compressed, server = _fetch(compress=True)
+    report = enabled_metrics.report()
+    enabled_metrics.disable()
+    plain, plain_server = _fetch(compress=False)
+
+    assert [email_data["body"] for email_data in compressed] == [
+        email_data["body"] for email_data in plain
+    ]
+    assert server.counters["COMPRESS"] == 1
+    assert plain_server.counters["COMPRESS"] == 0
+    assert server.bytes_sent * 4 < plain_server.bytes_sent
+
+    counters = {
+        (counter["name"], counter["labels"].get("direction")): counter["value"]
+        for counter in report["counters"]
+    }
+    assert counters[("imap.compressed_connections", None)] == 1
+    # The greeting and capabilities are exchanged before the login
+    assert counters[("imap.wire_bytes", "received")] <= server.bytes_sent
+    assert counters[("imap.wire_bytes", "sent")] <= server.bytes_received
+    assert counters[("imap.payload_bytes", "received")] > server.bytes_sent
+
+
+def test_uncompressed_when_not_advertised():
+    """Test that the client does not send COMPRESS to servers without it."""
+    fetched, server = _fetch(compress=True, server_compress=False)
+    assert len(fetched) == 20
+    assert server.counters["COMPRESS"] == 0
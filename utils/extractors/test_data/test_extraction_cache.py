@@ -0,0 +1,93 @@
+"""
+Pytest tests for the memoization of extraction results.
+"""
+
+import importlib
+import sys
+
+from utils.extractors import TransactionExtractor
+from utils.extractors.cache import ExtractionCache, extractor_version
+from utils.extractors.grab import GrabEmailExtractor
+from utils.extractors.test_data.synthetic import generate_emails
+
+
+def test_repeat_extraction_is_memoized():
+    """Test that an unchanged email is only extracted once."""
+    email_data = generate_emails("Grab", "GrabRide", count=1, seed=4)[0]
+    transaction_extractor = TransactionExtractor()
+
+    first = transaction_extractor.extract_from_email(
+        "Grab", email_data["body"], email_data["subject"]
+    )
+    second = transaction_extractor.extract_from_email(
+        "Grab", email_data["body"], email_data["subject"]
+    )
+
+    assert first == second
+    assert first is not second
+    assert transaction_extractor.cache.hits == 1
+    assert transaction_extractor.cache.misses == 1
+
+
+def test_cache_evicts_least_recently_used():
+    """Test that the in-memory tier keeps at most max_entries results."""
+    emails = generate_emails("Grab", "GrabFood", count=3, seed=4)
+    transaction_extractor = TransactionExtractor(cache_size=2)
+
+    for email_data in emails:
+        transaction_extractor.extract_transaction("Grab", email_data)
+
+    assert len(transaction_extractor.cache.entries) == 2
+
+
+def test_persistent_tier_survives_restarts(tmp_path):
+    """Test that results written by one run are read back by the next."""
+    path = str(tmp_path / "cache.db")
+    email_data = generate_emails("Grab", "GrabFood", count=1, seed=5)[0]
+
+    first = TransactionExtractor(cache_path=path)
+    expected = first.extract_transaction("Grab", email_data)
+    first.close()
+
+    second = TransactionExtractor(cache_path=path)
+    assert second.extract_transaction("Grab", email_data) == expected
+    assert second.cache.hits == 1
+    second.close()
+
+
+def test_version_changes_with_extractor_configuration():
+    """Test that the key of an email changes when the extractor changes."""
+    default = GrabEmailExtractor()
+    other = GrabEmailExtractor(merchant_email="receipts@grab.com")
+
+    assert extractor_version(default) == extractor_version(GrabEmailExtractor())
+    assert extractor_version(default) != extractor_version(other)
+    assert ExtractionCache.key(default, "body", "subject") != ExtractionCache.key(
+        other, "body", "subject"
+    )
+
+
+def test_version_changes_with_module_code(tmp_path, monkeypatch):
+    """Test that editing module-level code an extractor uses changes its version."""
+    module_path = tmp_path / "custom_extractor.py"
+
+    def load(pattern: str) -> GrabEmailExtractor:
+        module_path.write_text(
+            "import re\n"
+            "from utils.extractors.grab import GrabEmailExtractor\n"
+            f"AMOUNT_PATTERN = re.compile({pattern!r})\n"
+            "class CustomEmailExtractor(GrabEmailExtractor):\n"
+            "    pass\n"
+        )
+        if "custom_extractor" in sys.modules:
+            module = importlib.reload(sys.modules["custom_extractor"])
+        else:
+            module = importlib.import_module("custom_extractor")
+        return module.CustomEmailExtractor()
+
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "custom_extractor", raising=False)
+    first = load(r"PHP ([\d.]+)")
+    assert extractor_version(first) == extractor_version(load(r"PHP ([\d.]+)"))
+    assert extractor_version(first) != extractor_version(load(r"PHP ([\d,.]+)"))
+    assert extractor_version(first) != extractor_version(GrabEmailExtractor())
@@ -0,0 +1,70 @@
+"""
+Pytest tests for the HTTP extraction service.
+"""
+
+import http.client
+import json
+import threading
+
+import pytest
+
+from utils.extraction_service import ExtractionService
+from utils.extractors.test_data.synthetic import generate_emails, to_rfc822
+
+
+@pytest.fixture(scope="module")
+def service():
+    with ExtractionService(workers=2, max_request_bytes=64 * 1024) as service:
+        server = service.make_server(0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server.server_address[1]
+        server.shutdown()
+        server.server_close()
+
+
+def _post(port: int, body: bytes, content_type: str) -> tuple[int, dict]:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("POST", "/extract", body, {"Content-Type": content_type})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_extracts_raw_and_batched_emails(service):
+    """Test that raw RFC822 and body+subject emails extract as in-process."""
+    ride, food = generate_emails("Grab", "GrabRide", count=2, seed=1)
+
+    status, result = _post(service, to_rfc822(ride), "message/rfc822")
+    assert status == 200
+    assert result["extractor"] == "Grab"
+    assert result["card_number"] == ride["expected"]["card_number"]
+    assert result["amount"] == ride["expected"]["amount"]
+
+    batch = {
+        "emails": [
+            {"body": food["body"], "subject": food["subject"], "from": food["from"]},
+            {"raw": to_rfc822(ride).decode()},
+            {"body": "Hello", "subject": "Hi", "from": "someone@example.com"},
+            {"subject": "No body"},
+        ]
+    }
+    status, response = _post(service, json.dumps(batch).encode(), "application/json")
+    assert status == 200
+    results = response["results"]
+    assert [item["extractor"] for item in results] == ["Grab", "Grab", None, None]
+    assert results[0]["card_number"] == food["expected"]["card_number"]
+    assert results[1] == result
+    assert "error" in results[2] and "error" in results[3]
+
+
+def test_rejects_oversized_and_unsupported_requests(service):
+    """Test the request size limit and the accepted content types."""
+    status, response = _post(service, b"x" * (64 * 1024 + 1), "application/json")
+    assert status == 413
+    assert "limited" in response["error"]
+
+    assert _post(service, b"hello", "text/plain")[0] == 415
+    assert _post(service, b"{", "application/json")[0] == 400
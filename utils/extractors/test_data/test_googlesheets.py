@@ -0,0 +1,108 @@
+"""
+Pytest tests for the statement cycle worksheets against the fake Sheets API.
+"""
+
+from datetime import datetime
+
+import gspread
+import pytest
+
+from benchmarks.fake_sheets import FakeSheetsSession
+from utils.googlesheets import SheetManager, statement_cycle_key
+from utils.records import TransactionRecord
+
+
+@pytest.mark.parametrize(
+    "date, expected",
+    [
+        # Before the statement day of January: the cycle started last December
+        (datetime(2025, 1, 10), "20241215"),
+        # On the statement day: a new cycle starts
+        (datetime(2025, 1, 15, 0, 0, 1), "20250115"),
+        (datetime(2025, 2, 14, 23, 59), "20250115"),
+        (datetime(2025, 12, 31), "20251215"),
+    ],
+)
+def test_statement_cycle_key(date, expected):
+    """Test that a date belongs to the cycle starting on the last statement day."""
+    assert statement_cycle_key(date, 15) == expected
+
+
+def _record(date: datetime, merchant: str) -> TransactionRecord:
+    return TransactionRecord(
+        date=date, card_number="4321", total_paid_amount=100.5, merchant=merchant
+    )
+
+
+def test_transactions_are_uploaded_to_the_worksheet_of_their_cycle(tmp_path, monkeypatch):
+    """Test that a batch spanning two cycles creates one worksheet and writes once."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PAYER_USERS", "me,others")
+    session = FakeSheetsSession()
+    spreadsheet_id = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+    sheet_client.create_logger_sheet("TEST", spreadsheet_id, 15, date=datetime(2025, 1, 20))
+
+    session.reset_counters()
+    uploaded = sheet_client.update_logger_sheets(
+        prefix="TEST",
+        spreadsheet_id=spreadsheet_id,
+        statement_day=15,
+        records=[
+            _record(datetime(2025, 2, 15, 9, 30), "Statement day"),
+            _record(datetime(2025, 1, 20, 12, 0), "January"),
+            _record(datetime(2025, 2, 1, 8, 0), "February"),
+        ],
+    )
+
+    assert uploaded == {"TEST_20250115": 2, "TEST_20250215": 1}
+    assert session.calls["POST values:batchUpdate"] == 1
+    assert session.calls["GET values:batchGet"] == 1
+
+    sheets = {
+        sheet["properties"]["title"]: sheet["values"]
+        for sheet in session.spreadsheets[spreadsheet_id].sheets
+    }
+    assert [title for title in sheets if title.startswith("TEST_")] == [
+        "TEST_20250215",
+        "TEST_20250115",
+    ]
+    # Headers first, then the rows in the order of the batch
+    assert [row[5] for row in sheets["TEST_20250115"][1:]] == ["January", "February"]
+    assert [row[5] for row in sheets["TEST_20250215"][1:]] == ["Statement day"]
+    assert sheets["TEST_20250215"][1][:4] == [False, "2025-02-15 09:30:00", "4321", 100.5]
+    assert sheets["TEST_20250215"][1][7] == "me"
+
+
+def test_new_cycle_worksheets_are_created_in_the_same_batch(tmp_path, monkeypatch):
+    """Test that a backfill into a new spreadsheet takes the same calls for any cycle count."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PAYER_USERS", "me,others")
+    session = FakeSheetsSession()
+    spreadsheet_id = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+
+    uploaded = sheet_client.update_logger_sheets(
+        prefix="TEST",
+        spreadsheet_id=spreadsheet_id,
+        statement_day=15,
+        records=[
+            _record(datetime(2024, month, 20), f"Month {month}") for month in range(1, 13)
+        ],
+    )
+
+    assert len(uploaded) == 12
+    assert session.calls == {
+        "GET metadata": 2,
+        "POST :batchUpdate": 1,
+        "POST values:batchUpdate": 1,
+    }
+    sheets = session.spreadsheets[spreadsheet_id].sheets
+    titles = [sheet["properties"]["title"] for sheet in sheets]
+    # Newest cycle first, after the first two worksheets
+    assert titles == ["Summary", "Categories"] + [
+        f"TEST_2024{month:02d}15" for month in range(12, 0, -1)
+    ]
+    for sheet in sheets[2:]:
+        assert sheet["values"][0][:3] == ["paid", "date", "card_number"]
+        assert sheet["values"][1][5] == f"Month {int(sheet['properties']['title'][9:11])}"
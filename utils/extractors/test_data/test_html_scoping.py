@@ -0,0 +1,62 @@
+"""
+Pytest tests for HTML trimming and route scoped parsing.
+"""
+
+from bs4 import BeautifulSoup
+
+from utils.extractors.base import scope_html, trim_html
+from utils.extractors.grab import GrabEmailExtractor
+from utils.extractors.test_data.synthetic import generate_emails
+
+
+def test_trim_html_removes_boilerplate():
+    """Test that head, styles, scripts and comments are removed."""
+    html = (
+        "<html><head><title>Receipt</title><style>td {}</style></head>"
+        "<body><!--[if mso]><table></table><![endif]--><header>Top</header>"
+        "<p>Total</p><script>track()</script></body></html>"
+    )
+
+    assert trim_html(html) == "<html><body><header>Top</header><p>Total</p></body></html>"
+
+
+def test_scope_html_keeps_innermost_tables():
+    """Test that each anchor selects its innermost complete table, in order."""
+    card = '<table id="card"><tr><td>Paid by 1234</td></tr></table>'
+    total = '<table id="total"><tr><td>Total Paid</td><td>P 10.00</td></tr></table>'
+    html = f"<table><tr><td>{total}</td></tr><tr><td>{card}</td></tr></table><p>Footer</p>"
+
+    assert scope_html(html, ("Paid by", "Total Paid")) == total + card
+    assert scope_html(html, ("Total Paid", "Total Paid")) == total
+    assert scope_html(html, ("Missing",)) is None
+    assert scope_html(html, ("Footer",)) is None
+
+
+def test_scoped_parsing_matches_full_parsing():
+    """Test that scoped routes give the results of parsing the whole email."""
+    extractor = GrabEmailExtractor()
+    for route in ("GrabFood", "GrabRide"):
+        for email in generate_emails("Grab", route, count=10, seed=3):
+            full = extractor.extract_from_html(
+                BeautifulSoup(email["body"], "html.parser"), email["subject"]
+            )
+
+            assert extractor.extract_payment_info(email["body"], email["subject"]) == full
+
+
+def test_scoped_miss_falls_back_to_the_whole_email():
+    """Test that a route missing in its tables is retried on the whole email."""
+    extractor = GrabEmailExtractor()
+    # The first "TOTAL (INCL. TAX)" is now a table without the amount
+    email = generate_emails("Grab", "GrabFood", count=1, seed=3)[0]
+    body = email["body"].replace(
+        "<body>", "<body><table><tr><td>TOTAL (INCL. TAX)</td></tr></table>", 1
+    )
+    assert "<td>TOTAL (INCL. TAX)</td>" in scope_html(
+        trim_html(body), extractor.html_scopes["GrabFood"]
+    )
+
+    result = extractor.extract_payment_info(body, email["subject"])
+
+    assert result.card_number == email["expected"]["card_number"]
+    assert result.amount == email["expected"]["amount"]
@@ -0,0 +1,97 @@
+"""
+Pytest tests for reading offline mail exports.
+"""
+
+import mailbox
+import re
+from email import message_from_bytes
+
+import pytest
+
+from utils.extractors.test_data.synthetic import generate_emails, to_rfc822
+from utils.ingest import ingest_messages, iter_mbox, iter_messages
+
+NOTE = (
+    b"From: Me <me@example.com>\n"
+    b"Subject: Note\n"
+    b"Date: Mon, 01 Jan 2024 09:00:00 +0800\n"
+    b"\n"
+    b"Lines that look like separators:\n"
+    b"From here on it is quoted once\n"
+    b">From there it is quoted twice\n"
+    b"The end\n"
+)
+
+
+def _receipts(count: int = 3) -> list[bytes]:
+    return [
+        to_rfc822(email_data)
+        for email_data in generate_emails(
+            "Grab", "GrabRide", count=count, seed=1, card_number="4321"
+        )
+    ]
+
+
+def _write_mboxrd(path, messages: list[bytes]) -> None:
+    """Write messages as mboxrd, quoting body lines that start with >*From"""
+    with open(path, "wb") as file:
+        for message in messages:
+            file.write(b"From sender@example.com Mon Jan  1 00:00:00 2024\n")
+            file.write(re.sub(rb"^(>*From )", rb">\1", message, flags=re.MULTILINE))
+            file.write(b"\n")
+
+
+def test_iter_mbox_matches_mailbox_module(tmp_path):
+    """Test that the mmap splitter finds the same messages as mailbox.mbox."""
+    messages = [_receipts(1)[0], NOTE, _receipts(2)[1]]
+    path = tmp_path / "export.mbox"
+    _write_mboxrd(path, messages)
+
+    raw_emails = list(iter_mbox(str(path)))
+    expected = list(mailbox.mbox(str(path), create=False))
+
+    assert len(raw_emails) == len(expected) == 3
+    for raw_email, message in zip(raw_emails, expected):
+        parsed = message_from_bytes(raw_email)
+        assert parsed["Message-ID"] == message["Message-ID"]
+        assert parsed["Subject"] == message["Subject"]
+    # mailbox.mbox leaves the body quoted, iter_mbox undoes one level of quoting
+    assert expected[1].get_payload().splitlines()[1:3] == [
+        ">From here on it is quoted once",
+        ">>From there it is quoted twice",
+    ]
+    assert raw_emails[1] == NOTE + b"\n"
+
+
+def test_iter_messages_reads_maildirs_and_eml_directories(tmp_path):
+    """Test that the export format is recognized from the path."""
+    messages = _receipts()
+
+    maildir = mailbox.Maildir(str(tmp_path / "maildir"), create=True)
+    for message in messages:
+        maildir.add(message)
+    assert sorted(iter_messages(str(tmp_path / "maildir"))) == sorted(messages)
+
+    for i, message in enumerate(messages):
+        eml_dir = tmp_path / "eml" / f"folder{i % 2}"
+        eml_dir.mkdir(parents=True, exist_ok=True)
+        (eml_dir / f"{i}.eml").write_bytes(message)
+    (tmp_path / "eml" / "notes.txt").write_text("not an email")
+    assert sorted(iter_messages(str(tmp_path / "eml"))) == sorted(messages)
+
+    with pytest.raises(FileNotFoundError):
+        iter_messages(str(tmp_path / "missing"))
+
+
+def test_ingest_messages_extracts_the_transactions_of_an_export(tmp_path):
+    """Test that receipts are extracted and other emails are skipped."""
+    receipts = _receipts()
+    path = tmp_path / "export.mbox"
+    _write_mboxrd(path, [receipts[0], NOTE, *receipts[1:]])
+
+    records = ingest_messages(str(path), workers=1, chunk_size=2)
+
+    assert sorted(record.message_id for record in records) == sorted(
+        message_from_bytes(receipt)["Message-ID"] for receipt in receipts
+    )
+    assert all(record.card_number == "4321" for record in records)
@@ -0,0 +1,141 @@
+"""
+Pytest tests for the lazy extractor registry and lazy imports.
+"""
+
+import os
+import subprocess
+import sys
+
+from utils.extractors import TransactionExtractor
+from utils.extractors.grab import GrabEmailExtractor
+from utils.extractors.registry import ExtractorRegistry
+
+GREENGSM_ROUTE = "RECEIPT FOR YOUR PAYMENT TO GREEN AND SMART MOBILITY PHILIPPINES INC."
+
+
+def test_registry_constructs_extractors_on_first_use():
+    """Test that extractors are only constructed when accessed, then reused."""
+    constructed = []
+
+    def factory():
+        constructed.append(1)
+        return GrabEmailExtractor()
+
+    registry = ExtractorRegistry(
+        {"Grab": factory, "Metrobank": "utils.extractors.metrobank:MetrobankEmailExtractor"}
+    )
+
+    assert list(registry) == ["Grab", "Metrobank"]
+    assert "Grab" in registry
+    assert constructed == []
+
+    assert registry["Grab"] is registry["Grab"]
+    assert constructed == [1]
+    assert not registry.is_loaded("Metrobank")
+    assert type(registry["Metrobank"]).__name__ == "MetrobankEmailExtractor"
+    assert registry.get("Unknown") is None
+
+
+def test_importing_extractors_skips_heavy_dependencies():
+    """Test that importing the extractors package loads no extractor or heavy module."""
+    code = (
+        "import sys\n"
+        "from utils.extractors import EXTRACTOR_REGISTRY\n"
+        "heavy = {'pandas', 'bs4', 'gspread', 'utils.extractors.grab'}\n"
+        "print(sorted(heavy & set(sys.modules)))\n"
+    )
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../"))
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=root
+    )
+
+    assert result.stdout.strip() == "[]"
+
+
+def test_manifest_senders_match_extractors(extractor_registry):
+    """Test that every manifest sender is the sender its extractor expects."""
+    for sender, merchants in extractor_registry.senders.items():
+        for merchant in merchants:
+            assert extractor_registry[merchant].merchant_email.lower() == sender
+
+
+def test_routes_by_sender_without_constructing(tmp_path):
+    """Test that manifest senders route emails before any extractor is built."""
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        '{"extractors": [{"merchant": "Grab", "sender": "No-Reply@grab.com",'
+        ' "extractor": "utils.extractors.grab:GrabEmailExtractor"}]}'
+    )
+    registry = ExtractorRegistry.from_manifest(str(manifest))
+
+    assert registry.merchant_for_sender("no-reply@grab.com") == "Grab"
+    assert registry.merchant_for_sender("someone@example.com") is None
+    assert not registry.is_loaded("Grab")
+
+
+def test_entry_point_extractors_are_discovered(monkeypatch):
+    """Test that entry point extractors are found and routed by their sender."""
+    from importlib.metadata import EntryPoint
+
+    entry_point = EntryPoint(
+        name="Metrobank",
+        value="utils.extractors.metrobank:MetrobankEmailExtractor",
+        group="test.extractors",
+    )
+    monkeypatch.setattr(
+        "importlib.metadata.entry_points",
+        lambda group: [entry_point] if group == "test.extractors" else [],
+    )
+    registry = ExtractorRegistry(entry_point_group="test.extractors")
+
+    assert "Metrobank" in registry
+    assert not registry.is_loaded("Metrobank")
+    assert (
+        registry.merchant_for_sender("customerservice@metrobankcard.com") == "Metrobank"
+    )
+
+
+def test_shared_sender_routes_by_subject(tmp_path, monkeypatch):
+    """Test that a shared sender is fetched once and each email has one extractor."""
+    from utils.extractors.test_data.synthetic import generate_emails
+    from utils.pipeline import fetch_transactions
+
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        '{"extractors": ['
+        '{"merchant": "GreenGSM", "sender": "noreply@2c2p.com", "subject": "GREEN AND SMART",'
+        ' "extractor": "utils.extractors.greengsm:GreenGSMEmailExtractor"},'
+        '{"merchant": "Parking", "sender": "noreply@2c2p.com", "subject": "^receipt .* parking",'
+        ' "extractor": "utils.extractors.greengsm:GreenGSMEmailExtractor"},'
+        '{"merchant": "Grab", "sender": "no-reply@grab.com",'
+        ' "extractor": "utils.extractors.grab:GrabEmailExtractor"}]}'
+    )
+    registry = ExtractorRegistry.from_manifest(str(manifest))
+    monkeypatch.setattr("utils.extractors.EXTRACTOR_REGISTRY", registry)
+
+    assert registry.group_by_sender(["GreenGSM", "Grab", "Parking"]) == {
+        "noreply@2c2p.com": ["GreenGSM", "Parking"],
+        "no-reply@grab.com": ["Grab"],
+    }
+    assert registry.merchant_for_email("noreply@2c2p.com", "Receipt for City Parking") == "Parking"
+    assert registry.merchant_for_email("noreply@2c2p.com", "Your statement") is None
+    assert registry.merchant_for_email("no-reply@grab.com", "Anything") == "Grab"
+
+    receipt = generate_emails("GreenGSM", GREENGSM_ROUTE, count=1, seed=2)[0]
+    parking = dict(receipt, subject="RECEIPT FOR YOUR PAYMENT TO CITY PARKING")
+
+    class FakeGmail:
+        senders = []
+
+        def read_emails_filtered(self, sender, date_interval, limit, **filters):
+            self.senders.append(sender)
+            return [receipt, parking] if sender == "noreply@2c2p.com" else []
+
+    gmail_client = FakeGmail()
+    records = fetch_transactions(
+        gmail_client, TransactionExtractor(cache_size=0), ["GreenGSM", "Parking"], None
+    )
+
+    assert gmail_client.senders == ["noreply@2c2p.com"]
+    # The parking email went to the Parking extractor only, which rejects it
+    assert [record.source for record in records] == ["GreenGSM"]
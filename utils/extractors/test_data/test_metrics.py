@@ -0,0 +1,64 @@
+"""
+Pytest tests for the run metrics collected around extraction.
+"""
+
+import json
+
+from utils.extractors import TransactionExtractor
+from utils.extractors.test_data.synthetic import generate_emails
+from utils.metrics import Metrics
+
+
+def test_disabled_metrics_record_nothing():
+    """Test that a disabled collector ignores counters and spans."""
+    collector = Metrics()
+    collector.incr("imap.messages")
+    with collector.span("imap.fetch"):
+        pass
+
+    assert collector.report()["counters"] == []
+    assert collector.report()["spans"] == []
+
+
+def test_extraction_counts_route_hits(enabled_metrics):
+    """Test that route hits and extracted emails are counted per merchant."""
+    emails = generate_emails("Grab", "GrabRide", count=5, seed=1)
+    transaction_extractor = TransactionExtractor()
+    for email_data in emails:
+        transaction_extractor.extract_transaction("Grab", email_data)
+
+    report = enabled_metrics.report()
+    counters = {
+        (c["name"], tuple(sorted(c["labels"].items()))): c["value"]
+        for c in report["counters"]
+    }
+    assert counters[
+        (
+            "extractor.route",
+            (("extractor", "GrabEmailExtractor"), ("result", "hit"), ("route", "GrabRide")),
+        )
+    ] == 5
+    assert counters[
+        ("extractor.emails", (("merchant", "Grab"), ("result", "extracted")))
+    ] == 5
+    spans = {s["name"]: s for s in report["spans"]}
+    assert spans["extractor.extract"]["count"] == 5
+
+
+def test_metrics_reports(enabled_metrics, tmp_path):
+    """Test the JSON report and the Prometheus textfile output."""
+    enabled_metrics.incr("sheets.api_calls", method="POST")
+    enabled_metrics.incr("sheets.api_calls", 2, method="POST")
+    enabled_metrics.observe("sheets.write", 0.5)
+
+    enabled_metrics.write_report(str(tmp_path / "report.json"))
+    enabled_metrics.write_prometheus(str(tmp_path / "metrics.prom"))
+
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert report["counters"] == [
+        {"name": "sheets.api_calls", "labels": {"method": "POST"}, "value": 3}
+    ]
+    prometheus = (tmp_path / "metrics.prom").read_text().splitlines()
+    assert 'cc_logger_sheets_api_calls_total{method="POST"} 3' in prometheus
+    assert "cc_logger_sheets_write_seconds_sum 0.500000" in prometheus
+    assert "cc_logger_sheets_write_seconds_count 1" in prometheus
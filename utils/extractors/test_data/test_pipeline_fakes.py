@@ -0,0 +1,263 @@
+"""
+Pytest tests for the pipeline against the fake IMAP and Sheets servers.
+
+Runs fetch, record and upload end to end on a small synthetic mailbox, which
+is what benchmarks/bench_pipeline.py measures at larger sizes.
+"""
+
+from datetime import timedelta
+from functools import partial
+
+import gspread
+import pytest
+
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.fake_sheets import FakeSheetsSession
+from utils.extractors import TransactionExtractor, search_subjects
+from utils.extractors.test_data.synthetic import (
+    generate_corpus,
+    generate_emails,
+    to_rfc822,
+)
+from utils.gmail import Gmail, filtered_search_string
+from utils.googlesheets import SheetManager
+from utils.pipeline import run_logger
+from utils.staged import run_logger_staged
+from utils.store import TransactionStore
+
+
+@pytest.mark.parametrize(
+    "run",
+    [run_logger, partial(run_logger_staged, batch_rows=5, queue_size=4)],
+    ids=["sequential", "staged"],
+)
+def test_pipeline_end_to_end(tmp_path, run, make_card):
+    """Test that every extracted transaction lands in its cycle worksheet once."""
+    card = make_card(MERCHANTS=["Grab", "Metrobank", "GreenGSM"])
+    corpus = [
+        email_data
+        for email_data in generate_corpus(60, seed=1, card_number=card.LAST_DIGITS)
+        if email_data["merchant"] in card.MERCHANTS
+    ]
+    expected = sum(email_data["expected"] is not None for email_data in corpus)
+    date_interval = [
+        corpus[0]["date"] - timedelta(days=1),
+        corpus[-1]["date"] + timedelta(days=1),
+    ]
+
+    session = FakeSheetsSession()
+    card.GOOGLE_SHEET_ID = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in corpus) as server:
+        gmail_client = Gmail(
+            "test@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+        )
+        with TransactionStore(str(tmp_path / "transactions.db")) as store:
+            uploaded = run(
+                card,
+                gmail_client,
+                sheet_client,
+                TransactionExtractor(),
+                store,
+                date_interval,
+                limit=None,
+            )
+            # A second run finds nothing new to upload
+            assert (
+                run(
+                    card,
+                    gmail_client,
+                    sheet_client,
+                    TransactionExtractor(),
+                    store,
+                    date_interval,
+                    limit=None,
+                )
+                == 0
+            )
+
+    spreadsheet = session.spreadsheets[card.GOOGLE_SHEET_ID]
+    rows = [
+        row
+        for sheet in spreadsheet.sheets
+        if sheet["properties"]["title"].startswith("TEST_")
+        for row in sheet["values"][1:]
+    ]
+    assert uploaded == expected
+    assert len(rows) == expected
+
+
+def test_staged_pipeline_stops_on_extraction_error(tmp_path, make_card):
+    """Test that an extraction error stops every stage and is raised."""
+    card = make_card(MERCHANTS=["Grab", "Metrobank", "GreenGSM"])
+    corpus = generate_corpus(40, seed=2, card_number=card.LAST_DIGITS)
+    date_interval = [
+        corpus[0]["date"] - timedelta(days=1),
+        corpus[-1]["date"] + timedelta(days=1),
+    ]
+
+    class FailingExtractor(TransactionExtractor):
+        def extract_transaction(self, merchant, email_data):
+            raise ValueError("broken template")
+
+    session = FakeSheetsSession()
+    card.GOOGLE_SHEET_ID = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in corpus) as server:
+        gmail_client = Gmail(
+            "test@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+        )
+        with TransactionStore(str(tmp_path / "transactions.db")) as store:
+            with pytest.raises(ValueError, match="broken template"):
+                run_logger_staged(
+                    card,
+                    gmail_client,
+                    sheet_client,
+                    FailingExtractor(),
+                    store,
+                    date_interval,
+                    limit=None,
+                    queue_size=2,
+                )
+
+
+def test_gmail_search_filters_subjects():
+    """Test that emails no extractor reads are left out by the search itself."""
+    corpus = generate_corpus(60, seed=4)
+    date_interval = [
+        corpus[0]["date"] - timedelta(days=1),
+        corpus[-1]["date"] + timedelta(days=1),
+    ]
+    subjects, excluded_subjects = search_subjects(["Grab"])
+    assert subjects == ["Your Grab E-Receipt"]
+    assert search_subjects(["Metrobank"]) == (["Transaction Notification"], [])
+
+    query = filtered_search_string(
+        "no-reply@grab.com",
+        date_interval,
+        ["Your Grab E-Receipt", 'Say "hi"'],
+        ["Promo"],
+        "-category:promotions",
+    )
+    assert query.endswith(
+        ' {subject:\\"Your Grab E-Receipt\\" subject:\\"Say hi\\"}'
+        ' -subject:\\"Promo\\" -category:promotions"'
+    )
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in corpus) as server:
+        gmail_client = Gmail(
+            "test@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+        )
+        # Receipts Gmail files under Promotions are searched by default
+        assert gmail_client.exclusion_terms() == ""
+        emails = gmail_client.read_emails_filtered(
+            sender="no-reply@grab.com",
+            date_interval=date_interval,
+            limit=None,
+            subjects=subjects,
+            excluded_subjects=excluded_subjects,
+        )
+
+    receipts = [e for e in corpus if e["merchant"] == "Grab" and e["route"] != "noise"]
+    assert len(receipts) < sum(e["merchant"] == "Grab" for e in corpus)
+    assert sorted(e["message_id"] for e in emails) == sorted(
+        e["message_id"] for e in receipts
+    )
+
+
+@pytest.mark.parametrize(
+    "run",
+    [run_logger, partial(run_logger_staged, batch_rows=5, queue_size=4)],
+    ids=["sequential", "staged"],
+)
+def test_processed_label_makes_reruns_fetch_nothing(tmp_path, run, make_card):
+    """Test that processed emails are labeled and left out of the next search."""
+    card = make_card(MERCHANTS=["Grab", "Metrobank", "GreenGSM"])
+    corpus = [
+        email_data
+        for email_data in generate_corpus(40, seed=5, card_number=card.LAST_DIGITS)
+        if email_data["merchant"] in card.MERCHANTS
+    ]
+    date_interval = [
+        corpus[0]["date"] - timedelta(days=1),
+        corpus[-1]["date"] + timedelta(days=1),
+    ]
+    session = FakeSheetsSession()
+    card.GOOGLE_SHEET_ID = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in corpus) as server:
+        gmail_client = Gmail(
+            "test@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+            processed_label="cc-logger/processed",
+        )
+        with TransactionStore(str(tmp_path / "transactions.db")) as store:
+            args = (card, gmail_client, sheet_client, TransactionExtractor(), store)
+            uploaded = run(*args, date_interval, limit=None)
+            labeled = [m for m in server.messages if "cc-logger/processed" in m.labels]
+
+            server.reset_counters()
+            assert run(*args, date_interval, limit=None) == 0
+
+    assert uploaded == sum(email_data["expected"] is not None for email_data in corpus)
+    # Every email the searches matched, receipts or not, is labeled
+    assert len(labeled) >= uploaded
+    assert server.counters["UID FETCH"] == 0
+
+
+@pytest.mark.parametrize(
+    "run",
+    [run_logger, partial(run_logger_staged, batch_rows=5, queue_size=4)],
+    ids=["sequential", "staged"],
+)
+def test_processed_label_leaves_the_emails_of_other_cards(tmp_path, run, make_card):
+    """Test that a card's run does not label the emails of another card in the mailbox."""
+    card = make_card(MERCHANTS=["Grab", "Metrobank", "GreenGSM"])
+    other_card = make_card(MERCHANTS=["Metrobank"], LAST_DIGITS="8765", PREFIX="OTHER")
+
+    emails = generate_emails(
+        "Metrobank", "Transaction Notification", count=10, seed=6, card_number="8765"
+    )
+    date_interval = [
+        emails[0]["date"] - timedelta(days=1),
+        emails[-1]["date"] + timedelta(days=1),
+    ]
+    session = FakeSheetsSession()
+    card.GOOGLE_SHEET_ID = other_card.GOOGLE_SHEET_ID = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in emails) as server:
+        gmail_client = Gmail(
+            "test@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+            processed_label="cc-logger/processed",
+        )
+        with TransactionStore(str(tmp_path / "transactions.db")) as store:
+            args = (gmail_client, sheet_client, TransactionExtractor(), store, date_interval)
+            assert run(card, *args, limit=None) == 0
+            assert not any(message.labels for message in server.messages)
+
+            assert run(other_card, *args, limit=None) == len(emails)
+
+    assert all("cc-logger/processed" in message.labels for message in server.messages)
@@ -0,0 +1,112 @@
+"""
+Pytest tests for the stage and extractor route profiler.
+"""
+
+from datetime import datetime, timedelta
+
+import gspread
+import pytz
+
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.fake_sheets import FakeSheetsSession
+from utils.extractors import TransactionExtractor
+from utils.extractors.test_data.synthetic import generate_emails, to_rfc822
+from utils.gmail import Gmail
+from utils.googlesheets import SheetManager
+from utils.profiling import profiler
+from utils.service import run_card
+from utils.store import TransactionStore
+
+
+def test_profiler_writes_scope_and_slowest_profiles(tmp_path):
+    """Test that stages, routes and the slowest emails get their own profiles."""
+    emails = generate_emails("Grab", "GrabFood", count=10, seed=2)
+    transaction_extractor = TransactionExtractor()
+
+    profiler.enable(str(tmp_path), memory=True, slowest=3)
+    try:
+        with profiler.scope("stage:extract"):
+            for email_data in emails:
+                transaction_extractor.extract_transaction("Grab", email_data)
+        summary_path = profiler.write_report(
+            replay=TransactionExtractor(cache_size=0).extract_transaction
+        )
+    finally:
+        profiler.disable()
+
+    assert profiler.scopes["stage:extract"].calls == 1
+    assert profiler.scopes["route:GrabEmailExtractor.GrabFood"].calls == 10
+    assert (tmp_path / "stage_extract.pstats").exists()
+    assert (tmp_path / "route_GrabEmailExtractor.GrabFood.pstats").exists()
+    assert (tmp_path / "profile.pstats").exists()
+    assert len(list((tmp_path / "slowest").iterdir())) == 3
+
+    summary = open(summary_path).read()
+    assert "== stage:extract: 1 calls" in summary
+    assert "== Slowest 3 emails" in summary
+
+
+def test_disabled_profiler_is_a_noop():
+    """Test that scopes are not recorded while the profiler is disabled."""
+    profiler.scopes = {}
+    with profiler.scope("stage:fetch"):
+        pass
+
+    assert profiler.scopes == {}
+
+
+def test_profiled_runs_are_sequential(tmp_path, monkeypatch):
+    """Test that a profiled run extracts on the profiled thread, not staged workers."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".env").write_text("")
+
+    class FakeCard:
+        NICKNAME = "Test"
+        MERCHANTS = ["Grab"]
+        LAST_DIGITS = "4321"
+        STATEMENT_DATE = "15"
+        PREFIX = "TEST"
+        GOOGLE_SHEET_ID = None
+        LAST_RUN_TIME_ENV_NAME = "TEST_PROFILING_LAST_RUNTIME"
+
+    monkeypatch.delenv(FakeCard.LAST_RUN_TIME_ENV_NAME, raising=False)
+    start_date = datetime.now(pytz.timezone("Asia/Manila")).replace(tzinfo=None)
+    emails = generate_emails(
+        "Grab",
+        "GrabFood",
+        count=3,
+        seed=2,
+        start_date=start_date - timedelta(days=3),
+        card_number=FakeCard.LAST_DIGITS,
+    )
+    session = FakeSheetsSession()
+    FakeCard.GOOGLE_SHEET_ID = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+
+    profiler.enable(str(tmp_path / "profile"), slowest=2)
+    try:
+        with FakeIMAPServer(to_rfc822(email_data) for email_data in emails) as server:
+            gmail_client = Gmail(
+                "test@example.com",
+                "password",
+                imap_server=server.host,
+                imap_port=server.port,
+                imap_ssl=False,
+            )
+            with TransactionStore(str(tmp_path / "transactions.db")) as store:
+                uploaded = run_card(
+                    FakeCard,
+                    gmail_client,
+                    sheet_client,
+                    TransactionExtractor(cache_size=0),
+                    store,
+                    connections=2,
+                    extract_workers=2,
+                )
+        profiler.write_report(replay=TransactionExtractor(cache_size=0).extract_transaction)
+    finally:
+        profiler.disable()
+
+    assert uploaded == len(emails)
+    assert profiler.scopes["route:GrabEmailExtractor.GrabFood"].calls == len(emails)
+    assert len(list((tmp_path / "profile" / "slowest").iterdir())) == 2
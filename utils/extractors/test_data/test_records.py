@@ -0,0 +1,87 @@
+"""
+Pytest tests for the transaction records and their DataFrame adapter.
+"""
+
+from datetime import datetime
+
+import pytz
+
+from utils.googlesheets import _build_rows
+from utils.records import (
+    TransactionRecord,
+    filter_card,
+    from_dataframe,
+    sort_by_date,
+    to_dataframe,
+)
+from utils.store import TransactionStore
+
+TZ = pytz.timezone("Asia/Manila")
+
+
+def make_records() -> list:
+    return [
+        TransactionRecord(
+            date=TZ.localize(datetime(2025, 5, 20, 9, 30)),
+            card_number="4321",
+            total_paid_amount=250.0,
+            merchant="Grab",
+            category="Transportation",
+            message_id="<b@test>",
+        ),
+        TransactionRecord(
+            date=TZ.localize(datetime(2025, 5, 2, 18, 0)),
+            card_number="4321",
+            total_paid_amount=None,
+            merchant="Foodpanda",
+            message_id="<a@test>",
+        ),
+        TransactionRecord(
+            date=TZ.localize(datetime(2025, 5, 10, 12, 0)),
+            card_number="9999",
+            total_paid_amount=99.5,
+            merchant="Grab",
+            message_id="<c@test>",
+        ),
+    ]
+
+
+def test_sort_filter_and_rows():
+    """Test that records are sorted, filtered by card and formatted as rows."""
+    records = sort_by_date(filter_card(make_records(), "4321"))
+
+    assert [record.message_id for record in records] == ["<a@test>", "<b@test>"]
+    assert _build_rows(records, ["payer"])[1] == [
+        False,
+        "2025-05-20 09:30:00",
+        "4321",
+        250.0,
+        False,
+        "Grab",
+        "Transportation",
+        "payer",
+        "",
+    ]
+
+
+def test_dataframe_round_trip():
+    """Test that the optional DataFrame adapter converts records both ways."""
+    records = make_records()
+
+    df = to_dataframe(records)
+    assert list(df["merchant"]) == ["Grab", "Foodpanda", "Grab"]
+    assert from_dataframe(df) == records
+
+
+def test_store_returns_records(tmp_path):
+    """Test that the store reads its transactions back as records."""
+    with TransactionStore(str(tmp_path / "transactions.db")) as store:
+        assert store.add_transactions(make_records(), statement_day=15) == 3
+        assert store.add_transactions(make_records(), statement_day=15) == 0
+
+        pending = store.pending("4321")
+
+    assert [record.message_id for record in pending] == ["<a@test>", "<b@test>"]
+    assert pending[0].cycle == "20250415"
+    assert pending[0].total_paid_amount is None
+    assert pending[1].date == make_records()[0].date
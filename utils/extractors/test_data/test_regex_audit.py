@@ -0,0 +1,81 @@
+"""
+Pytest tests for the regex audit and the per-email extraction time budget.
+"""
+
+import re
+import time
+
+from utils.extractors import TransactionExtractor
+from utils.extractors.base import TransactionData
+from utils.extractors.grab import GrabEmailExtractor
+from utils.extractors.test_data.regex_audit import (
+    audit_pattern,
+    audit_registered_extractors,
+    patterns_in_source,
+)
+from utils.extractors.test_data.synthetic import generate_emails
+
+
+def test_registered_extractors_use_linear_patterns(extractor_registry):
+    """Test that no extractor pattern can backtrack super-linearly."""
+    findings = audit_registered_extractors(extractor_registry)
+
+    assert findings == [], "\n".join(str(finding) for finding in findings)
+
+
+def test_audit_flags_super_linear_patterns():
+    """Test that nested and overlapping adjacent quantifiers are flagged."""
+    assert audit_pattern(r"(a+)+b")
+    assert audit_pattern(r"Order\s+Total\s*[\s\n]*₱\s*([0-9,.]+)")
+    assert audit_pattern(r"from\s+(.+?)\s+has been placed", re.DOTALL)
+
+    assert audit_pattern(r"[0-9.]+\s*PHP to ([^.]+)\.") == []
+    assert audit_pattern(r"from\s+(\S.{0,200}?)\s+has been placed", re.DOTALL) == []
+
+
+def test_patterns_are_found_with_their_flags():
+    """Test that literal patterns and their flags are read from the source."""
+    source = 'import re\nre.search(r"a.*b", text, re.IGNORECASE | re.DOTALL)\n'
+
+    assert patterns_in_source(source, "module.py") == [
+        ("module.py:2", "a.*b", re.IGNORECASE | re.DOTALL)
+    ]
+
+
+class SlowGrabEmailExtractor(GrabEmailExtractor):
+    def register_extractors(self) -> None:
+        super().register_extractors()
+        self.html_extractors = {"Slow": self._extract_slowly, **self.html_extractors}
+        self.html_scopes = {"Slow": ("Total Paid",), **self.html_scopes}
+
+    def _extract_slowly(self, soup, subject=None) -> TransactionData:
+        time.sleep(0.05)
+        return TransactionData()
+
+
+def test_time_budget_skips_slow_emails(enabled_metrics):
+    """Test that an email past its budget is skipped and its route reported."""
+    email_data = generate_emails("Grab", "GrabRide", count=1, seed=8)[0]
+    transaction_extractor = TransactionExtractor(time_budget=0.01, retry_budget=0.02)
+    transaction_extractor.extractors = {"Grab": SlowGrabEmailExtractor()}
+
+    assert transaction_extractor.extract_transaction("Grab", email_data) is None
+    # Timed out results are not memoized
+    assert len(transaction_extractor.cache.entries) == 0
+
+    counters = {
+        (c["name"], tuple(sorted(c["labels"].items()))): c["value"]
+        for c in enabled_metrics.report()["counters"]
+    }
+    # Retried once with the retry budget before it is skipped
+    for attempt in (1, 2):
+        assert counters[
+            (
+                "extractor.timeouts",
+                (("attempt", attempt), ("merchant", "Grab"), ("route", "Slow")),
+            )
+        ] == 1
+
+    # Without a budget the slow route is only slow
+    transaction_extractor.time_budget = 0
+    assert transaction_extractor.extract_transaction("Grab", email_data) is not None
@@ -0,0 +1,209 @@
+"""
+Pytest tests for the retries, timeouts and deadlines of the network calls.
+"""
+
+import imaplib
+import os
+import smtplib
+import time
+from datetime import datetime, timedelta
+
+import gspread
+import pytest
+import pytz
+
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.fake_sheets import FakeSheetsSession
+from utils.extractors import TransactionExtractor
+from utils.extractors.grab import GrabEmailExtractor
+from utils.extractors.test_data.synthetic import generate_emails, to_rfc822
+from utils.gmail import Gmail
+from utils.googlesheets import SheetManager
+from utils.pipeline import IncompleteRunError
+from utils.retry import Deadline, DeadlineExceeded, RetryPolicy, is_retryable
+from utils.service import run_card
+from utils.store import TransactionStore
+
+FAST_RETRIES = RetryPolicy(attempts=3, initial_delay=0.01, max_delay=0.01)
+
+
+class SlowGrabEmailExtractor(GrabEmailExtractor):
+    def _parse_html(self, html: str, scope: str):
+        time.sleep(0.05)
+        return super()._parse_html(html, scope)
+
+
+def _emails(count: int) -> list[dict]:
+    start_date = datetime.now(pytz.timezone("Asia/Manila")).replace(tzinfo=None)
+    return generate_emails(
+        "Grab",
+        "GrabRide",
+        count=count,
+        seed=1,
+        start_date=start_date - timedelta(days=6),
+        card_number="4321",
+    )
+
+
+def _gmail(server: FakeIMAPServer) -> Gmail:
+    return Gmail(
+        "test@example.com",
+        "password",
+        imap_server=server.host,
+        imap_port=server.port,
+        imap_ssl=False,
+        timeout=5,
+        retry_policy=FAST_RETRIES,
+    )
+
+
+def test_errors_are_classified():
+    assert is_retryable(imaplib.IMAP4.abort("socket error: EOF"))
+    assert is_retryable(TimeoutError("timed out"))
+    assert is_retryable(ConnectionResetError())
+    assert not is_retryable(imaplib.IMAP4.error("[AUTHENTICATIONFAILED] Invalid credentials"))
+    assert not is_retryable(DeadlineExceeded("The run took longer than 1s"))
+    assert not is_retryable(ValueError("bug"))
+
+
+def test_retries_stay_within_the_deadline():
+    policy = RetryPolicy(attempts=5, initial_delay=10, max_delay=10)
+    error = TimeoutError("timed out")
+    assert policy.next_delay(error, 1) >= 5
+    assert policy.next_delay(error, 1, Deadline(1)) is None
+    assert policy.next_delay(error, 5) is None
+    assert Deadline(None).remaining() is None
+    assert Deadline(60).timeout(30) == 30
+    assert Deadline(1).timeout(30) <= 1
+
+
+def test_fetch_resumes_after_a_dropped_connection():
+    """Test that a fetch reconnects and continues with the emails not fetched yet."""
+    emails = _emails(5)
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in emails) as server:
+        server.failures["UID FETCH"] = 2
+        fetched = _gmail(server).read_emails(
+            search_string="ALL", limit=None, raise_errors=True
+        )
+
+    assert [email_data["message_id"] for email_data in fetched] == [
+        email_data["message_id"] for email_data in emails
+    ]
+    assert server.counters["LOGIN"] == 3
+    assert server.counters["UID SEARCH"] == 1
+
+
+def test_failed_fetch_does_not_advance_the_last_runtime(tmp_path, monkeypatch, make_card):
+    """Test that a run whose fetch keeps failing raises and keeps its last runtime."""
+    card = make_card(
+        MERCHANTS=["Grab"], LAST_RUN_TIME_ENV_NAME="TEST_RETRY_LAST_RUNTIME"
+    )
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".env").write_text("")
+    monkeypatch.delenv(card.LAST_RUN_TIME_ENV_NAME, raising=False)
+
+    session = FakeSheetsSession()
+    card.GOOGLE_SHEET_ID = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+    emails = _emails(3)
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in emails) as server:
+        gmail_client = _gmail(server)
+        with TransactionStore(str(tmp_path / "transactions.db")) as store:
+            args = (card, gmail_client, sheet_client, TransactionExtractor(), store)
+
+            server.failures["UID FETCH"] = FAST_RETRIES.attempts
+            with pytest.raises(IncompleteRunError):
+                run_card(*args, connections=1)
+            assert card.LAST_RUN_TIME_ENV_NAME not in os.environ
+            assert (tmp_path / ".env").read_text() == ""
+
+            # The next run fetches the same dates again
+            assert run_card(*args, connections=1) == len(emails)
+            assert card.LAST_RUN_TIME_ENV_NAME in os.environ
+
+
+@pytest.mark.parametrize("sequential", [True, False], ids=["sequential", "staged"])
+def test_timed_out_emails_are_recorded_and_do_not_block_the_last_runtime(
+    tmp_path, monkeypatch, sequential
+, make_card):
+    """Test that emails past the retry budget are recorded and the last runtime advances."""
+    card = make_card(
+        MERCHANTS=["Grab"], LAST_RUN_TIME_ENV_NAME="TEST_RETRY_LAST_RUNTIME"
+    )
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".env").write_text("")
+    monkeypatch.delenv(card.LAST_RUN_TIME_ENV_NAME, raising=False)
+
+    session = FakeSheetsSession()
+    card.GOOGLE_SHEET_ID = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+    emails = _emails(3)
+    # Parsing alone takes longer than both budgets
+    transaction_extractor = TransactionExtractor(time_budget=0.01, retry_budget=0.02)
+    transaction_extractor.extractors = {"Grab": SlowGrabEmailExtractor()}
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in emails) as server:
+        gmail_client = _gmail(server)
+        with TransactionStore(str(tmp_path / "transactions.db")) as store:
+            args = (card, gmail_client, sheet_client, transaction_extractor, store)
+
+            for runs in (1, 2):
+                monkeypatch.delenv(card.LAST_RUN_TIME_ENV_NAME, raising=False)
+                assert run_card(*args, sequential=sequential, connections=1) == 0
+                assert card.LAST_RUN_TIME_ENV_NAME in os.environ
+                timed_out = store.timed_out(card.LAST_DIGITS)
+                assert sorted(email_data["message_id"] for email_data in timed_out) == sorted(
+                    email_data["message_id"] for email_data in emails
+                )
+                assert {email_data["runs"] for email_data in timed_out} == {runs}
+                assert {email_data["merchant"] for email_data in timed_out} == {"Grab"}
+
+            # The retry extracts emails the time budget alone would skip
+            monkeypatch.delenv(card.LAST_RUN_TIME_ENV_NAME)
+            transaction_extractor.retry_budget = 5
+            assert run_card(*args, sequential=sequential, connections=1) == len(emails)
+
+
+def test_send_email_retries_temporary_smtp_failures(monkeypatch):
+    """Test that dropped SMTP connections and 4xx replies are retried, 5xx are not."""
+    replies = []
+    sent = []
+
+    class FakeSMTP:
+        def __init__(self, host, port, timeout=None):
+            self.timeout = timeout
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def starttls(self):
+            pass
+
+        def login(self, user, password):
+            pass
+
+        def send_message(self, message):
+            if replies:
+                raise replies.pop(0)
+            sent.append(message["Subject"])
+
+    monkeypatch.setattr(smtplib, "SMTP", FakeSMTP)
+    gmail_client = Gmail("test@example.com", "password", retry_policy=FAST_RETRIES)
+
+    replies[:] = [
+        smtplib.SMTPServerDisconnected("Connection unexpectedly closed"),
+        smtplib.SMTPDataError(421, b"Try again later"),
+    ]
+    assert gmail_client.send_email("to@example.com", "Report", "Hello")
+    assert sent == ["Report"]
+
+    replies[:] = [smtplib.SMTPDataError(554, b"Message rejected")]
+    assert not gmail_client.send_email("to@example.com", "Rejected", "Hello")
+    replies[:] = [smtplib.SMTPServerDisconnected("Connection unexpectedly closed")] * 3
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        gmail_client.send_email("to@example.com", "Dropped", "Hello", raise_errors=True)
+    assert sent == ["Report"]
@@ -0,0 +1,100 @@
+"""
+Pytest tests for the adaptive route order learned from route hits.
+"""
+
+import pytest
+from bs4 import BeautifulSoup
+
+from utils.extractors import TransactionExtractor
+from utils.extractors.grab import GrabEmailExtractor
+from utils.extractors.route_stats import RouteStats, route_stats, subject_pattern
+from utils.extractors.test_data.synthetic import generate_emails
+from utils.ingest import _init_worker
+
+
+@pytest.fixture
+def fresh_route_stats():
+    route_stats.reset()
+    yield route_stats
+    route_stats.reset()
+
+
+def test_routes_are_ordered_by_hits():
+    """Test that the route matching most emails of a subject is tried first."""
+    stats = RouteStats()
+    routes = ["GrabFood", "GrabRide"]
+    assert stats.order("Grab", "Your Grab E-Receipt", routes) == routes
+
+    for _ in range(3):
+        stats.record("Grab", "Your Grab E-Receipt", "GrabFood", hit=False)
+        stats.record("Grab", "Your Grab E-Receipt", "GrabRide", hit=True)
+    stats.record("Grab", "Your Grab E-Receipt", "GrabFood", hit=True)
+
+    assert stats.order("Grab", "Your Grab E-Receipt", routes) == ["GrabRide", "GrabFood"]
+    # Other subjects keep the registration order
+    assert stats.order("Grab", "Your Grab Receipt", routes) == routes
+
+
+def test_subject_numbers_are_masked():
+    """Test that subjects differing only by numbers share their statistics."""
+    assert subject_pattern(" Order #12345 confirmed ") == "Order ## confirmed"
+
+
+def test_attempts_per_email_approach_one(fresh_route_stats):
+    """Test that learning the order removes the failed attempts."""
+    extractor = GrabEmailExtractor()
+    emails = generate_emails("Grab", "GrabRide", count=20, seed=9)
+    for email in emails:
+        result = extractor.extract_from_html(
+            BeautifulSoup(email["body"], "html.parser"), email["subject"]
+        )
+        fresh_route_stats.record_email(type(extractor).__name__, email["subject"])
+        assert result.card_number == email["expected"]["card_number"]
+
+    # Only the first email tried GrabFood before GrabRide
+    assert fresh_route_stats.attempts_per_email(
+        "GrabEmailExtractor", emails[0]["subject"]
+    ) == pytest.approx(21 / 20)
+
+
+def test_statistics_persist_between_runs(tmp_path):
+    """Test that saved statistics are loaded back and summarized in order."""
+    path = str(tmp_path / "route_stats.json")
+    stats = RouteStats()
+    stats.record("GrabEmailExtractor", "Receipt", "GrabFood", hit=False)
+    stats.record("GrabEmailExtractor", "Receipt", "GrabRide", hit=True)
+    stats.record_email("GrabEmailExtractor", "Receipt")
+    stats.save(path)
+
+    loaded = RouteStats()
+    loaded.load(path)
+
+    assert loaded.summary() == [
+        (
+            "GrabEmailExtractor",
+            "Receipt",
+            2.0,
+            [("GrabRide", 1, 0), ("GrabFood", 0, 1)],
+        )
+    ]
+
+
+def test_statistics_are_loaded_once_per_path(tmp_path, fresh_route_stats):
+    """Test that extractors built in one process do not count a file twice."""
+    path = str(tmp_path / "route_stats.json")
+    stats = RouteStats()
+    stats.record("GrabEmailExtractor", "Receipt", "GrabRide", hit=True)
+    stats.record_email("GrabEmailExtractor", "Receipt")
+    stats.save(path)
+
+    for _ in range(3):
+        TransactionExtractor(route_stats_path=path).flush()
+    # The bulk paths load it in their worker processes
+    _init_worker(path)
+
+    assert fresh_route_stats.summary() == [
+        ("GrabEmailExtractor", "Receipt", 1.0, [("GrabRide", 1, 0)])
+    ]
+    saved = RouteStats()
+    saved.load(path)
+    assert saved.summary() == fresh_route_stats.summary()
@@ -0,0 +1,99 @@
+"""
+Pytest tests for the resident service mode against the fake IMAP and Sheets servers.
+"""
+
+import json
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+import gspread
+import pytz
+
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.fake_sheets import FakeSheetsSession
+from utils.extractors import TransactionExtractor
+from utils.extractors.test_data.conftest import wait_for
+from utils.extractors.test_data.synthetic import generate_emails, to_rfc822
+from utils.gmail import Gmail
+from utils.googlesheets import SheetManager
+from utils.service import LoggerService
+from utils.store import TransactionStore
+
+
+def test_service_runs_on_demand_with_warm_clients(tmp_path, monkeypatch, make_card):
+    """Test that triggered runs are incremental and reuse the IMAP login."""
+    card = make_card(LAST_RUN_TIME_ENV_NAME="TEST_SERVICE_LAST_RUNTIME")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".env").write_text("")
+    monkeypatch.delenv(card.LAST_RUN_TIME_ENV_NAME, raising=False)
+
+    manila = pytz.timezone("Asia/Manila")
+    start_date = datetime.now(manila).replace(tzinfo=None) - timedelta(days=3)
+    old = generate_emails(
+        "Grab", "GrabRide", count=3, seed=1, start_date=start_date, card_number="4321"
+    )
+    new = generate_emails("Grab", "GrabFood", count=1, seed=2, card_number="4321")
+
+    session = FakeSheetsSession()
+    card.GOOGLE_SHEET_ID = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in old) as server:
+        gmail_client = Gmail(
+            "test@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+            keep_connections=1,
+        )
+        service = LoggerService(
+            {"FakeCard": card},
+            gmail_client,
+            sheet_client,
+            TransactionExtractor(),
+            str(tmp_path / "transactions.db"),
+            interval=None,
+            connections=1,
+            extract_workers=1,
+        )
+        http_server = service.serve_http(0)
+        url = f"http://127.0.0.1:{http_server.server_address[1]}"
+        thread = threading.Thread(target=service.serve_forever)
+        thread.start()
+        try:
+            # Every card runs on start
+            assert wait_for(lambda: service.status["FakeCard"]["runs"] == 1)
+
+            # Dates of the Gmail search are in seconds
+            time.sleep(1.1)
+            new[0]["date"] = datetime.now(manila)
+            server.add_message(to_rfc822(new[0]))
+            time.sleep(1.1)
+
+            request = urllib.request.Request(f"{url}/run/FakeCard", method="POST")
+            with urllib.request.urlopen(request) as response:
+                assert response.status == 202
+                assert json.load(response) == {"queued": ["FakeCard"]}
+            assert wait_for(lambda: service.status["FakeCard"]["runs"] == 2)
+
+            with urllib.request.urlopen(f"{url}/status") as response:
+                status = json.load(response)["FakeCard"]
+        finally:
+            service.stop()
+            thread.join()
+            http_server.shutdown()
+            gmail_client.close()
+
+    assert status["errors"] == 0
+    assert status["last_run"]["uploaded"] == 1
+
+    with TransactionStore(str(tmp_path / "transactions.db")) as store:
+        transactions = store.transactions(card.LAST_DIGITS)
+    assert all(record.status == "uploaded" for record in transactions)
+    assert len(transactions) == len(old) + len(new)
+    # The second run only fetched the new email, on the connection of the first
+    assert server.counters["UID FETCH"] == len(old) + len(new)
+    assert server.counters["LOGIN"] == 1
@@ -0,0 +1,167 @@
+"""
+Pytest tests for the local transaction store.
+"""
+
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+import pytz
+
+from utils.records import TransactionRecord
+from utils.store import TransactionStore
+
+
+def _record(date: datetime, card_number: str = "4321", **fields) -> TransactionRecord:
+    values = {
+        "message_id": f"<{date:%Y%m%d%H%M}.{card_number}@example.com>",
+        "subject": "Your Grab E-Receipt",
+        "sender": "no-reply@grab.com",
+        "total_paid_amount": 250.0,
+        "merchant": "GrabFood",
+        **fields,
+    }
+    return TransactionRecord(date=date, card_number=card_number, **values)
+
+
+@pytest.fixture
+def store(tmp_path):
+    with TransactionStore(str(tmp_path / "transactions.db")) as store:
+        yield store
+
+
+def test_transactions_are_recorded_once_per_email(store):
+    """Test that emails already stored, by Message-ID, are skipped."""
+    first = _record(datetime(2025, 1, 20, 12, 0))
+    second = _record(datetime(2025, 1, 21, 12, 0))
+
+    assert store.add_transactions([first, second], statement_day=15) == 2
+    assert store.add_transactions([first, _record(datetime(2025, 1, 22))], 15) == 1
+    assert store.add_transactions([], 15) == 0
+
+    records = store.transactions("4321")
+    assert [record.message_id for record in records] == [
+        first.message_id,
+        second.message_id,
+        "<202501220000.4321@example.com>",
+    ]
+    assert records[0].cycle == "20250115"
+    assert records[0].status == "pending"
+    assert store.has_message(first.message_id)
+
+
+def test_emails_without_message_id_get_a_stable_id(store):
+    """Test that the generated ID dedups the same email and tells others apart."""
+    date = datetime(2025, 1, 20, 12, 0)
+    email = _record(date, message_id=None)
+
+    assert store.add_transactions([email], 15) == 1
+    assert store.add_transactions([_record(date, message_id=None)], 15) == 0
+    assert store.add_transactions([_record(date, message_id=None, total_paid_amount=99.0)], 15) == 1
+
+    message_ids = [record.message_id for record in store.transactions()]
+    assert all(message_id.startswith("<generated-") for message_id in message_ids)
+    assert len(set(message_ids)) == 2
+
+
+def test_upload_status_round_trip(store):
+    """Test pending, mark_uploaded and reset_uploads, per card and cycle."""
+    store.add_transactions(
+        [
+            _record(datetime(2025, 1, 20)),
+            _record(datetime(2025, 2, 20)),
+            _record(datetime(2025, 1, 20), card_number="8765"),
+        ],
+        statement_day=15,
+    )
+    pending = store.pending("4321")
+    assert [record.date for record in pending] == [datetime(2025, 1, 20), datetime(2025, 2, 20)]
+
+    store.mark_uploaded(record.id for record in pending)
+    assert store.pending("4321") == []
+    assert all(record.uploaded_at for record in store.transactions("4321"))
+    assert len(store.pending("8765")) == 1
+
+    assert store.reset_uploads("4321", cycle="20250215") == 1
+    assert [record.cycle for record in store.pending("4321")] == ["20250215"]
+    assert store.reset_uploads("4321") == 2
+    assert len(store.pending("4321")) == 2
+    assert all(record.uploaded_at is None for record in store.pending("4321"))
+
+
+def test_transactions_are_filtered_by_card_dates_and_cycle(store):
+    """Test the history query filters, with the end of the interval excluded."""
+    store.add_transactions(
+        [
+            _record(datetime(2025, 1, 14, 23, 59)),
+            _record(datetime(2025, 1, 15)),
+            _record(datetime(2025, 2, 1)),
+            _record(datetime(2025, 2, 15)),
+            _record(datetime(2025, 2, 1), card_number="8765"),
+        ],
+        statement_day=15,
+    )
+
+    def dates(records):
+        return [record.date for record in records]
+
+    interval = [datetime(2025, 1, 15), datetime(2025, 2, 15)]
+    assert dates(store.transactions("4321", date_interval=interval)) == [
+        datetime(2025, 1, 15),
+        datetime(2025, 2, 1),
+    ]
+    assert dates(store.transactions("4321", cycle="20241215")) == [datetime(2025, 1, 14, 23, 59)]
+    assert len(store.transactions(date_interval=interval)) == 3
+    assert len(store.transactions()) == 5
+
+
+def test_date_ranges_compare_instants_across_utc_offsets(store):
+    """Test that dates with different offsets are filtered and sorted in time order."""
+    manila = pytz.timezone("Asia/Manila")
+    # 08:00 in Manila, 00:00 UTC
+    before = _record(manila.localize(datetime(2025, 1, 15, 8, 0)))
+    # 00:30 UTC, 08:30 in Manila: its text sorts before the bounds below
+    after = _record(datetime(2025, 1, 15, 0, 30, tzinfo=timezone.utc))
+    store.add_transactions([after, before], statement_day=15)
+
+    def message_ids(records):
+        return [record.message_id for record in records]
+
+    aware = [
+        manila.localize(datetime(2025, 1, 15, 8, 15)),
+        datetime(2025, 2, 1, tzinfo=timezone.utc),
+    ]
+    assert message_ids(store.transactions("4321", date_interval=aware)) == [after.message_id]
+    # Naive bounds are Manila time
+    naive = [datetime(2025, 1, 15, 8, 15), datetime(2025, 2, 1)]
+    assert message_ids(store.transactions("4321", date_interval=naive)) == [after.message_id]
+    assert message_ids(store.pending("4321")) == [before.message_id, after.message_id]
+    assert store.transactions()[1].date == after.date
+
+
+def test_stores_without_utc_dates_are_migrated(tmp_path):
+    """Test that opening a store created before date_utc fills the column in."""
+    path = str(tmp_path / "transactions.db")
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        """
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY, message_id TEXT NOT NULL UNIQUE,
+            date TEXT NOT NULL, cycle TEXT NOT NULL, card_number TEXT,
+            total_paid_amount REAL, merchant TEXT, category TEXT, source TEXT,
+            sender TEXT, subject TEXT, status TEXT NOT NULL DEFAULT 'pending',
+            uploaded_at TEXT, created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX idx_transactions_card_date ON transactions (card_number, date);
+        INSERT INTO transactions (message_id, date, cycle, card_number)
+            VALUES ('<a@example.com>', '2025-01-15T08:30:00+08:00', '20250115', '4321');
+        """
+    )
+    connection.close()
+
+    with TransactionStore(path) as store:
+        assert store.add_transactions([_record(datetime(2025, 1, 15, 8, 0))], 15) == 1
+        assert [record.message_id for record in store.pending("4321")] == [
+            "<202501150800.4321@example.com>",
+            "<a@example.com>",
+        ]
@@ -0,0 +1,51 @@
+"""
+Pytest tests for the synthetic email corpus.
+
+Every generated email must extract to its expected results, so the corpus
+stays a faithful benchmark input when extractors change.
+"""
+
+import pytest
+
+from utils.extractors.test_data.synthetic import (
+    FOODPANDA_CARD,
+    GENERATORS,
+    generate_corpus,
+    generate_emails,
+)
+
+
+@pytest.mark.parametrize(
+    "merchant,route",
+    [
+        pytest.param(merchant, route, id=f"{merchant}-{route[:30]}")
+        for merchant, generators in GENERATORS.items()
+        for route in generators
+    ],
+)
+def test_synthetic_route(merchant, route, extractor_registry, monkeypatch):
+    """Test that every synthetic email of a route extracts as expected."""
+    monkeypatch.setenv("CARD_USED_FOR_FPND", FOODPANDA_CARD)
+    extractor = extractor_registry[merchant].__class__()
+
+    for email in generate_emails(merchant, route, count=20, seed=7):
+        result = extractor.extract_payment_info(email["body"], email["subject"])
+        expected = email["expected"]
+
+        if expected is None:
+            assert not result.card_number, f"Noise email extracted: {result}"
+            continue
+
+        assert result.card_number == expected["card_number"]
+        assert result.amount == expected["amount"]
+        assert result.merchant == expected["merchant"]
+
+
+def test_synthetic_corpus_is_deterministic():
+    """Test that the same seed generates the same corpus."""
+    first = generate_corpus(count=50, seed=3)
+    second = generate_corpus(count=50, seed=3)
+
+    assert len(first) == 50
+    assert [e["body"] for e in first] == [e["body"] for e in second]
+    assert len({e["message_id"] for e in first}) == 50
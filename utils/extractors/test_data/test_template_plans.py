@@ -0,0 +1,89 @@
+"""
+Pytest tests for the extraction plans remembered per email layout.
+"""
+
+from utils.extractors import base
+from utils.extractors.base import template_fingerprint, trim_html
+from utils.extractors.grab import GrabEmailExtractor
+from utils.extractors.test_data.synthetic import generate_emails
+
+
+def _counters(metrics) -> dict:
+    return {
+        (c["name"], tuple(sorted(c["labels"].items()))): c["value"]
+        for c in metrics.report()["counters"]
+    }
+
+
+def test_fingerprint_identifies_templates():
+    """Test that emails of a template share a fingerprint, other templates differ."""
+    rows = "<tr><td>Item</td><td>P 1.00</td></tr>"
+    one_item = f"<html><body><table>{rows}<tr><td>Total</td></tr></table></body></html>"
+    three_items = one_item.replace(rows, rows * 3).replace("Item", "Other item")
+
+    assert template_fingerprint(one_item) == template_fingerprint(three_items)
+    assert template_fingerprint(one_item) != template_fingerprint(
+        one_item.replace("<td>Total</td>", "<td><b>Total</b></td>")
+    )
+
+    food = generate_emails("Grab", "GrabFood", count=5, seed=4)
+    ride = generate_emails("Grab", "GrabRide", count=1, seed=4)[0]
+    fingerprints = {template_fingerprint(trim_html(email["body"])) for email in food}
+    assert len(fingerprints) == 1
+    assert template_fingerprint(trim_html(ride["body"])) not in fingerprints
+
+
+def test_known_layouts_follow_their_plan(enabled_metrics):
+    """Test that only the first email of a layout searches the routes."""
+    extractor = GrabEmailExtractor()
+    emails = generate_emails("Grab", "GrabFood", count=5, seed=3)
+    for email in emails:
+        # The scoped GrabFood route misses on this layout
+        body = email["body"].replace(
+            "<body>", "<body><table><tr><td>TOTAL (INCL. TAX)</td></tr></table>", 1
+        )
+        result = extractor.extract_payment_info(body, email["subject"])
+        assert result.amount == email["expected"]["amount"]
+
+    counters = _counters(enabled_metrics)
+    labels = (("extractor", "GrabEmailExtractor"), ("result", "fallback"), ("route", "GrabFood"))
+    assert counters[("extractor.scoped", labels)] == 1
+    labels = (("extractor", "GrabEmailExtractor"), ("result", "hit"))
+    assert counters[("extractor.plan", labels)] == 4
+    assert list(extractor.template_plans.values()) == [("GrabFood", False)]
+
+
+def test_plan_that_stops_matching_is_replaced():
+    """Test that a layout whose plan misses is searched again."""
+    extractor = GrabEmailExtractor()
+    email = generate_emails("Grab", "GrabFood", count=1, seed=5)[0]
+    fingerprint = template_fingerprint(trim_html(email["body"]))
+    extractor.template_plans[fingerprint] = ("GrabRide", False)
+
+    result = extractor.extract_payment_info(email["body"], email["subject"])
+
+    assert result.card_number == email["expected"]["card_number"]
+    assert extractor.template_plans[fingerprint] == ("GrabFood", True)
+
+
+def test_least_recently_used_layouts_are_evicted(monkeypatch):
+    """Test that a layout following its plan is kept over newer, unused layouts."""
+    monkeypatch.setattr(base, "MAX_TEMPLATE_PLANS", 2)
+    extractor = GrabEmailExtractor()
+    food = generate_emails("Grab", "GrabFood", count=2, seed=6)
+    ride = generate_emails("Grab", "GrabRide", count=1, seed=6)[0]
+    other = generate_emails("Grab", "GrabFood", count=1, seed=7)[0]
+    # A banner above the receipt makes another layout
+    other_body = other["body"].replace("<body>", "<body><div><span>Hi</span></div>", 1)
+
+    def fingerprint(body: str) -> str:
+        return template_fingerprint(trim_html(body))
+
+    for email in (food[0], ride, food[1]):
+        extractor.extract_payment_info(email["body"], email["subject"])
+    extractor.extract_payment_info(other_body, other["subject"])
+
+    assert list(extractor.template_plans) == [
+        fingerprint(food[0]["body"]),
+        fingerprint(other_body),
+    ]
@@ -0,0 +1,166 @@
+"""
+Pytest tests for the IMAP IDLE watch mode against the fake IMAP and Sheets servers.
+"""
+
+import imaplib
+import threading
+
+import gspread
+
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.fake_sheets import FakeSheetsSession
+from utils.extractors import TransactionExtractor
+from utils.extractors.test_data.conftest import wait_for
+from utils.extractors.test_data.synthetic import generate_emails, to_rfc822
+from utils import gmail
+from utils.gmail import Gmail
+from utils.googlesheets import SheetManager
+from utils.store import TransactionStore
+from utils.watch import run_watch
+
+
+def test_watch_logs_emails_as_they_arrive(tmp_path, make_card):
+    """Test that only new emails are fetched, by UID, and reach the sheet."""
+    card = make_card()
+    old = generate_emails("Grab", "GrabRide", count=3, seed=1, card_number="4321")
+    new = generate_emails("Grab", "GrabFood", count=2, seed=2, card_number="4321")
+    promotion = generate_emails("Grab", "noise", count=1, seed=3)
+
+    session = FakeSheetsSession()
+    card.GOOGLE_SHEET_ID = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+    stop = threading.Event()
+    db_path = str(tmp_path / "transactions.db")
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in old) as server:
+        gmail_client = Gmail(
+            "test@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+            processed_label="cc-logger/processed",
+        )
+
+        def watch():
+            # SQLite connections stay on their thread
+            with TransactionStore(db_path) as store:
+                run_watch(
+                    card,
+                    gmail_client,
+                    sheet_client,
+                    TransactionExtractor(),
+                    store,
+                    keepalive=0.2,
+                    stop=stop,
+                )
+
+        thread = threading.Thread(target=watch)
+        thread.start()
+        try:
+            assert wait_for(lambda: server.counters["IDLE"] >= 1)
+            for email_data in new + promotion:
+                server.add_message(to_rfc822(email_data))
+
+            assert wait_for(
+                lambda: all(
+                    "cc-logger/processed" in message.labels
+                    for message in server.messages[len(old) :]
+                )
+            )
+            # Keepalives renew the IDLE command
+            assert wait_for(lambda: server.counters["NOOP"] >= 1)
+        finally:
+            stop.set()
+            thread.join()
+
+    with TransactionStore(db_path) as store:
+        transactions = store.transactions(card.LAST_DIGITS)
+
+    assert all(record.status == "uploaded" for record in transactions)
+    assert sorted(record.message_id for record in transactions) == sorted(
+        email_data["message_id"] for email_data in new
+    )
+    # Only the new messages were downloaded, and the connection was kept alive
+    assert server.counters["UID FETCH"] == len(new) + len(promotion)
+    assert server.counters["FETCH"] == 0
+    assert server.counters["LOGIN"] == 1
+
+
+def test_watch_recovers_from_failures_within_a_batch(tmp_path, monkeypatch, make_card):
+    """Test that a lost connection and an unparsable message mid-batch lose no other email."""
+    card = make_card()
+    old = generate_emails("Grab", "GrabRide", count=1, seed=1, card_number="4321")
+    new = generate_emails("Grab", "GrabFood", count=5, seed=2, card_number="4321")
+
+    # UID 3 cannot be parsed, the connection is lost when fetching UID 5
+    failures = {"3": TypeError("no Date header"), "5": imaplib.IMAP4.abort("socket error: EOF")}
+    fetched = []
+
+    def fetch_email(imap_server, message, by_uid=False):
+        uid = message.decode()
+        fetched.append(uid)
+        if uid in failures:
+            raise failures.pop(uid) if uid == "5" else failures[uid]
+        return gmail.fetch_email(imap_server, message, by_uid)
+
+    monkeypatch.setattr("utils.watch.fetch_email", fetch_email)
+
+    session = FakeSheetsSession()
+    card.GOOGLE_SHEET_ID = session.create_spreadsheet()
+    sheet_client = SheetManager(client=gspread.Client(auth=None, session=session))
+    stop = threading.Event()
+    db_path = str(tmp_path / "transactions.db")
+
+    with FakeIMAPServer(to_rfc822(email_data) for email_data in old) as server:
+        gmail_client = Gmail(
+            "test@example.com",
+            "password",
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+            processed_label="cc-logger/processed",
+        )
+
+        def watch_mailbox():
+            with TransactionStore(db_path) as store:
+                run_watch(
+                    card,
+                    gmail_client,
+                    sheet_client,
+                    TransactionExtractor(),
+                    store,
+                    keepalive=0.2,
+                    reconnect_delay=0.05,
+                    stop=stop,
+                )
+
+        thread = threading.Thread(target=watch_mailbox)
+        thread.start()
+        try:
+            assert wait_for(lambda: server.counters["IDLE"] >= 1)
+            with server.lock:
+                for email_data in new:
+                    server.add_message(to_rfc822(email_data))
+
+            assert wait_for(
+                lambda: all(
+                    "cc-logger/processed" in message.labels
+                    for message in server.messages
+                    if message.uid not in (1, 3)
+                )
+            )
+        finally:
+            stop.set()
+            thread.join()
+
+    with TransactionStore(db_path) as store:
+        transactions = store.transactions(card.LAST_DIGITS)
+
+    assert all(record.status == "uploaded" for record in transactions)
+    assert sorted(record.message_id for record in transactions) == sorted(
+        email_data["message_id"] for uid, email_data in enumerate(new, 2) if uid != 3
+    )
+    # The batch resumed with the message lost with the connection
+    assert fetched == ["2", "3", "4", "5", "5", "6"]
+    assert server.counters["LOGIN"] == 2
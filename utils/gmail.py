@@ -1,17 +1,45 @@
 import email
+import email.utils
 import imaplib
+import queue
+import re
 import smtplib
+import zlib
+from collections import deque
 from datetime import datetime, timedelta
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Dict, List, Union
+from typing import Dict, Iterator, List, Union
 
 import pytz
 
+from utils.metrics import metrics
+from utils.retry import DEFAULT_TIMEOUT, Deadline, RetryPolicy
+
+# Messages labeled per UID STORE command, see Gmail.mark_processed
+LABEL_BATCH_SIZE = 500
+
+FETCH_UID_PATTERN = re.compile(rb"\bUID (\d+)")
+
+# Compressed bytes read from the socket at a time, see IMAPStream
+READ_SIZE = 64 * 1024
+
 
 class Gmail:
     def __init__(
-        self, email_address: str, password: str, test_connection: bool = False
+        self,
+        email_address: str,
+        password: str,
+        test_connection: bool = False,
+        imap_server: str = "imap.gmail.com",
+        imap_port: int = 993,
+        imap_ssl: bool = True,
+        search_exclude: str = "",
+        processed_label: Union[str, None] = None,
+        keep_connections: int = 0,
+        timeout: Union[float, None] = DEFAULT_TIMEOUT,
+        retry_policy: Union[RetryPolicy, None] = None,
+        compress: bool = True,
     ):
         """
         Initialize Gmail class with email credentials
@@ -19,194 +47,376 @@ class Gmail:
         Args:
             email_address (str): Gmail address
             password (str): App-specific password or account password
+            imap_server (str): IMAP host (default: imap.gmail.com)
+            imap_port (int): IMAP port (default: 993)
+            imap_ssl (bool): Connect with SSL, disable for local test servers (default: True)
+            search_exclude (str): Gmail search terms excluding labels or
+                categories from filtered searches, e.g. "-category:social".
+                Gmail files some receipts under Promotions, whose transactions
+                a category term drops (default: "", none)
+            processed_label (str, optional): Gmail label applied to the messages
+                a run has processed (see mark_processed) and excluded from
+                filtered searches, None to disable (default: None)
+            keep_connections (int): Logged in IMAP connections kept open between
+                calls and reused, 0 to log out after every call (default: 0)
+            timeout (float, optional): Seconds an IMAP or SMTP connection
+                attempt or response may take, None to wait forever
+                (default: DEFAULT_TIMEOUT)
+            retry_policy (RetryPolicy, optional): Retries of the IMAP calls on
+                retryable errors (default: RetryPolicy())
+            compress (bool): Compress IMAP connections with COMPRESS=DEFLATE
+                when the server supports it (default: True)
         """
         self.email_address = email_address
         self.password = password
         self.smtp_server = "smtp.gmail.com"
         self.smtp_port = 587
-        self.imap_server = "imap.gmail.com"
+        self.imap_server = imap_server
+        self.imap_port = imap_port
+        self.imap_ssl = imap_ssl
+        self.search_exclude = search_exclude or ""
+        if "category:" in self.search_exclude:
+            print(
+                f"Searches leave out {self.search_exclude}: receipts Gmail files "
+                "there are not logged"
+            )
+        self.processed_label = processed_label
+        self.keep_connections = keep_connections
+        # Idle logged in connections, see _acquire
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.compress = compress
+        # Deadline of the current run, which retries and timeouts stay within
+        self.deadline: Union[Deadline, None] = None
 
         if test_connection:
             self.test_connection()
 
-    def send_email(self, to_email: str, subject: str, body: str) -> bool:
+    def _connect_imap(self) -> imaplib.IMAP4:
+        """
+        Connect and log in to the IMAP server
+
+        Returns:
+            imaplib.IMAP4: The logged in IMAP connection
+        """
+        timeout = self.deadline.timeout(self.timeout) if self.deadline else self.timeout
+        if self.imap_ssl:
+            imap_server = imaplib.IMAP4_SSL(self.imap_server, self.imap_port, timeout=timeout)
+        else:
+            imap_server = imaplib.IMAP4(self.imap_server, self.imap_port, timeout=timeout)
+        stream = IMAPStream(imap_server)
+        imap_server.login(self.email_address, self.password)
+        if self.compress:
+            enable_compression(imap_server, stream)
+        return imap_server
+
+    def _acquire(self) -> imaplib.IMAP4:
+        """
+        Reuse an idle connection that is still alive, or connect and log in
+
+        Returns:
+            imaplib.IMAP4: The logged in IMAP connection, to be handed back
+                with _release
+        """
+        while True:
+            try:
+                imap_server = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                # The server may have closed a connection idle for long
+                imap_server.noop()
+                metrics.incr("imap.reused")
+                return imap_server
+            except Exception:
+                _logout(imap_server)
+        with metrics.span("imap.connect"):
+            return self._connect_imap()
+
+    def _release(self, imap_server: imaplib.IMAP4, reusable: bool = True) -> None:
+        """Keep a connection for the next call, or log out of it"""
+        if reusable and self._idle.qsize() < self.keep_connections:
+            self._idle.put(imap_server)
+        else:
+            _logout(imap_server)
+
+    def close(self) -> None:
+        """Log out of the idle connections"""
+        while True:
+            try:
+                _logout(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def send_email(
+        self, to_email: str, subject: str, body: str, raise_errors: bool = False
+    ) -> bool:
         """
         Send an email using Gmail SMTP
 
+        Dropped connections and temporary (4xx) SMTP replies are retried with
+        the retry policy, within the deadline of the current run.
+
         Args:
             to_email (str): Recipient's email address
             subject (str): Email subject
             body (str): Email body content
+            raise_errors (bool): Raise the error of the last attempt instead of
+                returning False (default: False)
 
         Returns:
             bool: True if email sent successfully, False otherwise
         """
-        try:
-            # Create message
-            message = MIMEMultipart()
-            message["From"] = self.email_address
-            message["To"] = to_email
-            message["Subject"] = subject
+        # Create message
+        message = MIMEMultipart()
+        message["From"] = self.email_address
+        message["To"] = to_email
+        message["Subject"] = subject
 
-            # Add body to email
-            message.attach(MIMEText(body, "plain"))
-
-            # Create SMTP session
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.email_address, self.password)
-                server.send_message(message)
+        # Add body to email
+        message.attach(MIMEText(body, "plain"))
 
+        try:
+            self.retry_policy.call(
+                self._send_message, message, deadline=self.deadline, operation="smtp.send"
+            )
             return True
-
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error sending email: {str(e)}")
             return False
 
+    def _send_message(self, message: MIMEMultipart) -> None:
+        """Send a message over a new SMTP session"""
+        timeout = self.deadline.timeout(self.timeout) if self.deadline else self.timeout
+        with smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=timeout) as server:
+            server.starttls()
+            server.login(self.email_address, self.password)
+            server.send_message(message)
+
     def read_emails(
         self,
         folder: str = "INBOX",
-        limit: int = 5,
+        limit: Union[int, None] = 5,
         search_string: str = None,
+        raise_errors: bool = False,
     ) -> List[Dict]:
         """
         Read emails from specified folder
 
         Args:
             folder (str): Email folder to read from (default: INBOX)
-            limit (int): Maximum number of emails to retrieve (default: 5)
+            limit (int, optional): Maximum number of emails to retrieve, None for all (default: 5)
             search_string (str): IMAP search criteria (default: None)
+            raise_errors (bool): Raise connection and fetch errors instead of
+                returning an empty list (default: False)
 
         Returns:
             List[Dict]: List of dictionaries containing email information
         """
         try:
-            # Connect to IMAP server
-            imap_server = imaplib.IMAP4_SSL(self.imap_server)
-            imap_server.login(self.email_address, self.password)
-
-            # Select folder
-            imap_server.select(folder)
-
-            # Search for emails
-            _, message_numbers = imap_server.search(None, search_string)
-
-            email_list = []
-            for num in message_numbers[0].split()[-limit:]:
-                _, msg_data = imap_server.fetch(num, "(RFC822)")
-                email_body = msg_data[0][1]
-                email_message = email.message_from_bytes(email_body)
-
-                # Extract email information
-                email_info = {
-                    "from": email_message["from"],
-                    "subject": email_message["subject"],
-                    "date": email.utils.parsedate_to_datetime(
-                        email_message["date"]
-                    ).astimezone(pytz.timezone("Asia/Manila")),
-                    "body": "",
-                }
-
-                # Get email body with improved content handling
-                if email_message.is_multipart():
-                    # Try to find text/plain first, then text/html
-                    text_content = None
-                    html_content = None
-
-                    for part in email_message.walk():
-                        content_type = part.get_content_type()
-                        if content_type == "text/plain" and not text_content:
-                            text_content = part.get_payload(decode=True)
-                        elif content_type == "text/html" and not html_content:
-                            html_content = part.get_payload(decode=True)
-
-                    # Prefer plain text, fall back to HTML if plain text is not available
-                    if text_content:
-                        try:
-                            email_info["body"] = text_content.decode(
-                                "utf-8", errors="replace"
-                            )
-                        except Exception:
-                            email_info["body"] = text_content.decode(
-                                "latin-1", errors="replace"
-                            )
-                    elif html_content:
-                        try:
-                            email_info["body"] = html_content.decode(
-                                "utf-8", errors="replace"
-                            )
-                        except Exception:
-                            email_info["body"] = html_content.decode(
-                                "latin-1", errors="replace"
-                            )
-                else:
-                    # Handle non-multipart messages
-                    content_type = email_message.get_content_type()
-                    payload = email_message.get_payload(decode=True)
-                    if payload:
-                        try:
-                            email_info["body"] = payload.decode(
-                                "utf-8", errors="replace"
-                            )
-                        except Exception:
-                            email_info["body"] = payload.decode(
-                                "latin-1", errors="replace"
-                            )
-
-                email_list.append(email_info)
-
-            imap_server.close()
-            imap_server.logout()
-
-            return email_list
-
+            return list(self.iter_emails(folder, limit, search_string))
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error reading emails: {str(e)}")
             return []
 
+    def iter_emails(
+        self,
+        folder: str = "INBOX",
+        limit: Union[int, None] = 5,
+        search_string: str = None,
+    ) -> Iterator[Dict]:
+        """
+        Read emails from specified folder one at a time
+
+        Every email is fetched and parsed when the next one is requested, so a
+        consumer that falls behind also pauses the fetch. The connection is
+        closed when the iteration ends or the generator is closed. Retryable
+        errors (see retry.is_retryable) reconnect and resume with the emails
+        not fetched yet, within the retry policy and the deadline.
+
+        Args:
+            folder (str): Email folder to read from (default: INBOX)
+            limit (int, optional): Maximum number of emails to retrieve, None for all (default: 5)
+            search_string (str): IMAP search criteria (default: None)
+
+        Yields:
+            Dict: The email information, see `parse_email`, and the "uid" of
+                the message
+
+        Raises:
+            Exception: Connection and fetch errors that are not retryable or
+                persist, and retry.DeadlineExceeded
+        """
+        # UIDs still to fetch, None until searched. Unlike sequence numbers,
+        # UIDs stay valid across connections, so a retry resumes the fetch
+        pending: Union[deque, None] = None
+        attempt = 0
+        while True:
+            imap_server = None
+            # Only a connection whose folder was closed normally is kept
+            completed = False
+            try:
+                if self.deadline is not None:
+                    self.deadline.check()
+                # Connect to IMAP server, or reuse a kept connection
+                imap_server = self._acquire()
+                imap_server.select(folder)
+
+                if pending is None:
+                    # Search for emails
+                    with metrics.span("imap.search"):
+                        _, uids = imap_server.uid("SEARCH", None, search_string)
+                    uids = uids[0].split() if uids and uids[0] else []
+                    pending = deque(uids[-limit:] if limit else uids)
+
+                while pending:
+                    if self.deadline is not None:
+                        self.deadline.check()
+                    email_data = fetch_email(imap_server, pending[0], by_uid=True)
+                    pending.popleft()
+                    attempt = 0
+                    yield email_data
+
+                imap_server.close()
+                completed = True
+                return
+            except Exception as e:
+                metrics.incr("imap.errors", error=type(e).__name__)
+                attempt += 1
+                if self.retry_policy.wait_before_retry(
+                    e, attempt, self.deadline, "IMAP fetch"
+                ) is None:
+                    raise
+            finally:
+                if imap_server is not None:
+                    self._release(imap_server, reusable=completed)
+
     def read_emails_filtered(
         self,
         sender: str = None,
         folder: str = "INBOX",
         date_interval: Union[List[datetime], None] = None,
-        limit: int = 5,
+        limit: Union[int, None] = 5,
+        raise_errors: bool = False,
+        subjects: Union[List[str], None] = None,
+        excluded_subjects: Union[List[str], None] = None,
     ) -> List[Dict]:
         """
-        Read emails from specified folder with sender and time filters
+        Read emails from specified folder with sender, subject and time filters
 
         Args:
             sender (str, optional): Filter emails from specific sender
             folder (str): Email folder to read from (default: INBOX)
             date_interval (List[datetime], optional): List containing [from_date, to_date]
                 defaults to [yesterday, now]
-            limit (int): Maximum number of emails to retrieve (default: 5)
+            limit (int, optional): Maximum number of emails to retrieve, None for all (default: 5)
+            raise_errors (bool): Raise connection and fetch errors instead of
+                returning an empty list (default: False)
+            subjects (List[str], optional): Only read emails whose subject
+                contains one of these phrases
+            excluded_subjects (List[str], optional): Skip emails whose subject
+                contains one of these phrases
 
         Returns:
             List[Dict]: List of dictionaries containing filtered email information
         """
-        # Set default date interval if none provided
-        if date_interval is None:
-            now = datetime.now()
-            date_interval = [now - timedelta(days=1), now]
+        search_string = filtered_search_string(
+            sender, date_interval, subjects, excluded_subjects, self.exclusion_terms()
+        )
+        return self.read_emails(folder, limit, search_string, raise_errors)
 
-        start_timestamp = int(date_interval[0].timestamp())
-        end_timestamp = int(date_interval[1].timestamp())
+    def iter_emails_filtered(
+        self,
+        sender: str = None,
+        folder: str = "INBOX",
+        date_interval: Union[List[datetime], None] = None,
+        limit: Union[int, None] = 5,
+        subjects: Union[List[str], None] = None,
+        excluded_subjects: Union[List[str], None] = None,
+    ) -> Iterator[Dict]:
+        """
+        Streaming version of `read_emails_filtered`, see `iter_emails`
 
-        # Build search criteria
-        search_criteria = []
+        Yields:
+            Dict: The email information, see `parse_email`
+        """
+        search_string = filtered_search_string(
+            sender, date_interval, subjects, excluded_subjects, self.exclusion_terms()
+        )
+        return self.iter_emails(folder, limit, search_string)
 
-        if sender:
-            search_criteria.append(f"from:{sender}")
+    def mark_processed(self, uids: List[str], folder: str = "INBOX") -> int:
+        """
+        Apply the processed label to messages, so filtered searches skip them
 
-        # Add date range criteria using timestamps
-        search_criteria.append(f"after:{start_timestamp} before:{end_timestamp}")
+        Gmail keeps track of what has been ingested: reruns over the same
+        dates fetch nothing already processed. Messages are labeled in
+        batched UID STORE commands. Does nothing without a processed_label.
 
-        # Combine all search criteria
-        search_string = (
-            'X-GM-RAW "' + " ".join(search_criteria) + '"' if search_criteria else "ALL"
-        )
+        Args:
+            uids (List[str]): UIDs of the messages in the folder (the "uid" of
+                the email information)
+            folder (str): Folder the UIDs belong to (default: INBOX)
 
-        return self.read_emails(folder, limit, search_string)
+        Returns:
+            int: Number of messages labeled
+
+        Raises:
+            Exception: Connection and store errors
+        """
+        uids = [uid for uid in dict.fromkeys(uids) if uid]
+        if not self.processed_label or not uids:
+            return 0
+
+        def label() -> None:
+            imap_server = self._acquire()
+            completed = False
+            try:
+                imap_server.select(folder)
+                store_labels(imap_server, uids, self.processed_label)
+                imap_server.close()
+                completed = True
+            except Exception as e:
+                metrics.incr("imap.errors", error=type(e).__name__)
+                raise
+            finally:
+                self._release(imap_server, reusable=completed)
+
+        # Adding a label twice is harmless, so the whole store is retried
+        self.retry_policy.call(label, deadline=self.deadline, operation="IMAP label")
+        return len(uids)
+
+    def open_folder(self, folder: str = "INBOX") -> imaplib.IMAP4:
+        """
+        Connect, log in and select a folder
+
+        Args:
+            folder (str): Email folder to select (default: INBOX)
+
+        Returns:
+            imaplib.IMAP4: The connection, to be logged out by the caller
+        """
+        try:
+            with metrics.span("imap.connect"):
+                imap_server = self._connect_imap()
+        except Exception as e:
+            metrics.incr("imap.errors", error=type(e).__name__)
+            raise
+        imap_server.select(folder)
+        return imap_server
+
+    def exclusion_terms(self) -> str:
+        """Exclusion terms of filtered searches, including the processed label"""
+        terms = [self.search_exclude]
+        if self.processed_label:
+            # Gmail searches labels with their slashes as hyphens
+            terms.append("-label:" + self.processed_label.replace("/", "-").replace(" ", "-"))
+        return " ".join(term for term in terms if term)
 
     def test_connection(self) -> Dict[str, bool]:
         """
@@ -219,7 +429,7 @@ class Gmail:
 
         # Test SMTP connection
         try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+            with smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout) as server:
                 server.starttls()
                 server.login(self.email_address, self.password)
                 results["smtp"] = True
@@ -229,8 +439,7 @@ class Gmail:
 
         # Test IMAP connection
         try:
-            imap_server = imaplib.IMAP4_SSL(self.imap_server)
-            imap_server.login(self.email_address, self.password)
+            imap_server = self._connect_imap()
             imap_server.logout()
             results["imap"] = True
             print("IMAP Connection Successful")
@@ -238,3 +447,327 @@ class Gmail:
             print(f"IMAP Connection Error: {str(e)}")
 
         return results
+
+
+class IMAPStream:
+    """
+    The socket reads and writes of an IMAP connection
+
+    Replaces the I/O methods of an imaplib connection to count the bytes
+    crossing the network and, once COMPRESS=DEFLATE (RFC 4978) is active,
+    to deflate what is sent and inflate what is received. The metrics
+    imap.wire_bytes and imap.payload_bytes count the bytes on the network
+    and before compression, per direction, from the login on.
+    """
+
+    def __init__(self, imap_server: imaplib.IMAP4):
+        """
+        Args:
+            imap_server (imaplib.IMAP4): A connection that has read the greeting
+        """
+        self.file = imap_server.file
+        self.sock = imap_server.sock
+        self.compressor = None
+        self.decompressor = None
+        # Inflated bytes not read yet
+        self.buffer = bytearray()
+        # imaplib reads through its file and writes through send
+        imap_server.file = self
+        imap_server.send = self.send
+
+    @property
+    def compressed(self) -> bool:
+        return self.decompressor is not None
+
+    def start_compression(self) -> None:
+        """Compress from now on, after the server accepted the COMPRESS command"""
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self.decompressor = zlib.decompressobj(-15)
+
+    def send(self, data: bytes) -> None:
+        metrics.incr("imap.payload_bytes", len(data), direction="sent")
+        if self.compressor is not None:
+            # Every command is flushed whole, the server answers it right away
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        metrics.incr("imap.wire_bytes", len(data), direction="sent")
+        self.sock.sendall(data)
+
+    def read(self, size: int) -> bytes:
+        if self.decompressor is None:
+            data = self.file.read(size)
+            self._count(len(data), len(data))
+            return data
+        while len(self.buffer) < size and self._fill():
+            pass
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readline(self, limit: int = -1) -> bytes:
+        if self.decompressor is None:
+            line = self.file.readline(limit)
+            self._count(len(line), len(line))
+            return line
+        start = 0
+        while (end := self.buffer.find(b"\n", start)) < 0:
+            start = len(self.buffer)
+            if 0 <= limit <= start or not self._fill():
+                end = len(self.buffer) - 1
+                break
+        if limit >= 0:
+            end = min(end, limit - 1)
+        line = bytes(self.buffer[: end + 1])
+        del self.buffer[: end + 1]
+        return line
+
+    def peek(self, size: int = 1) -> bytes:
+        """Buffered bytes, without blocking when the socket is non-blocking"""
+        if self.decompressor is None:
+            return self.file.peek(size)
+        if not self.buffer:
+            self._fill()
+        return bytes(self.buffer[:size])
+
+    def close(self) -> None:
+        self.file.close()
+
+    def _fill(self) -> bool:
+        """Inflate the next compressed bytes, False at the end of the stream"""
+        chunk = self.file.read1(READ_SIZE)
+        if chunk is None:
+            # Nothing to read on a non-blocking socket
+            raise BlockingIOError
+        if not chunk:
+            return False
+        data = self.decompressor.decompress(chunk)
+        self._count(len(chunk), len(data))
+        self.buffer += data
+        return True
+
+    @staticmethod
+    def _count(wire: int, payload: int) -> None:
+        metrics.incr("imap.wire_bytes", wire, direction="received")
+        metrics.incr("imap.payload_bytes", payload, direction="received")
+
+
+def enable_compression(imap_server: imaplib.IMAP4, stream: IMAPStream) -> bool:
+    """
+    Start COMPRESS=DEFLATE on a logged in connection, if the server supports it
+
+    Args:
+        imap_server (imaplib.IMAP4): The logged in connection
+        stream (IMAPStream): The stream of the connection
+
+    Returns:
+        bool: The connection is compressed
+    """
+    capabilities = {capability.upper() for capability in imap_server.capabilities}
+    # Gmail only lists the extension in the capabilities of its LOGIN response
+    _, codes = imap_server.response("CAPABILITY")
+    for code in codes or []:
+        if code:
+            capabilities.update(code.decode(errors="replace").upper().split())
+    if "COMPRESS=DEFLATE" not in capabilities:
+        return False
+
+    status, _ = imap_server.xatom("COMPRESS", "DEFLATE")
+    if status != "OK":
+        return False
+    stream.start_compression()
+    metrics.incr("imap.compressed_connections")
+    return True
+
+
+def filtered_search_string(
+    sender: Union[str, None] = None,
+    date_interval: Union[List[datetime], None] = None,
+    subjects: Union[List[str], None] = None,
+    excluded_subjects: Union[List[str], None] = None,
+    exclude: Union[str, None] = None,
+) -> str:
+    """
+    Build the Gmail search of the emails of a sender inside a date interval
+
+    Gmail applies the subject, label and category filters itself, so the
+    emails they leave out are never downloaded.
+
+    Args:
+        sender (str, optional): Filter emails from specific sender
+        date_interval (List[datetime], optional): List containing [from_date, to_date]
+            defaults to [yesterday, now]
+        subjects (List[str], optional): Subject phrases, any of which the
+            subject must contain
+        excluded_subjects (List[str], optional): Subject phrases the subject
+            must not contain
+        exclude (str, optional): Raw Gmail search terms, e.g. "-category:promotions"
+
+    Returns:
+        str: The IMAP search criteria
+    """
+    # Set default date interval if none provided
+    if date_interval is None:
+        now = datetime.now()
+        date_interval = [now - timedelta(days=1), now]
+
+    start_timestamp = int(date_interval[0].timestamp())
+    end_timestamp = int(date_interval[1].timestamp())
+
+    # Build search criteria
+    search_criteria = []
+
+    if sender:
+        search_criteria.append(f"from:{sender}")
+
+    # Add date range criteria using timestamps
+    search_criteria.append(f"after:{start_timestamp} before:{end_timestamp}")
+
+    # Braces combine the subject phrases with OR
+    subject_terms = [_subject_term(subject) for subject in subjects or []]
+    if len(subject_terms) == 1:
+        search_criteria.append(subject_terms[0])
+    elif subject_terms:
+        search_criteria.append("{" + " ".join(subject_terms) + "}")
+    search_criteria.extend(
+        "-" + _subject_term(subject) for subject in excluded_subjects or []
+    )
+
+    if exclude:
+        search_criteria.append(exclude)
+
+    return gmail_raw(search_criteria)
+
+
+def gmail_raw(search_criteria: List[str]) -> str:
+    """
+    IMAP search criteria of a Gmail search
+
+    Args:
+        search_criteria (List[str]): Gmail search terms, combined with AND
+
+    Returns:
+        str: The X-GM-RAW criteria, with the query quoted as an IMAP string
+    """
+    query = " ".join(search_criteria).replace("\\", "\\\\").replace('"', '\\"')
+    return f'X-GM-RAW "{query}"'
+
+
+def fetch_email(imap_server: imaplib.IMAP4, message: bytes, by_uid: bool = False) -> Dict:
+    """
+    Fetch and parse one message of the selected folder
+
+    Args:
+        imap_server (imaplib.IMAP4): Connection with a selected folder
+        message (bytes): Sequence number or, with by_uid, UID of the message
+        by_uid (bool): message is a UID (default: False)
+
+    Returns:
+        Dict: The email information, see `parse_email`, and the "uid" of the
+            message
+    """
+    with metrics.span("imap.fetch"):
+        if by_uid:
+            _, msg_data = imap_server.uid("FETCH", message, "(UID RFC822)")
+        else:
+            _, msg_data = imap_server.fetch(message, "(UID RFC822)")
+    raw_email = msg_data[0][1]
+    metrics.incr("imap.messages")
+    metrics.incr("imap.bytes_fetched", len(raw_email))
+    with metrics.span("mime.parse"):
+        email_info = parse_email(raw_email)
+    # Identifies the message for mark_processed
+    uid = FETCH_UID_PATTERN.search(msg_data[0][0])
+    email_info["uid"] = uid.group(1).decode() if uid else None
+    return email_info
+
+
+def store_labels(imap_server: imaplib.IMAP4, uids: List[str], label: str) -> None:
+    """
+    Add a Gmail label to messages of the selected folder, in batched UID STORE commands
+
+    Args:
+        imap_server (imaplib.IMAP4): Connection with a selected folder
+        uids (List[str]): UIDs of the messages
+        label (str): The label, e.g. "cc-logger/processed"
+
+    Raises:
+        imaplib.IMAP4.error: If the server rejects a command
+    """
+    label = '("' + label.replace('"', "") + '")'
+    for start in range(0, len(uids), LABEL_BATCH_SIZE):
+        batch = uids[start : start + LABEL_BATCH_SIZE]
+        with metrics.span("imap.store"):
+            status, response = imap_server.uid(
+                "STORE", ",".join(batch), "+X-GM-LABELS", label
+            )
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"Labeling failed: {response}")
+        metrics.incr("imap.labeled", len(batch))
+
+
+def _logout(imap_server: imaplib.IMAP4) -> None:
+    try:
+        imap_server.logout()
+    except Exception:
+        pass
+
+
+def _subject_term(subject: str) -> str:
+    """Gmail search term of a subject phrase"""
+    return 'subject:"' + " ".join(subject.replace('"', " ").split()) + '"'
+
+
+def parse_email(raw_email: bytes) -> Dict:
+    """
+    Parse a raw RFC822 email into the email information used by the extractors
+
+    Args:
+        raw_email (bytes): The raw email
+
+    Returns:
+        Dict: Dictionary containing the email information
+    """
+    email_message = email.message_from_bytes(raw_email)
+
+    # Extract email information
+    email_info = {
+        "message_id": email_message["message-id"],
+        "from": email_message["from"],
+        "subject": email_message["subject"],
+        "date": email.utils.parsedate_to_datetime(email_message["date"]).astimezone(
+            pytz.timezone("Asia/Manila")
+        ),
+        "body": "",
+    }
+
+    # Get email body with improved content handling
+    if email_message.is_multipart():
+        # Try to find text/plain first, then text/html
+        text_content = None
+        html_content = None
+
+        for part in email_message.walk():
+            content_type = part.get_content_type()
+            if content_type == "text/plain" and not text_content:
+                text_content = part.get_payload(decode=True)
+            elif content_type == "text/html" and not html_content:
+                html_content = part.get_payload(decode=True)
+
+        # Prefer plain text, fall back to HTML if plain text is not available
+        if text_content:
+            email_info["body"] = _decode_payload(text_content)
+        elif html_content:
+            email_info["body"] = _decode_payload(html_content)
+    else:
+        # Handle non-multipart messages
+        payload = email_message.get_payload(decode=True)
+        if payload:
+            email_info["body"] = _decode_payload(payload)
+
+    return email_info
+
+
+def _decode_payload(payload: bytes) -> str:
+    try:
+        return payload.decode("utf-8", errors="replace")
+    except Exception:
+        return payload.decode("latin-1", errors="replace")
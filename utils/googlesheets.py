@@ -1,17 +1,15 @@
 import os
 from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Tuple
 
-import gspread
-import pandas as pd
-from dotenv import load_dotenv
-from google.oauth2.service_account import Credentials
-from gspread_formatting import (
-    BooleanCondition,
-    DataValidationRule,
-    set_data_validation_for_cell_range,
-)
+from utils import load_env
+from utils.metrics import metrics
+from utils.records import TransactionRecord
+from utils.retry import DEFAULT_TIMEOUT
 
-load_dotenv()
+if TYPE_CHECKING:
+    import gspread
+    from gspread_formatting import DataValidationRule
 
 categories: list = [
     "Groceries",
@@ -31,13 +29,30 @@ categories: list = [
 
 
 class SheetManager:
-    def __init__(self, credentials_path: str):
+    def __init__(
+        self,
+        credentials_path: str | None = None,
+        client: "gspread.Client | None" = None,
+        timeout: float | None = DEFAULT_TIMEOUT,
+    ):
         """
         Initialize Google Sheets connection
 
         Args:
             credentials_path (str): Path to Google Service Account credentials JSON file
+            client (gspread.Client, optional): Use an existing client instead of
+                authorizing with the credentials file
+            timeout (float, optional): Seconds an API request may wait for the
+                server when authorizing with the credentials file, None to
+                wait forever (default: DEFAULT_TIMEOUT)
         """
+        # Spreadsheets opened so far, reused by the runs of a resident service
+        self.spreadsheets: Dict[str, "gspread.Spreadsheet"] = {}
+        if client is not None:
+            self.client = client
+            _instrument_http_client(self.client.http_client)
+            return
+
         # Define the required scopes
         scopes = [
             "https://www.googleapis.com/auth/spreadsheets",
@@ -45,128 +60,97 @@ class SheetManager:
         ]
 
         # Set up credentials
+        import gspread
+        from google.oauth2.service_account import Credentials
+
         credentials = Credentials.from_service_account_file(
             credentials_path, scopes=scopes
         )
 
         # Create gspread client
         self.client = gspread.authorize(credentials)
+        self.client.http_client.set_timeout(timeout)
+        _instrument_http_client(self.client.http_client)
+
+    def open_spreadsheet(self, spreadsheet_id: str) -> "gspread.Spreadsheet":
+        """
+        Open a spreadsheet, once per client
+
+        Args:
+            spreadsheet_id (str): ID of the Google Sheet
+
+        Returns:
+            gspread.Spreadsheet: The spreadsheet
+        """
+        sheet = self.spreadsheets.get(spreadsheet_id)
+        if sheet is None:
+            sheet = self.spreadsheets[spreadsheet_id] = self.client.open_by_key(
+                spreadsheet_id
+            )
+        return sheet
 
     def create_logger_sheet(
         self,
         prefix: str,
         spreadsheet_id: str,
         statement_day: int,
-    ) -> gspread.Worksheet:
-        sheet = self.client.open_by_key(spreadsheet_id)
-
-        if datetime.now().day >= statement_day:
-            month = str(datetime.now().month).zfill(2)
-            year = datetime.now().year
-            WORKSHEET_NAME = f"{year}{month}{statement_day}"
-        else:
-            month = datetime.now().month
-            if month == 1:
-                year = datetime.now().year - 1
-                month = 12
-            else:
-                year = datetime.now().year
-                month = month - 1
+        date: datetime | None = None,
+    ) -> "gspread.Worksheet":
+        """
+        Get or create the worksheet of the statement cycle containing a date
+
+        Args:
+            prefix (str): Worksheet name prefix of the card
+            spreadsheet_id (str): ID of the Google Sheet
+            statement_day (int): Day of the month the statement is generated
+            date (datetime, optional): Date inside the cycle (default: now)
+
+        Returns:
+            gspread.Worksheet: The worksheet of the statement cycle
+        """
+        import gspread
+
+        sheet = self.open_spreadsheet(spreadsheet_id)
 
         WORKSHEET_NAME = (
-            f"{prefix}_{year}{str(month).zfill(2)}{str(statement_day).zfill(2)}"
+            f"{prefix}_{statement_cycle_key(date or datetime.now(), statement_day)}"
         )
         print(f"WORKSHEET_NAME: {WORKSHEET_NAME}")
 
         try:
             worksheet = sheet.worksheet(WORKSHEET_NAME)
         except gspread.WorksheetNotFound:
-            worksheet = sheet.add_worksheet(WORKSHEET_NAME, rows=1, cols=1)
-
-            # Get all worksheets
-            worksheets = sheet.worksheets()
-
-            # Reorder worksheets to move the new sheet to the 2nd position
-            new_order = [worksheets[0], worksheets[1], worksheet] + worksheets[
-                2:
-            ]  # Insert new sheet at 2nd place
-            new_order.pop(-1)
-            sheet.reorder_worksheets(new_order)
-
-            headers = [
-                "paid",
-                "date",
-                "card_number",
-                "total_amount",
-                "posted",
-                "merchant",
-                "category",
-                "payer",
-                "",
-                "",
-            ]
-            worksheet.update([headers])
-            worksheet_widths = [
-                75,
-                150,
-                100,
-                100,
-                75,
-                250,
-                250,
-                100,
-                15,
-                100,
-            ]
-            request_widths = [
-                {
-                    "updateDimensionProperties": {
-                        "range": {
-                            "sheetId": worksheet.id,
-                            "dimension": "COLUMNS",
-                            "startIndex": i,  # 0-based index
-                            "endIndex": i + 1,
-                        },
-                        "properties": {
-                            "pixelSize": width  # width for 'checked' column
-                        },
-                        "fields": "pixelSize",
-                    }
-                }
-                for i, width in enumerate(worksheet_widths)
-            ]
-            request_type_format = [
-                {
-                    "repeatCell": {
-                        "range": {
-                            "sheetId": worksheet.id,
-                            "startRowIndex": 0,  # Skip header row
-                            "endRowIndex": 1000,  # Adjust this number based on your needs
-                            "startColumnIndex": 3,  # 0-based index for total_amount column
-                            "endColumnIndex": 4,
-                        },
-                        "cell": {
-                            "userEnteredFormat": {
-                                "numberFormat": {
-                                    "type": "NUMBER",
-                                    "pattern": "#,##0.00",  # Format for 2 decimal places
-                                }
-                            }
-                        },
-                        "fields": "userEnteredFormat.numberFormat",
-                    }
-                }
-            ]
-
-            sheet.batch_update({"requests": request_widths})
-            sheet.batch_update({"requests": request_type_format})
+            worksheet = self._create_worksheet(sheet, WORKSHEET_NAME)
 
         return worksheet
 
+    def _create_worksheet(
+        self, sheet: "gspread.Spreadsheet", worksheet_name: str
+    ) -> "gspread.Worksheet":
+        """
+        Add a new logger worksheet with headers, column widths and number format
+
+        Args:
+            sheet: The spreadsheet to add the worksheet to
+            worksheet_name: Name of the new worksheet
+
+        Returns:
+            gspread.Worksheet: The new worksheet
+        """
+        import gspread
+
+        print(f"Creating worksheet {worksheet_name}")
+        sheet_id = _next_sheet_id(sheet.worksheets())
+        response = sheet.batch_update(
+            {"requests": _new_worksheet_requests(sheet_id, worksheet_name, row_count=1)}
+        )
+        properties = response["replies"][0]["addSheet"]["properties"]
+        return gspread.Worksheet(sheet, properties, sheet.id, sheet.client)
+
     def update_logger_sheet(
         self,
-        worksheet: gspread.Worksheet,
-        df: pd.DataFrame,
+        worksheet: "gspread.Worksheet",
+        records: List[TransactionRecord],
         end_date: datetime,
     ) -> None:
         """
@@ -174,49 +158,22 @@ class SheetManager:
 
         Args:
             worksheet: The worksheet to update
-            df: The dataframe containing the new transactions
+            records: The new transactions
         """
 
-        if df.empty:
+        if not records:
             print("No new transactions to update")
             return
 
-        payer_users: list = os.getenv("PAYER_USERS", "user_1,user_2,others").split(",")
-
-        checkbox_rule = DataValidationRule(
-            BooleanCondition("BOOLEAN"),
-            showCustomUi=True,  # Shows the checkbox UI in Google Sheets
-        )
-        validation_rule = DataValidationRule(
-            BooleanCondition("ONE_OF_LIST", payer_users),
-            showCustomUi=True,  # Shows the dropdown arrow
-        )
-        category_validation_rule = DataValidationRule(
-            BooleanCondition("ONE_OF_LIST", categories),
-            showCustomUi=True,  # Shows the dropdown arrow
-        )
+        payer_users = _payer_users()
 
         # Prepare the data
-        data = []
         values_list = worksheet.col_values(5)  # 2 for column E (merchant column)
         last_row = len(
             [x for x in values_list if x.strip() != ""]
         )  # Count non-empty values
 
-        for _, row in df.iterrows():
-            data.append(
-                [
-                    False,
-                    row["date"].strftime("%Y-%m-%d %H:%M:%S"),
-                    row["card_number"],
-                    row["total_paid_amount"],
-                    False,
-                    row["merchant"],
-                    row["category"],
-                    payer_users[0],
-                    "",
-                ]
-            )
+        data = _build_rows(records, payer_users)
 
         if data:
             # Check current row count and resize if necessary
@@ -241,11 +198,340 @@ class SheetManager:
             start_range = f"A{last_row + 1}"
             worksheet.update(start_range, data)
 
-            set_data_validation_for_cell_range(worksheet, "A2:A1000", checkbox_rule)
-            set_data_validation_for_cell_range(worksheet, "E2:E1000", checkbox_rule)
-            set_data_validation_for_cell_range(
-                worksheet, "G2:G1000", category_validation_rule
+            from gspread_formatting import set_data_validation_for_cell_range
+
+            for cell_range, rule in _validation_rules(payer_users):
+                set_data_validation_for_cell_range(worksheet, cell_range, rule)
+
+        print(f"Successfully uploaded {len(records)} transactions to Google Sheets")
+
+    def update_logger_sheets(
+        self,
+        prefix: str,
+        spreadsheet_id: str,
+        statement_day: int,
+        records: List[TransactionRecord],
+    ) -> Dict[str, int]:
+        """
+        Upload transactions to the worksheet of their own statement cycle
+
+        Transactions are grouped by the cycle of their date, and the upload
+        takes the same few API calls however many cycles it spans: one
+        metadata request, one batched read of the last rows, one batch update
+        creating the missing cycle worksheets (headers, widths and position
+        included), resizing and validating, and one batched values request.
+
+        Args:
+            prefix (str): Worksheet name prefix of the card
+            spreadsheet_id (str): ID of the Google Sheet
+            statement_day (int): Day of the month the statement is generated
+            records: The new transactions
+
+        Returns:
+            Dict[str, int]: Number of rows written per worksheet name
+        """
+        if not records:
+            print("No new transactions to update")
+            return {}
+
+        from gspread.utils import a1_range_to_grid_range
+
+        payer_users = _payer_users()
+
+        sheet = self.open_spreadsheet(spreadsheet_id)
+        worksheets = sheet.worksheets()
+        existing = {worksheet.title: worksheet for worksheet in worksheets}
+        next_sheet_id = _next_sheet_id(worksheets)
+
+        # Group the transactions per statement cycle, oldest cycle first
+        cycles: Dict[str, List[TransactionRecord]] = {}
+        for record in records:
+            cycles.setdefault(
+                statement_cycle_key(record.date, statement_day), []
+            ).append(record)
+
+        # (worksheet name, sheet ID, existing worksheet or None, rows)
+        groups = []
+        requests = []
+        for cycle_key, group in sorted(cycles.items()):
+            worksheet_name = f"{prefix}_{cycle_key}"
+            rows = _build_rows(group, payer_users)
+            worksheet = existing.get(worksheet_name)
+            if worksheet is None:
+                # Created by the batch update below, with its header row
+                print(f"Creating worksheet {worksheet_name}")
+                requests += _new_worksheet_requests(
+                    next_sheet_id, worksheet_name, row_count=len(rows) + 2
+                )
+                groups.append((worksheet_name, next_sheet_id, None, rows))
+                next_sheet_id += 1
+            else:
+                groups.append((worksheet_name, worksheet.id, worksheet, rows))
+
+        # Find the last row with content of every existing worksheet in one
+        # request, new worksheets only have their header row
+        last_rows = {name: 1 for name, _, worksheet, _ in groups if worksheet is None}
+        ranges = [name for name, _, worksheet, _ in groups if worksheet is not None]
+        if ranges:
+            value_ranges = sheet.values_batch_get(
+                [f"'{name}'!F:F" for name in ranges]
+            ).get("valueRanges", [])
+            for name, value_range in zip(ranges, value_ranges):
+                last_rows[name] = len(
+                    [x for x in value_range.get("values", []) if x and str(x[0]).strip()]
+                )  # Count non-empty values of column F (merchant column)
+
+        data = []
+        for worksheet_name, sheet_id, worksheet, rows in groups:
+            last_row = last_rows[worksheet_name]
+
+            needed_rows = last_row + len(rows) + 1  # Current last row + new data + buffer
+            if worksheet is not None and worksheet.row_count < needed_rows:
+                requests.append(
+                    {
+                        "updateSheetProperties": {
+                            "properties": {
+                                "sheetId": sheet_id,
+                                "gridProperties": {
+                                    "rowCount": needed_rows,
+                                    "columnCount": 10,  # update this if you will add a column
+                                },
+                            },
+                            "fields": "gridProperties.rowCount,gridProperties.columnCount",
+                        }
+                    }
+                )
+
+            for cell_range, rule in _validation_rules(payer_users):
+                requests.append(
+                    {
+                        "setDataValidation": {
+                            "range": a1_range_to_grid_range(cell_range, sheet_id),
+                            "rule": rule.to_props(),
+                        }
+                    }
+                )
+
+            data.append(
+                {"range": f"'{worksheet_name}'!A{last_row + 1}", "values": rows}
             )
-            set_data_validation_for_cell_range(worksheet, "H2:H1000", validation_rule)
 
-        print(f"Successfully uploaded {len(df)} transactions to Google Sheets")
+        # Resize and validations first so the values fit in the grid
+        with metrics.span("sheets.write"):
+            sheet.batch_update({"requests": requests})
+            sheet.values_batch_update({"valueInputOption": "RAW", "data": data})
+
+        uploaded = {worksheet_name: len(rows) for worksheet_name, _, _, rows in groups}
+        metrics.incr("sheets.rows_written", len(records))
+        for worksheet_name, count in uploaded.items():
+            print(f"Uploaded {count} transactions to {worksheet_name}")
+        print(f"Successfully uploaded {len(records)} transactions to Google Sheets")
+
+        return uploaded
+
+
+def _instrument_http_client(http_client) -> None:
+    """
+    Count the API calls, response sizes and errors of a gspread HTTP client
+    in the run metrics
+
+    Args:
+        http_client: The http_client of a gspread.Client
+    """
+    from gspread.exceptions import APIError
+
+    request = http_client.request
+
+    def instrumented_request(method, endpoint, *args, **kwargs):
+        if not metrics.enabled:
+            return request(method, endpoint, *args, **kwargs)
+
+        method = method.upper()
+        try:
+            with metrics.span("sheets.request", method=method):
+                response = request(method, endpoint, *args, **kwargs)
+        except APIError as e:
+            metrics.incr("sheets.api_errors", method=method, status=e.code)
+            raise
+        metrics.incr("sheets.api_calls", method=method)
+        metrics.incr("sheets.response_bytes", len(response.content))
+        return response
+
+    http_client.request = instrumented_request
+
+
+def statement_cycle_key(date: datetime, statement_day: int) -> str:
+    """
+    Get the statement cycle key (YYYYMMDD of the cycle start) of a date
+
+    Args:
+        date (datetime): The transaction date
+        statement_day (int): Day of the month the statement is generated
+
+    Returns:
+        str: The cycle key, e.g. "20250509"
+    """
+    year, month = date.year, date.month
+    if date.day < statement_day:
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return f"{year}{str(month).zfill(2)}{str(statement_day).zfill(2)}"
+
+
+def _next_sheet_id(worksheets: List["gspread.Worksheet"]) -> int:
+    """Get an unused sheet ID, so a batch update can add and use a worksheet"""
+    return max((worksheet.id for worksheet in worksheets), default=0) + 1
+
+
+def _new_worksheet_requests(sheet_id: int, worksheet_name: str, row_count: int) -> list:
+    """
+    Get the batch update requests adding a logger worksheet in 3rd position,
+    with its headers, column widths and number format
+
+    Args:
+        sheet_id (int): ID of the new worksheet, see _next_sheet_id
+        worksheet_name (str): Name of the new worksheet
+        row_count (int): Rows of the new worksheet, the header row included
+
+    Returns:
+        list: The requests
+    """
+    headers = [
+        "paid",
+        "date",
+        "card_number",
+        "total_amount",
+        "posted",
+        "merchant",
+        "category",
+        "payer",
+        "",
+        "",
+    ]
+    worksheet_widths = [
+        75,
+        150,
+        100,
+        100,
+        75,
+        250,
+        250,
+        100,
+        15,
+        100,
+    ]
+    request_add = [
+        {
+            "addSheet": {
+                "properties": {
+                    "sheetId": sheet_id,
+                    "title": worksheet_name,
+                    # After the first two worksheets, newest cycle first
+                    "index": 2,
+                    "sheetType": "GRID",
+                    "gridProperties": {"rowCount": row_count, "columnCount": len(headers)},
+                }
+            }
+        },
+        {
+            "updateCells": {
+                "rows": [
+                    {
+                        "values": [
+                            {"userEnteredValue": {"stringValue": header}}
+                            for header in headers
+                        ]
+                    }
+                ],
+                "start": {"sheetId": sheet_id, "rowIndex": 0, "columnIndex": 0},
+                "fields": "userEnteredValue",
+            }
+        },
+    ]
+    request_widths = [
+        {
+            "updateDimensionProperties": {
+                "range": {
+                    "sheetId": sheet_id,
+                    "dimension": "COLUMNS",
+                    "startIndex": i,  # 0-based index
+                    "endIndex": i + 1,
+                },
+                "properties": {
+                    "pixelSize": width  # width for 'checked' column
+                },
+                "fields": "pixelSize",
+            }
+        }
+        for i, width in enumerate(worksheet_widths)
+    ]
+    request_type_format = [
+        {
+            "repeatCell": {
+                "range": {
+                    "sheetId": sheet_id,
+                    "startRowIndex": 0,  # Skip header row
+                    "endRowIndex": 1000,  # Adjust this number based on your needs
+                    "startColumnIndex": 3,  # 0-based index for total_amount column
+                    "endColumnIndex": 4,
+                },
+                "cell": {
+                    "userEnteredFormat": {
+                        "numberFormat": {
+                            "type": "NUMBER",
+                            "pattern": "#,##0.00",  # Format for 2 decimal places
+                        }
+                    }
+                },
+                "fields": "userEnteredFormat.numberFormat",
+            }
+        }
+    ]
+    return request_add + request_widths + request_type_format
+
+
+def _payer_users() -> list:
+    """Get the possible payers for the payer dropdown"""
+    load_env()
+    return os.getenv("PAYER_USERS", "user_1,user_2,others").split(",")
+
+
+def _validation_rules(payer_users: list) -> List[Tuple[str, "DataValidationRule"]]:
+    """Get the data validation rule of every validated column range"""
+    from gspread_formatting import BooleanCondition, DataValidationRule
+
+    checkbox_rule = DataValidationRule(
+        BooleanCondition("BOOLEAN"),
+        showCustomUi=True,  # Shows the checkbox UI in Google Sheets
+    )
+    validation_rule = DataValidationRule(
+        BooleanCondition("ONE_OF_LIST", payer_users),
+        showCustomUi=True,  # Shows the dropdown arrow
+    )
+    category_validation_rule = DataValidationRule(
+        BooleanCondition("ONE_OF_LIST", categories),
+        showCustomUi=True,  # Shows the dropdown arrow
+    )
+    return [
+        ("A2:A1000", checkbox_rule),
+        ("E2:E1000", checkbox_rule),
+        ("G2:G1000", category_validation_rule),
+        ("H2:H1000", validation_rule),
+    ]
+
+
+def _build_rows(records: List[TransactionRecord], payer_users: list) -> list:
+    """Format the transactions into worksheet rows"""
+    return [
+        [
+            False,
+            record.date.strftime("%Y-%m-%d %H:%M:%S"),
+            record.card_number,
+            record.total_paid_amount,
+            False,
+            record.merchant,
+            record.category,
+            payer_users[0],
+            "",
+        ]
+        for record in records
+    ]
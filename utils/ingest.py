@@ -0,0 +1,201 @@
+import mailbox
+import mmap
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Union
+
+from utils.extractors import TransactionExtractor, get_merchant_for_email
+from utils.extractors.route_stats import route_stats
+from utils.gmail import parse_email
+from utils.records import TransactionRecord
+
+# mboxrd quotes body lines starting with "From " as ">From ", ">>From ", ...
+MBOXRD_QUOTED_FROM = re.compile(rb"^>(>*From )", re.MULTILINE)
+
+
+def iter_mbox(path: str) -> Iterator[bytes]:
+    """
+    Stream the raw messages of an mbox file (e.g. a Google Takeout export)
+
+    The file is memory-mapped so messages are sliced out without reading the
+    whole export into memory. Falls back to `mailbox.mbox` when the file
+    cannot be mapped.
+
+    Args:
+        path (str): Path to the mbox file
+
+    Yields:
+        bytes: Raw RFC822 message
+    """
+    with open(path, "rb") as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and special files cannot be mapped
+            for message in mailbox.mbox(path, create=False):
+                yield message.as_bytes()
+            return
+
+        with mapped:
+            start = 0 if mapped[:5] == b"From " else mapped.find(b"\nFrom ")
+            while start != -1:
+                # Skip the "From " separator line
+                body_start = mapped.find(b"\n", start + 1)
+                if body_start == -1:
+                    break
+                end = mapped.find(b"\nFrom ", body_start)
+                message = mapped[body_start + 1 : len(mapped) if end == -1 else end + 1]
+                yield MBOXRD_QUOTED_FROM.sub(rb"\1", message)
+                start = end
+
+
+def iter_maildir(path: str) -> Iterator[bytes]:
+    """
+    Stream the raw messages of a Maildir
+
+    Args:
+        path (str): Path to the Maildir (containing cur/, new/ and tmp/)
+
+    Yields:
+        bytes: Raw RFC822 message
+    """
+    maildir = mailbox.Maildir(path, factory=None, create=False)
+    for key in maildir.iterkeys():
+        yield maildir.get_bytes(key)
+
+
+def iter_eml_dir(path: str) -> Iterator[bytes]:
+    """
+    Stream the raw messages of a directory of .eml files (searched recursively)
+
+    Args:
+        path (str): Path to the directory
+
+    Yields:
+        bytes: Raw RFC822 message
+    """
+    for eml_path in sorted(Path(path).rglob("*.eml")):
+        yield eml_path.read_bytes()
+
+
+def iter_messages(path: str) -> Iterator[bytes]:
+    """
+    Stream the raw messages of an mbox file, a Maildir or a directory of .eml files
+
+    Args:
+        path (str): Path to the mail export
+
+    Yields:
+        bytes: Raw RFC822 message
+    """
+    if os.path.isfile(path):
+        return iter_mbox(path)
+    if all(os.path.isdir(os.path.join(path, sub)) for sub in ("cur", "new", "tmp")):
+        return iter_maildir(path)
+    if os.path.isdir(path):
+        return iter_eml_dir(path)
+    raise FileNotFoundError(f"No mbox, Maildir or .eml directory at {path}")
+
+
+_worker_extractor: Union[TransactionExtractor, None] = None
+
+
+def _init_worker(route_stats_path: Union[str, None] = None) -> None:
+    global _worker_extractor
+    _worker_extractor = TransactionExtractor()
+    # Workers only read the learned route order: saving it from every
+    # process would overwrite the file with partial counts
+    if route_stats_path:
+        route_stats.load(route_stats_path)
+
+
+def _extract_chunk(
+    raw_emails: List[bytes], date_interval: Union[List[datetime], None]
+) -> List[TransactionRecord]:
+    """Parse and extract a chunk of raw emails inside a worker process"""
+    extractor = _worker_extractor or TransactionExtractor()
+    transactions = []
+    for raw_email in raw_emails:
+        try:
+            email_data = parse_email(raw_email)
+        except Exception as e:
+            print(f"Skipping unparsable email: {e}")
+            continue
+
+        # Route by sender and subject, most of an export belongs to no extractor
+        merchant = get_merchant_for_email(email_data["from"], email_data.get("subject"))
+        if not merchant:
+            continue
+
+        if date_interval and not (
+            date_interval[0] <= email_data["date"] < date_interval[1]
+        ):
+            continue
+
+        transaction = extractor.extract_transaction(merchant, email_data)
+        if transaction:
+            transactions.append(transaction)
+    return transactions
+
+
+def _chunks(messages: Iterator[bytes], chunk_size: int) -> Iterator[List[bytes]]:
+    chunk = []
+    for message in messages:
+        chunk.append(message)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest_messages(
+    path: str,
+    date_interval: Union[List[datetime], None] = None,
+    workers: Union[int, None] = None,
+    chunk_size: int = 200,
+    route_stats_path: Union[str, None] = None,
+) -> List[TransactionRecord]:
+    """
+    Extract the transactions of an offline mail export
+
+    Messages are streamed from disk, routed to an extractor by sender and
+    parsed across a process pool. At most two chunks per worker are in
+    flight so memory stays bounded for multi-gigabyte exports.
+
+    Args:
+        path (str): Path to an mbox file, a Maildir or a directory of .eml files
+        date_interval (List[datetime], optional): Only keep emails in [from_date, to_date)
+            (timezone-aware dates)
+        workers (int, optional): Number of worker processes (default: CPU count)
+        chunk_size (int): Number of emails sent to a worker at a time (default: 200)
+        route_stats_path (str, optional): Route statistics the workers order
+            the extractor routes with, see route_stats
+
+    Returns:
+        List[TransactionRecord]: The extracted transactions
+    """
+    workers = workers or os.cpu_count() or 1
+    transactions = []
+    emails_read = 0
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(route_stats_path,)
+    ) as pool:
+        in_flight = set()
+        for chunk in _chunks(iter_messages(path), chunk_size):
+            emails_read += len(chunk)
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    transactions.extend(future.result())
+            in_flight.add(pool.submit(_extract_chunk, chunk, date_interval))
+
+        for future in in_flight:
+            transactions.extend(future.result())
+
+    print(f"Read {emails_read} emails, extracted {len(transactions)} transactions")
+    return transactions
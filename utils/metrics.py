@@ -0,0 +1,207 @@
+"""
+Lightweight run instrumentation.
+
+A single module-level `metrics` collector records counters and timing spans
+across the Gmail client, the extractors and the Sheets client. It is disabled
+by default, in which case `span` returns a shared no-op context manager and
+`incr` returns immediately, so instrumented code pays one attribute check.
+
+Usage:
+    from utils.metrics import metrics
+
+    metrics.enable()
+    with metrics.span("imap.fetch"):
+        ...
+    metrics.incr("imap.bytes_fetched", len(raw_email))
+    metrics.write_report("run_report.json")
+    metrics.write_prometheus("cc_logger.prom")
+"""
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Tuple
+
+PROMETHEUS_PREFIX = "cc_logger_"
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("metrics", "key", "start")
+
+    def __init__(self, metrics: "Metrics", key: Tuple):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe_key(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Counters and timing spans of a single run"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self.counters: Dict[Tuple, float] = defaultdict(float)
+        # (count, total seconds, max seconds) per span
+        self.spans: Dict[Tuple, list] = {}
+
+    def enable(self) -> None:
+        """Start collecting, discarding anything recorded before"""
+        self.reset()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increment a counter
+
+        Args:
+            name (str): Counter name, dotted by component (e.g. imap.messages)
+            value (float): Amount to add (default: 1)
+            **labels: Label values distinguishing series of the counter
+        """
+        if not self.enabled:
+            return
+        key = (name, *sorted(labels.items()))
+        with self._lock:
+            self.counters[key] += value
+
+    def span(self, name: str, **labels):
+        """
+        Time a block of code
+
+        Args:
+            name (str): Span name, dotted by component (e.g. sheets.write)
+            **labels: Label values distinguishing series of the span
+
+        Returns:
+            A context manager recording the elapsed time on exit
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, (name, *sorted(labels.items())))
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Record a duration measured by the caller"""
+        if not self.enabled:
+            return
+        self.observe_key((name, *sorted(labels.items())), seconds)
+
+    def observe_key(self, key: Tuple, seconds: float) -> None:
+        with self._lock:
+            stats = self.spans.get(key)
+            if stats is None:
+                self.spans[key] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds > stats[2]:
+                    stats[2] = seconds
+
+    def report(self) -> dict:
+        """
+        Build the run report
+
+        Returns:
+            dict: Run start time, duration, counters and spans
+        """
+        with self._lock:
+            counters = sorted(self.counters.items())
+            spans = sorted((key, list(stats)) for key, stats in self.spans.items())
+        return {
+            "started_at": self.started_at.isoformat(),
+            "duration_seconds": time.perf_counter() - self._start,
+            "counters": [
+                {"name": key[0], "labels": dict(key[1:]), "value": value}
+                for key, value in counters
+            ],
+            "spans": [
+                {
+                    "name": key[0],
+                    "labels": dict(key[1:]),
+                    "count": count,
+                    "total_seconds": total,
+                    "max_seconds": longest,
+                }
+                for key, (count, total, longest) in spans
+            ],
+        }
+
+    def write_report(self, path: str) -> None:
+        """Write the run report as JSON"""
+        _write_atomic(path, json.dumps(self.report(), indent=2))
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Write the metrics in the Prometheus text format, for the node_exporter
+        textfile collector
+
+        Args:
+            path (str): Output file, usually ending in .prom
+        """
+        report = self.report()
+        lines = []
+        for counter in report["counters"]:
+            name, labels = _metric_name(counter["name"]), _labels(counter["labels"])
+            lines.append(f"{name}_total{labels} {counter['value']:g}")
+        for span in report["spans"]:
+            name, labels = _metric_name(span["name"]), _labels(span["labels"])
+            lines.append(f"{name}_seconds_count{labels} {span['count']}")
+            lines.append(f"{name}_seconds_sum{labels} {span['total_seconds']:.6f}")
+            lines.append(f"{name}_seconds_max{labels} {span['max_seconds']:.6f}")
+        lines.append(
+            f"{PROMETHEUS_PREFIX}last_run_timestamp_seconds {self.started_at.timestamp():.0f}"
+        )
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _metric_name(name: str) -> str:
+    return PROMETHEUS_PREFIX + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _write_atomic(path: str, content: str) -> None:
+    # Scrapers must never see a half written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+
+metrics = Metrics()
@@ -0,0 +1,316 @@
+from datetime import datetime
+from typing import List, Tuple, Union
+
+from utils.extractors import (
+    TransactionExtractor,
+    group_merchants_by_sender,
+    route_emails,
+    search_subjects,
+)
+from utils.gmail import Gmail
+from utils.googlesheets import SheetManager
+from utils.metrics import metrics
+from utils.profiling import profiler
+from utils.records import TransactionRecord, filter_card
+from utils.store import TransactionStore
+
+
+class IncompleteRunError(RuntimeError):
+    """
+    The emails of some merchants could not be fetched
+
+    The transactions that were extracted are still recorded and uploaded, but
+    the run must not advance the last runtime of the card, so the next run
+    fetches the same dates again.
+    """
+
+
+def check_complete(failed: List[str]) -> None:
+    """
+    Fail a run that could not fetch every merchant, once its transactions are uploaded
+
+    Args:
+        failed (List[str]): Merchants whose emails could not be fetched
+
+    Raises:
+        IncompleteRunError: If merchants failed to fetch
+    """
+    if failed:
+        raise IncompleteRunError(f"Could not fetch the emails of {', '.join(failed)}")
+
+
+def quarantine_timed_out(
+    store: TransactionStore, timed_out: List[Tuple[str, dict]], card
+) -> int:
+    """
+    Record the emails of a run that ran past the extraction time budget
+
+    An email is only skipped once its retry ran past the retry budget too
+    (see TransactionExtractor). It is reported and kept in the store (see
+    TransactionStore.timed_out) rather than failing the run, so an email that
+    is always slow does not hold back the last runtime of the card.
+
+    Args:
+        store: The local transaction store
+        timed_out (List[Tuple[str, dict]]): The merchant and email data of
+            every skipped email
+        card: The credit card configuration (see cards/_template.py)
+
+    Returns:
+        int: Number of emails skipped
+    """
+    if not timed_out:
+        return 0
+
+    store.add_timed_out(card.LAST_DIGITS, timed_out)
+    metrics.incr("store.timed_out_recorded", len(timed_out))
+    merchants = ", ".join(sorted({merchant for merchant, _ in timed_out}))
+    print(
+        f"Skipped {len(timed_out)} {merchants} emails that ran past the extraction "
+        "time budget, they are listed by TransactionStore.timed_out"
+    )
+    return len(timed_out)
+
+
+def fetch_transactions(
+    gmail_client: Gmail,
+    transaction_extractor: TransactionExtractor,
+    merchants: list,
+    date_interval: List[datetime],
+    limit: Union[int, None] = 10,
+    processed: Union[List[str], None] = None,
+    failed: Union[List[str], None] = None,
+    card_number: Union[str, None] = None,
+    timed_out: Union[List[Tuple[str, dict]], None] = None,
+) -> List[TransactionRecord]:
+    """
+    Fetch the emails of every merchant and extract their transactions
+
+    Args:
+        gmail_client: The Gmail client
+        transaction_extractor: The transaction extractor
+        merchants (list): Merchant names as in EXTRACTOR_REGISTRY
+        date_interval (List[datetime]): List containing [from_date, to_date]
+        limit (int, optional): Maximum number of emails per sender, None for all (default: 10)
+        processed (List[str], optional): Receives the UIDs of the fetched
+            emails the card of card_number is done with, see processed_uids
+        failed (List[str], optional): Receives the merchants whose emails could
+            not be fetched. Fetch errors are raised without it
+        card_number (str, optional): Last digits of the card the run is for
+        timed_out (List[Tuple[str, dict]], optional): Receives the merchant
+            and email data of every email skipped for running past the
+            extraction time budget
+
+    Returns:
+        List[TransactionRecord]: The extracted transactions
+    """
+    records = []
+
+    # Merchants sharing a sender have their emails fetched once
+    for sender, sender_merchants in group_merchants_by_sender(merchants).items():
+        print(f"Fetching emails from {', '.join(sender_merchants)}...")
+
+        # Step 1: Fetch emails directly using the Gmail client, Gmail leaves
+        # out the subjects no extractor reads
+        subjects, excluded_subjects = search_subjects(sender_merchants)
+        try:
+            emails = gmail_client.read_emails_filtered(
+                sender=sender,
+                date_interval=date_interval,
+                limit=limit,
+                raise_errors=True,
+                subjects=subjects,
+                excluded_subjects=excluded_subjects,
+            )
+        except Exception as e:
+            if failed is None:
+                raise
+            # The other senders are still fetched
+            print(f"Error reading {', '.join(sender_merchants)} emails: {str(e)}")
+            failed.extend(sender_merchants)
+            continue
+
+        if not emails:
+            print(f"No emails found for {', '.join(sender_merchants)}")
+            continue
+
+        # Step 2: Process the emails of each merchant to extract transaction data
+        for merchant, merchant_emails in route_emails(
+            sender, emails, sender_merchants
+        ).items():
+            print(f"Found {len(merchant_emails)} emails for {merchant}")
+            extracted = transaction_extractor.extract_records(
+                merchant=merchant, emails_data=merchant_emails
+            )
+
+            if timed_out is not None:
+                timed_out.extend(
+                    (merchant, email_data)
+                    for email_data in merchant_emails
+                    if email_data.get("timed_out")
+                )
+
+            if extracted:
+                print(f"Extracted {len(extracted)} transactions from {merchant}")
+                records.extend(extracted)
+            else:
+                print(f"No valid transactions found in {merchant} emails")
+
+        if processed is not None:
+            processed.extend(processed_uids(emails, card_number))
+
+    return records
+
+
+def processed_uids(emails: List[dict], card_number: Union[str, None]) -> List[str]:
+    """
+    UIDs of fetched emails the run of a card is done with
+
+    An email is done with once it was extracted for one of the card's
+    merchants and either has no transaction or a transaction of the card.
+    Several cards may read the same mailbox, so emails of other cards and
+    emails of merchants the card does not log are left for their runs.
+    Emails skipped for running past the extraction time budget are left out,
+    so a later run or a backfill over the same dates extracts them again.
+
+    Args:
+        emails (List[dict]): The fetched emails, see Gmail.iter_emails
+        card_number (str): Last digits of the card the run is for
+
+    Returns:
+        List[str]: The UIDs
+    """
+    return [
+        email_data["uid"]
+        for email_data in emails
+        if email_data.get("uid")
+        and not email_data.get("timed_out")
+        # Set by TransactionExtractor.extract_transaction
+        and "card_number" in email_data
+        and (
+            not email_data["card_number"]
+            or str(email_data["card_number"]) == card_number
+        )
+    ]
+
+
+def run_logger(
+    card,
+    gmail_client: Gmail,
+    sheet_client: SheetManager,
+    transaction_extractor: TransactionExtractor,
+    store: TransactionStore,
+    date_interval: List[datetime],
+    limit: Union[int, None] = 10,
+) -> int:
+    """
+    Run the logger for a card: fetch, extract, record and upload
+
+    Args:
+        card: The credit card configuration (see cards/_template.py)
+        gmail_client: The Gmail client
+        sheet_client: The Google Sheets client
+        transaction_extractor: The transaction extractor
+        store: The local transaction store
+        date_interval (List[datetime]): List containing [from_date, to_date]
+        limit (int, optional): Maximum number of emails per sender, None for all (default: 10)
+
+    Returns:
+        int: Number of transactions uploaded
+
+    Raises:
+        IncompleteRunError: If the emails of some merchants could not be
+            fetched, once the others are uploaded
+    """
+    processed = []
+    failed = []
+    timed_out = []
+    with metrics.span("pipeline.fetch"), profiler.scope("stage:fetch"):
+        records = fetch_transactions(
+            gmail_client,
+            transaction_extractor,
+            card.MERCHANTS,
+            date_interval,
+            limit,
+            processed,
+            failed,
+            card.LAST_DIGITS,
+            timed_out,
+        )
+
+    # Record extracted transactions and push the pending ones to Google Sheets
+    with metrics.span("pipeline.record"), profiler.scope("stage:record"):
+        record_transactions(store, records, card)
+        quarantine_timed_out(store, timed_out, card)
+    with metrics.span("pipeline.upload"), profiler.scope("stage:upload"):
+        uploaded = upload_pending(store, sheet_client, card)
+
+    # Only once their transactions are uploaded (see Gmail.processed_label)
+    with metrics.span("pipeline.label"):
+        gmail_client.mark_processed(processed)
+
+    check_complete(failed)
+    return uploaded
+
+
+def record_transactions(
+    store: TransactionStore, records: List[TransactionRecord], card
+) -> int:
+    """
+    Record the extracted transactions of a card in the local store
+
+    Args:
+        store: The local transaction store
+        records (List[TransactionRecord]): The extracted transactions
+        card: The credit card configuration (see cards/_template.py)
+
+    Returns:
+        int: Number of new transactions recorded
+    """
+    if not records:
+        return 0
+
+    added = store.add_transactions(
+        filter_card(records, card.LAST_DIGITS),
+        statement_day=int(card.STATEMENT_DATE),
+    )
+    metrics.incr("store.transactions_recorded", added)
+    print(f"Recorded {added} new transactions in the local store")
+    return added
+
+
+def upload_pending(
+    store: TransactionStore, sheet_client: SheetManager, card
+) -> int:
+    """
+    Push the transactions of a card that are not uploaded yet to Google Sheets
+
+    Args:
+        store: The local transaction store
+        sheet_client: The Google Sheets client
+        card: The credit card configuration (see cards/_template.py)
+
+    Returns:
+        int: Number of transactions uploaded
+    """
+    pending = store.pending(card.LAST_DIGITS)
+    if not pending:
+        print("No transactions found, skipping upload to Google Sheets")
+        return 0
+
+    print(
+        f"{len(pending)} pending transactions from "
+        f"{pending[0].date:%Y-%m-%d} to {pending[-1].date:%Y-%m-%d}"
+    )
+
+    # Upload each transaction to the worksheet of its statement cycle
+    print("Uploading transactions to Google Sheets...")
+    sheet_client.update_logger_sheets(
+        prefix=card.PREFIX,
+        spreadsheet_id=card.GOOGLE_SHEET_ID,
+        statement_day=int(card.STATEMENT_DATE),
+        records=pending,
+    )
+    store.mark_uploaded(record.id for record in pending)
+    print("Done!")
+    return len(pending)
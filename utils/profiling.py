@@ -0,0 +1,280 @@
+"""
+Built-in profiling of pipeline stages and extractor routes.
+
+A single module-level `profiler` captures a cProfile profile per scope (a
+pipeline stage such as "stage:fetch" or an extractor route such as
+"route:GrabEmailExtractor.GrabFood") and, optionally, tracemalloc peaks and
+top allocations. Scopes nest: while a route runs, its stage's profile is paused,
+so every profile only holds the time spent in its own scope and the combined
+profile adds them all up. Like `utils.metrics`, it is disabled by default and
+`scope` returns a shared no-op context manager.
+
+With `slowest=N`, every extracted email is timed and the N slowest ones are
+extracted again under a profiler of their own when the report is written.
+
+Only the thread that enabled the profiler is profiled, since cProfile traces a
+single thread.
+
+Usage:
+    from utils.profiling import profiler
+
+    profiler.enable("profile", memory=True, slowest=10)
+    with profiler.scope("stage:fetch"):
+        ...
+    profiler.write_report(replay=transaction_extractor.extract_transaction)
+"""
+
+import cProfile
+import heapq
+import io
+import itertools
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Union
+
+TOP_FUNCTIONS = 15
+TOP_ALLOCATIONS = 10
+
+
+class _NoopScope:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SCOPE = _NoopScope()
+
+
+class _ScopeStats:
+    __slots__ = ("profile", "calls", "seconds", "peak_bytes", "top_allocations")
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.calls = 0
+        self.seconds = 0.0
+        self.peak_bytes = 0
+        self.top_allocations: List[str] = []
+
+
+class _Scope:
+    __slots__ = ("profiler", "name", "stats", "start", "start_bytes", "peak", "snapshot")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._push(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._pop(self)
+        return False
+
+
+class Profiler:
+    """cProfile and tracemalloc data per pipeline stage and extractor route"""
+
+    def __init__(self):
+        self.enabled = False
+        self.output_dir = None
+        self.memory = False
+        self.slowest = 0
+        self._thread = None
+        self._stack: List[_Scope] = []
+        self.scopes: Dict[str, _ScopeStats] = {}
+        self._emails: list = []
+        self._counter = itertools.count()
+
+    def enable(
+        self, output_dir: str, memory: bool = False, slowest: Union[int, None] = None
+    ) -> None:
+        """
+        Start profiling the current thread
+
+        Args:
+            output_dir (str): Directory for the pstats files and the summary
+            memory (bool): Also trace allocations with tracemalloc (default: False)
+            slowest (int, optional): Profile the N slowest emails on their own
+        """
+        self.output_dir = output_dir
+        self.memory = memory
+        self.slowest = slowest or 0
+        self._thread = threading.get_ident()
+        self._stack = []
+        self.scopes = {}
+        self._emails = []
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        self.slowest = 0
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def scope(self, name: str):
+        """
+        Profile a block of code under a scope name
+
+        Args:
+            name (str): Scope name, prefixed by its kind (e.g. stage:fetch)
+
+        Returns:
+            A context manager profiling the block
+        """
+        if not self.enabled or threading.get_ident() != self._thread:
+            return _NOOP_SCOPE
+        return _Scope(self, name)
+
+    def _push(self, scope: _Scope) -> None:
+        if self._stack:
+            outer = self._stack[-1]
+            outer.stats.profile.disable()
+            if self.memory:
+                outer.peak = max(outer.peak, tracemalloc.get_traced_memory()[1])
+
+        scope.stats = self.scopes.get(scope.name)
+        if scope.stats is None:
+            scope.stats = self.scopes[scope.name] = _ScopeStats()
+        if self.memory:
+            tracemalloc.reset_peak()
+            scope.start_bytes = tracemalloc.get_traced_memory()[0]
+            scope.peak = scope.start_bytes
+            # Snapshots are too slow to take around every email, only stages get one
+            scope.snapshot = (
+                tracemalloc.take_snapshot() if not scope.name.startswith("route:") else None
+            )
+        self._stack.append(scope)
+        scope.start = time.perf_counter()
+        scope.stats.profile.enable()
+
+    def _pop(self, scope: _Scope) -> None:
+        scope.stats.profile.disable()
+        stats = scope.stats
+        stats.calls += 1
+        stats.seconds += time.perf_counter() - scope.start
+        self._stack.pop()
+
+        if self.memory:
+            peak = max(scope.peak, tracemalloc.get_traced_memory()[1])
+            stats.peak_bytes = max(stats.peak_bytes, peak - scope.start_bytes)
+            if scope.snapshot is not None:
+                top = tracemalloc.take_snapshot().compare_to(scope.snapshot, "lineno")
+                stats.top_allocations = [str(stat) for stat in top[:TOP_ALLOCATIONS]]
+            tracemalloc.reset_peak()
+
+        if self._stack:
+            outer = self._stack[-1]
+            if self.memory:
+                outer.peak = max(outer.peak, peak)
+            outer.stats.profile.enable()
+
+    def record_email(self, merchant: str, email_data: dict, seconds: float) -> None:
+        """
+        Keep an extracted email if it is one of the N slowest so far
+
+        Args:
+            merchant (str): The merchant name of the email
+            email_data (dict): Email data with 'body', 'subject', 'date' keys
+            seconds (float): Time the extraction took
+        """
+        if not self.slowest or threading.get_ident() != self._thread:
+            return
+        entry = (seconds, next(self._counter), merchant, email_data)
+        if len(self._emails) < self.slowest:
+            heapq.heappush(self._emails, entry)
+        elif seconds > self._emails[0][0]:
+            heapq.heapreplace(self._emails, entry)
+
+    def write_report(self, replay: Union[Callable[[str, dict], object], None] = None) -> str:
+        """
+        Write a pstats file per scope, a combined pstats file and a text summary
+
+        Args:
+            replay (Callable, optional): Extraction function called as
+                replay(merchant, email_data) to profile the slowest emails
+
+        Returns:
+            str: Path of the summary file
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        lines = []
+        combined = None
+
+        # Stages first, then the slowest routes
+        ordered = sorted(
+            self.scopes.items(),
+            key=lambda item: (not item[0].startswith("stage:"), -item[1].seconds),
+        )
+        for name, stats in ordered:
+            path = os.path.join(self.output_dir, f"{_file_name(name)}.pstats")
+            stats.profile.dump_stats(path)
+            profile_stats = pstats.Stats(stats.profile)
+            combined = combined.add(stats.profile) if combined else pstats.Stats(stats.profile)
+
+            lines.append(
+                f"== {name}: {stats.calls} calls, {stats.seconds:.3f}s"
+                + (f", peak {stats.peak_bytes / 1024:.1f} KiB" if self.memory else "")
+            )
+            lines.append(f"   {path}")
+            lines.append(_top_functions(profile_stats))
+            if stats.top_allocations:
+                lines.append("   Top allocations:")
+                lines.extend(f"     {allocation}" for allocation in stats.top_allocations)
+            lines.append("")
+
+        if combined is not None:
+            combined.dump_stats(os.path.join(self.output_dir, "profile.pstats"))
+
+        if self._emails and replay is not None:
+            lines.extend(self._profile_slowest(replay))
+
+        summary_path = os.path.join(self.output_dir, "summary.txt")
+        with open(summary_path, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        return summary_path
+
+    def _profile_slowest(self, replay: Callable[[str, dict], object]) -> List[str]:
+        # Scopes would pause the email profile, so they are off while replaying
+        enabled, self.enabled = self.enabled, False
+        slowest_dir = os.path.join(self.output_dir, "slowest")
+        os.makedirs(slowest_dir, exist_ok=True)
+
+        lines = [f"== Slowest {len(self._emails)} emails"]
+        ranked = sorted(self._emails, reverse=True)
+        for rank, (seconds, _, merchant, email_data) in enumerate(ranked, 1):
+            profile = cProfile.Profile()
+            profile.runcall(replay, merchant, email_data)
+            path = os.path.join(slowest_dir, f"{rank:02d}-{_file_name(merchant)}.pstats")
+            profile.dump_stats(path)
+            lines.append(
+                f"{rank:>3}. {seconds * 1000:.1f} ms {merchant} "
+                f"{email_data.get('message_id') or ''} {email_data.get('subject', '')!r}"
+            )
+            lines.append(f"     {path}")
+        self.enabled = enabled
+        return lines
+
+
+def _file_name(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name).strip("_")[:120]
+
+
+def _top_functions(stats: pstats.Stats) -> str:
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    # Drop the pstats header, keep the table
+    table = stream.getvalue().split("\n\n", 1)[-1].rstrip()
+    return "\n".join(f"   {line}" for line in table.splitlines())
+
+
+profiler = Profiler()
@@ -0,0 +1,92 @@
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterable, List, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass(slots=True)
+class TransactionRecord:
+    """
+    A single extracted transaction and the metadata of its source email.
+
+    The pipeline passes plain lists of records between stages; pandas is only
+    needed to convert them with `to_dataframe` / `from_dataframe`.
+    """
+
+    date: datetime
+    card_number: Union[str, None]
+    total_paid_amount: Union[float, None]
+    merchant: Union[str, None] = None
+    category: Union[str, None] = None
+    message_id: Union[str, None] = None
+    subject: Union[str, None] = None
+    source: Union[str, None] = None
+    sender: Union[str, None] = None
+    # Set on records read back from the local store
+    id: Union[int, None] = None
+    cycle: Union[str, None] = None
+    status: Union[str, None] = None
+    uploaded_at: Union[str, None] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+FIELDS = [field.name for field in fields(TransactionRecord)]
+
+
+def sort_by_date(records: Iterable[TransactionRecord]) -> List[TransactionRecord]:
+    """Sort records by date, oldest first"""
+    return sorted(records, key=lambda record: record.date)
+
+
+def filter_card(
+    records: Iterable[TransactionRecord], card_number: str
+) -> List[TransactionRecord]:
+    """Keep the records of a card"""
+    return [record for record in records if str(record.card_number) == card_number]
+
+
+def to_dataframe(records: Iterable[TransactionRecord]) -> "pd.DataFrame":
+    """
+    Convert records to a DataFrame with one column per record field
+
+    Args:
+        records: The transaction records
+
+    Returns:
+        pd.DataFrame: The records as rows
+    """
+    import pandas as pd
+
+    return pd.DataFrame([record.to_dict() for record in records], columns=FIELDS)
+
+
+def from_dataframe(df: "pd.DataFrame") -> List[TransactionRecord]:
+    """
+    Convert a DataFrame of transactions back to records
+
+    Columns that are not record fields are ignored and missing values
+    (NaN/NaT) become None.
+
+    Args:
+        df: DataFrame with at least 'date', 'card_number' and 'total_paid_amount'
+
+    Returns:
+        List[TransactionRecord]: One record per row
+    """
+    import pandas as pd
+
+    columns = [column for column in df.columns if column in FIELDS]
+    records = []
+    for row in df[columns].itertuples(index=False, name=None):
+        values = {
+            column: None if pd.isna(value) is True else value
+            for column, value in zip(columns, row)
+        }
+        if isinstance(values.get("date"), pd.Timestamp):
+            values["date"] = values["date"].to_pydatetime()
+        records.append(TransactionRecord(**values))
+    return records
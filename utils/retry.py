@@ -0,0 +1,203 @@
+"""
+Timeouts, retries and deadlines of the network calls of a run.
+
+Errors are classified as retryable (timeouts, dropped connections, server
+side failures) or not (bad credentials, rejected commands). Retryable errors
+are retried with exponential backoff and jitter, within the attempts of a
+RetryPolicy and the time left before the Deadline of the run.
+"""
+
+import imaplib
+import random
+import smtplib
+import socket
+import ssl
+import time
+from dataclasses import dataclass
+from typing import Callable, Union
+
+from utils.metrics import metrics
+
+# Seconds a single network operation (connect, command, response) may take
+DEFAULT_TIMEOUT = 30.0
+
+# Seconds a whole run may take, see Deadline
+DEFAULT_RUN_DEADLINE = 3600.0
+
+# HTTP statuses of failures that may succeed when retried
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(TimeoutError):
+    """The deadline of the run passed"""
+
+
+class Deadline:
+    """Point in time a run must be done by"""
+
+    def __init__(self, seconds: Union[float, None]):
+        """
+        Args:
+            seconds (float, optional): Seconds from now, None or 0 for no deadline
+        """
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> Union[float, None]:
+        """Seconds left, None without a deadline"""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def check(self) -> None:
+        """
+        Raises:
+            DeadlineExceeded: If the deadline passed
+        """
+        if self.remaining() == 0.0:
+            raise DeadlineExceeded(f"The run took longer than {self.seconds:.0f}s")
+
+    def timeout(self, timeout: Union[float, None]) -> Union[float, None]:
+        """An operation timeout, shortened to the time left"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return max(remaining, 0.001)
+        return max(min(timeout, remaining), 0.001)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether an error may go away when the operation is retried
+
+    Args:
+        error: The error raised by the operation
+
+    Returns:
+        bool: Timeouts, lost connections and transient server errors are
+            retryable; authentication failures, rejected commands and the
+            deadline of the run are not
+    """
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, imaplib.IMAP4.abort):
+        return True
+    if isinstance(error, imaplib.IMAP4.error):
+        # Rejected commands and failed logins
+        return False
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 4xx replies are temporary failures
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, ssl.SSLCertVerificationError):
+        return False
+    if isinstance(error, (TimeoutError, socket.timeout, ConnectionError, ssl.SSLError)):
+        return True
+    if isinstance(error, OSError):
+        # Unreachable networks and failed name resolutions
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in RETRYABLE_STATUSES
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How many times, and after how long, retryable errors are retried"""
+
+    attempts: int = 4
+    initial_delay: float = 1.0
+    max_delay: float = 30.0
+    multiplier: float = 2.0
+
+    def delay(self, attempt: int) -> float:
+        """
+        Backoff after a failed attempt, between half and all of the exponential delay
+
+        Args:
+            attempt (int): Number of the failed attempt, from 1
+        """
+        delay = min(self.max_delay, self.initial_delay * self.multiplier ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def next_delay(
+        self, error: BaseException, attempt: int, deadline: Union[Deadline, None] = None
+    ) -> Union[float, None]:
+        """
+        Seconds to wait before retrying a failed attempt
+
+        Args:
+            error: The error of the attempt
+            attempt (int): Number of the failed attempt, from 1
+            deadline (Deadline, optional): Deadline of the run
+
+        Returns:
+            float | None: The delay, None when the error must be raised: it is
+                not retryable, the attempts are used up or the deadline would
+                pass while waiting
+        """
+        if attempt >= self.attempts or not is_retryable(error):
+            return None
+        delay = self.delay(attempt)
+        remaining = deadline.remaining() if deadline is not None else None
+        if remaining is not None and remaining <= delay:
+            return None
+        return delay
+
+    def call(
+        self,
+        func: Callable,
+        *args,
+        deadline: Union[Deadline, None] = None,
+        operation: str = "call",
+        **kwargs,
+    ):
+        """
+        Call a function, retrying it on retryable errors
+
+        Args:
+            func: The function, which must be safe to repeat
+            *args: Its arguments
+            deadline (Deadline, optional): Deadline of the run
+            operation (str): Name of the operation in logs and metrics
+            **kwargs: Its keyword arguments
+
+        Returns:
+            The result of the function
+
+        Raises:
+            Exception: The last error, or DeadlineExceeded
+        """
+        attempt = 0
+        while True:
+            if deadline is not None:
+                deadline.check()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                attempt += 1
+                if self.wait_before_retry(e, attempt, deadline, operation) is None:
+                    raise
+
+    def wait_before_retry(
+        self,
+        error: BaseException,
+        attempt: int,
+        deadline: Union[Deadline, None] = None,
+        operation: str = "call",
+    ) -> Union[float, None]:
+        """
+        Sleep before retrying a failed attempt, see next_delay
+
+        Returns:
+            float | None: The delay slept, None when the error must be raised
+        """
+        delay = self.next_delay(error, attempt, deadline)
+        if delay is None:
+            metrics.incr("retry.failures", operation=operation, error=type(error).__name__)
+            return None
+        metrics.incr("retry.retries", operation=operation, error=type(error).__name__)
+        print(f"{operation} failed ({type(error).__name__}: {error}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+        return delay
@@ -0,0 +1,304 @@
+import copy
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Union
+
+from utils import update_env_file
+from utils.extractors import TransactionExtractor
+from utils.gmail import Gmail
+from utils.googlesheets import SheetManager
+from utils.metrics import metrics
+from utils.pipeline import run_logger
+from utils.profiling import profiler
+from utils.retry import DEFAULT_RUN_DEADLINE, Deadline
+from utils.staged import run_logger_staged
+from utils.store import TransactionStore
+
+# Format of the last runtime of a card in the .env file
+RUNTIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Asks the service loop to return, see LoggerService.stop
+_STOP = object()
+
+
+def run_card(
+    card,
+    gmail_client: Gmail,
+    sheet_client: SheetManager,
+    transaction_extractor: TransactionExtractor,
+    store: TransactionStore,
+    sequential: bool = False,
+    deadline: Union[float, None] = DEFAULT_RUN_DEADLINE,
+    **staged_options,
+) -> int:
+    """
+    Run the logger for a card since its last runtime, then advance the last runtime
+
+    The first run of a card covers the last 7 days. The last runtime only
+    advances when the run succeeds: after a failed fetch or a passed deadline,
+    the next run covers the same dates again. Emails skipped for running past
+    the extraction time budget do not hold it back, they are recorded in the
+    store (see pipeline.quarantine_timed_out).
+
+    Args:
+        card: The credit card configuration (see cards/_template.py)
+        gmail_client: The Gmail client
+        sheet_client: The Google Sheets client
+        transaction_extractor: The transaction extractor
+        store: The local transaction store
+        sequential (bool): Use run_logger instead of run_logger_staged, always
+            the case while the profiler is enabled (default: False)
+        deadline (float, optional): Seconds the IMAP work of the run may take,
+            retries included, None for no limit (default: DEFAULT_RUN_DEADLINE)
+        **staged_options: Options of run_logger_staged, e.g. connections
+
+    Returns:
+        int: Number of transactions uploaded
+
+    Raises:
+        IncompleteRunError: If the emails of some merchants could not be
+            fetched
+    """
+    last_runtime = os.getenv(card.LAST_RUN_TIME_ENV_NAME, None)
+    if last_runtime:
+        start_date = datetime.strptime(last_runtime, RUNTIME_FORMAT)
+    else:
+        start_date = datetime.now() - timedelta(days=7)
+    end_date = datetime.now()
+    date_interval = [start_date, end_date]
+
+    if profiler.enabled and not sequential:
+        # The profiler only sees its own thread, not the staged workers
+        print("Profiling runs the sequential pipeline")
+        sequential = True
+
+    gmail_client.deadline = Deadline(deadline)
+    try:
+        if sequential:
+            uploaded = run_logger(
+                card=card,
+                gmail_client=gmail_client,
+                sheet_client=sheet_client,
+                transaction_extractor=transaction_extractor,
+                store=store,
+                date_interval=date_interval,
+            )
+        else:
+            uploaded = run_logger_staged(
+                card=card,
+                gmail_client=gmail_client,
+                sheet_client=sheet_client,
+                transaction_extractor=transaction_extractor,
+                store=store,
+                date_interval=date_interval,
+                **staged_options,
+            )
+    finally:
+        gmail_client.deadline = None
+
+    update_env_file(card.LAST_RUN_TIME_ENV_NAME, end_date.strftime(RUNTIME_FORMAT))
+    return uploaded
+
+
+class LoggerService:
+    """
+    Runs the logger of several cards from one resident process
+
+    The clients are created once and stay warm between runs: the authorized
+    gspread client (google-auth refreshes its token when it expires) and the
+    spreadsheets it opened, logged in IMAP connections kept by the Gmail
+    client (see Gmail.keep_connections), and the extractors and caches of the
+    transaction extractor. A run then only costs its incremental work.
+
+    Every card runs on a schedule, every `interval` seconds, and on demand
+    through `trigger`, also exposed over HTTP by `serve_http`. Runs happen one
+    at a time on the thread of `serve_forever`, which owns the SQLite store.
+    """
+
+    def __init__(
+        self,
+        cards: Dict[str, object],
+        gmail_client: Gmail,
+        sheet_client: SheetManager,
+        transaction_extractor: TransactionExtractor,
+        store_path: str,
+        interval: Union[float, None] = 900.0,
+        **run_options,
+    ):
+        """
+        Args:
+            cards (Dict[str, object]): Card configurations by name (see cards/_template.py)
+            gmail_client: The Gmail client
+            sheet_client: The Google Sheets client
+            transaction_extractor: The transaction extractor
+            store_path (str): Path of the local transaction store
+            interval (float, optional): Seconds between scheduled runs of a
+                card, None to run on demand only (default: 900)
+            **run_options: Options of run_card, e.g. sequential
+        """
+        self.cards = cards
+        self.gmail_client = gmail_client
+        self.sheet_client = sheet_client
+        self.transaction_extractor = transaction_extractor
+        self.store_path = store_path
+        self.interval = interval
+        self.run_options = run_options
+        self.triggers: queue.Queue = queue.Queue()
+        self.lock = threading.Lock()
+        # Cards triggered and not run yet, so repeated triggers run them once
+        self.pending: set = set()
+        self.status: Dict[str, Dict] = {
+            name: {"runs": 0, "errors": 0, "last_run": None, "last_error": None}
+            for name in cards
+        }
+
+    def trigger(self, name: Union[str, None] = None) -> List[str]:
+        """
+        Queue a run of a card, or of every card
+
+        Args:
+            name (str, optional): Name of the card, None for every card
+
+        Returns:
+            List[str]: Names of the cards queued, without those already queued
+
+        Raises:
+            KeyError: If there is no card with that name
+        """
+        names = list(self.cards) if name is None else [name]
+        for name in names:
+            if name not in self.cards:
+                raise KeyError(name)
+        queued = []
+        with self.lock:
+            for name in names:
+                if name not in self.pending:
+                    self.pending.add(name)
+                    self.triggers.put(name)
+                    queued.append(name)
+        return queued
+
+    def stop(self) -> None:
+        """Make serve_forever return once the current run is done"""
+        self.triggers.put(_STOP)
+
+    def serve_forever(self) -> None:
+        """Run the cards on schedule and on demand until stopped"""
+        # Every card runs on start, then on schedule
+        self.trigger()
+        next_runs = {}
+        with TransactionStore(self.store_path) as store:
+            while True:
+                if next_runs:
+                    timeout = max(0.0, min(next_runs.values()) - time.monotonic())
+                else:
+                    timeout = None
+                try:
+                    item = self.triggers.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    break
+
+                if item is None:
+                    due = [name for name, at in next_runs.items() if at <= time.monotonic()]
+                else:
+                    with self.lock:
+                        self.pending.discard(item)
+                    due = [item]
+                for name in due:
+                    self._run(name, store)
+                    if self.interval is not None:
+                        next_runs[name] = time.monotonic() + self.interval
+
+    def serve_http(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Accept run triggers over HTTP, on a background thread
+
+        Endpoints:
+            POST /run: Queue a run of every card
+            POST /run/<card>: Queue a run of a card
+            GET /status: Runs, errors and last run of every card
+
+        The server has no authentication: keep it on a local address.
+
+        Args:
+            port (int): Port to listen on, 0 for any free port
+            host (str): Address to listen on (default: 127.0.0.1)
+
+        Returns:
+            ThreadingHTTPServer: The server, shut down by the caller
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                parts = self.path.strip("/").split("/")
+                if parts[0] != "run" or len(parts) > 2:
+                    return self._send(404, {"error": "Not found"})
+                try:
+                    queued = service.trigger(parts[1] if len(parts) == 2 else None)
+                except KeyError:
+                    return self._send(404, {"error": f"No card {parts[1]}"})
+                self._send(202, {"queued": queued})
+
+            def do_GET(self):
+                if self.path.rstrip("/") != "/status":
+                    return self._send(404, {"error": "Not found"})
+                with service.lock:
+                    status = copy.deepcopy(service.status)
+                self._send(200, status)
+
+            def _send(self, code: int, body: Dict) -> None:
+                content = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Accepting run triggers on http://{host}:{server.server_address[1]}")
+        return server
+
+    def _run(self, name: str, store: TransactionStore) -> None:
+        """Run a card, recording the outcome instead of raising"""
+        card = self.cards[name]
+        print(f"Running extractor for {card.NICKNAME}")
+        started = time.perf_counter()
+        status = {"started": datetime.now().strftime(RUNTIME_FORMAT)}
+        try:
+            with metrics.span("service.run"):
+                status["uploaded"] = run_card(
+                    card,
+                    self.gmail_client,
+                    self.sheet_client,
+                    self.transaction_extractor,
+                    store,
+                    **self.run_options,
+                )
+            metrics.incr("service.runs", card=name, result="ok")
+        except Exception as e:
+            # The next run retries from the same last runtime
+            metrics.incr("service.runs", card=name, result="error")
+            status["error"] = f"{type(e).__name__}: {e}"
+            print(f"Error running {name}: {str(e)}")
+        status["seconds"] = round(time.perf_counter() - started, 3)
+        # The route order and cached results survive a crash of the service
+        self.transaction_extractor.flush()
+
+        with self.lock:
+            self.status[name]["runs"] += 1
+            self.status[name]["last_run"] = status
+            if "error" in status:
+                self.status[name]["errors"] += 1
+                self.status[name]["last_error"] = status
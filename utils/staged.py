@@ -0,0 +1,269 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Tuple, Union
+
+from utils.extractors import (
+    TransactionExtractor,
+    get_merchant_for_email,
+    group_merchants_by_sender,
+    search_subjects,
+)
+from utils.gmail import Gmail
+from utils.googlesheets import SheetManager
+from utils.metrics import metrics
+from utils.pipeline import (
+    check_complete,
+    processed_uids,
+    quarantine_timed_out,
+    record_transactions,
+    upload_pending,
+)
+from utils.profiling import profiler
+from utils.records import TransactionRecord
+from utils.store import TransactionStore
+
+# Marks the end of a queue's input, one per consumer
+_DONE = object()
+
+
+class BatchWriter:
+    """
+    Records extracted transactions in the store and uploads the pending ones
+    to Google Sheets in batches, every `batch_rows` transactions or
+    `batch_seconds` after the first transaction of a batch, whichever is first.
+    """
+
+    def __init__(
+        self,
+        store: TransactionStore,
+        sheet_client: SheetManager,
+        card,
+        batch_rows: int = 200,
+        batch_seconds: float = 5.0,
+    ):
+        """
+        Args:
+            store: The local transaction store
+            sheet_client: The Google Sheets client
+            card: The credit card configuration (see cards/_template.py)
+            batch_rows (int): Transactions per batch (default: 200)
+            batch_seconds (float): Maximum age of a batch (default: 5.0)
+        """
+        self.store = store
+        self.sheet_client = sheet_client
+        self.card = card
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self.batch: List[TransactionRecord] = []
+        self.batch_started = None
+        self.recorded = 0
+        self.uploaded = 0
+
+    def add(self, record: TransactionRecord) -> None:
+        """Add a transaction to the batch, flushing it when full"""
+        if not self.batch:
+            self.batch_started = time.monotonic()
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_rows:
+            self.flush()
+
+    def timeout(self) -> Union[float, None]:
+        """Seconds until the current batch is due, None without a batch"""
+        if not self.batch:
+            return None
+        return max(0.0, self.batch_started + self.batch_seconds - time.monotonic())
+
+    def flush(self) -> None:
+        """Record the batch and upload the pending transactions"""
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        with metrics.span("pipeline.flush"):
+            with profiler.scope("stage:record"):
+                self.recorded += record_transactions(self.store, batch, self.card)
+            with profiler.scope("stage:upload"):
+                self.uploaded += upload_pending(self.store, self.sheet_client, self.card)
+        metrics.incr("pipeline.batches")
+
+
+def run_logger_staged(
+    card,
+    gmail_client: Gmail,
+    sheet_client: SheetManager,
+    transaction_extractor: TransactionExtractor,
+    store: TransactionStore,
+    date_interval: List[datetime],
+    limit: Union[int, None] = 10,
+    connections: int = 4,
+    extract_workers: int = 2,
+    queue_size: int = 256,
+    batch_rows: int = 200,
+    batch_seconds: float = 5.0,
+) -> int:
+    """
+    Run the logger for a card with the fetch, extract and upload stages overlapped
+
+    IMAP fetch threads stream the emails of every merchant into a bounded
+    queue, extraction workers turn them into transactions on a second bounded
+    queue, and the calling thread records and uploads them in batches (see
+    BatchWriter). A full queue blocks the stage feeding it, so a slow stage
+    holds back the others instead of letting emails pile up in memory, and a
+    large run takes about as long as its slowest stage.
+
+    Extraction workers are threads: they overlap with the network waits of the
+    other stages, not with each other's parsing.
+
+    Args:
+        card: The credit card configuration (see cards/_template.py)
+        gmail_client: The Gmail client
+        sheet_client: The Google Sheets client
+        transaction_extractor: The transaction extractor
+        store: The local transaction store
+        date_interval (List[datetime]): List containing [from_date, to_date]
+        limit (int, optional): Maximum number of emails per sender, None for all (default: 10)
+        connections (int): Concurrent IMAP connections (default: 4)
+        extract_workers (int): Extraction threads (default: 2)
+        queue_size (int): Capacity of each queue (default: 256)
+        batch_rows (int): Transactions per upload batch (default: 200)
+        batch_seconds (float): Maximum age of an upload batch (default: 5.0)
+
+    Returns:
+        int: Number of transactions uploaded
+
+    Raises:
+        IncompleteRunError: If the emails of some merchants could not be
+            fetched, once the others are uploaded
+    """
+    emails: queue.Queue = queue.Queue(maxsize=queue_size)
+    records: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    # UIDs of the emails done with, labeled once everything is uploaded
+    processed: List[str] = []
+    # Merchants whose emails could not be fetched
+    failed: List[str] = []
+    # Merchant and data of the emails that ran past the extraction time budget
+    timed_out: List[Tuple[str, dict]] = []
+
+    def fetch(sender: str, merchants: List[str]) -> None:
+        fetched = 0
+        try:
+            subjects, excluded_subjects = search_subjects(merchants)
+            for email_data in gmail_client.iter_emails_filtered(
+                sender=sender,
+                date_interval=date_interval,
+                limit=limit,
+                subjects=subjects,
+                excluded_subjects=excluded_subjects,
+            ):
+                fetched += 1
+                merchant = get_merchant_for_email(sender, email_data.get("subject"))
+                if merchant not in merchants:
+                    # Left unlabeled for the cards logging that merchant
+                    continue
+                if not _put(emails, (merchant, email_data), stop, "fetch"):
+                    return
+        except Exception as e:
+            # Like the sequential pipeline, a failing sender does not stop the others
+            print(f"Error reading {', '.join(merchants)} emails: {str(e)}")
+            failed.extend(merchants)
+        print(f"Fetched {fetched} emails from {', '.join(merchants)}")
+
+    def fetch_all() -> None:
+        try:
+            # Merchants sharing a sender have their emails fetched once
+            groups = group_merchants_by_sender(card.MERCHANTS)
+            with ThreadPoolExecutor(max_workers=max(1, connections)) as executor:
+                list(executor.map(fetch, groups, groups.values()))
+        finally:
+            for _ in range(extract_workers):
+                _put(emails, _DONE, stop, "fetch")
+
+    def extract() -> None:
+        try:
+            while (item := _get(emails, stop)) is not _DONE and item is not None:
+                merchant, email_data = item
+                record = transaction_extractor.extract_transaction(merchant, email_data)
+                processed.extend(processed_uids([email_data], card.LAST_DIGITS))
+                if email_data.get("timed_out"):
+                    timed_out.append((merchant, email_data))
+                if record is not None and not _put(records, record, stop, "extract"):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(records, _DONE, stop, "extract")
+
+    threads = [threading.Thread(target=fetch_all, name="fetch", daemon=True)]
+    threads += [
+        threading.Thread(target=extract, name=f"extract-{i}", daemon=True)
+        for i in range(extract_workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    writer = BatchWriter(store, sheet_client, card, batch_rows, batch_seconds)
+    try:
+        finished = 0
+        while finished < extract_workers and not stop.is_set():
+            try:
+                item = records.get(timeout=writer.timeout())
+            except queue.Empty:
+                writer.flush()  # The batch is due
+                continue
+            if item is _DONE:
+                finished += 1
+            else:
+                writer.add(item)
+
+        if errors:
+            raise errors[0]
+        writer.flush()
+        # The store belongs to this thread
+        quarantine_timed_out(store, timed_out, card)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    # Only once their transactions are uploaded (see Gmail.processed_label)
+    with metrics.span("pipeline.label"):
+        gmail_client.mark_processed(processed)
+
+    print(f"Recorded {writer.recorded} and uploaded {writer.uploaded} transactions")
+    check_complete(failed)
+    return writer.uploaded
+
+
+def _put(q: queue.Queue, item, stop: threading.Event, stage: str) -> bool:
+    """Put an item on a bounded queue, waiting while it is full unless stopped"""
+    try:
+        q.put_nowait(item)
+        return True
+    except queue.Full:
+        pass
+
+    # The next stage is behind: record how long this stage is held back
+    start = time.perf_counter()
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            metrics.observe("pipeline.backpressure", time.perf_counter() - start, stage=stage)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Get an item from a queue, None once stopped"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
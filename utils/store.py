@@ -0,0 +1,377 @@
+import hashlib
+import sqlite3
+from datetime import datetime
+from typing import Iterable, List, Tuple, Union
+
+import pytz
+
+from utils.googlesheets import statement_cycle_key
+from utils.records import TransactionRecord
+
+# Timezone of the email dates (see gmail.parse_email), naive dates are in it
+LOCAL_TIMEZONE = pytz.timezone("Asia/Manila")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    message_id TEXT NOT NULL UNIQUE,
+    date TEXT NOT NULL,
+    date_utc TEXT NOT NULL,
+    cycle TEXT NOT NULL,
+    card_number TEXT,
+    total_paid_amount REAL,
+    merchant TEXT,
+    category TEXT,
+    source TEXT,
+    sender TEXT,
+    subject TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    uploaded_at TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS timed_out_emails (
+    message_id TEXT NOT NULL,
+    card_number TEXT NOT NULL,
+    merchant TEXT,
+    date TEXT,
+    sender TEXT,
+    subject TEXT,
+    runs INTEGER NOT NULL DEFAULT 1,
+    last_seen TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (message_id, card_number)
+);
+"""
+
+# Created once the date_utc column exists, see TransactionStore._migrate
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_transactions_card_date_utc
+    ON transactions (card_number, date_utc);
+CREATE INDEX IF NOT EXISTS idx_transactions_cycle
+    ON transactions (cycle);
+CREATE INDEX IF NOT EXISTS idx_transactions_pending
+    ON transactions (card_number) WHERE status = 'pending';
+"""
+
+COLUMNS = [
+    "id",
+    "message_id",
+    "date",
+    "cycle",
+    "card_number",
+    "total_paid_amount",
+    "merchant",
+    "category",
+    "source",
+    "sender",
+    "subject",
+    "status",
+    "uploaded_at",
+]
+
+
+class TransactionStore:
+    """
+    Local SQLite record of every extracted transaction.
+
+    The store is the source of truth: every transaction is kept with its
+    source email metadata and an upload status, and the Google Sheet is a
+    projection that is synced by pushing the pending rows.
+
+    Dates are kept as found in the emails, with their UTC offset, and
+    normalized to UTC in date_utc, which date ranges and sorting use: the
+    text of dates with different offsets is not in time order.
+    """
+
+    def __init__(self, db_path: str = "transactions.db"):
+        """
+        Open (and create if needed) the transaction store
+
+        Args:
+            db_path (str): Path to the SQLite database file
+        """
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(SCHEMA)
+        self._migrate()
+        self.connection.executescript(INDEXES)
+
+    def close(self) -> None:
+        """Close the database connection"""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_transactions(
+        self, records: Iterable[TransactionRecord], statement_day: int
+    ) -> int:
+        """
+        Record extracted transactions, skipping emails that are already stored
+
+        Args:
+            records: The extracted transactions
+            statement_day (int): Day of the month the statement is generated
+
+        Returns:
+            int: Number of new transactions recorded
+        """
+        rows = []
+        for record in records or []:
+            rows.append(
+                (
+                    record.message_id or _generated_message_id(record),
+                    record.date.isoformat(),
+                    _utc_date(record.date),
+                    statement_cycle_key(record.date, statement_day),
+                    _optional_str(record.card_number),
+                    None if _is_missing(record.total_paid_amount) else record.total_paid_amount,
+                    record.merchant,
+                    record.category,
+                    record.source,
+                    record.sender,
+                    record.subject,
+                )
+            )
+        if not rows:
+            return 0
+
+        with self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(
+                """
+                INSERT OR IGNORE INTO transactions (
+                    message_id, date, date_utc, cycle, card_number,
+                    total_paid_amount, merchant, category, source, sender, subject
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            return self.connection.total_changes - before
+
+    def pending(self, card_number: str) -> List[TransactionRecord]:
+        """
+        Get the transactions of a card that are not uploaded yet
+
+        Args:
+            card_number (str): Last digits of the card
+
+        Returns:
+            List[TransactionRecord]: Pending transactions sorted by date
+        """
+        return self._query(
+            "WHERE card_number = ? AND status = 'pending' ORDER BY date_utc",
+            (card_number,),
+        )
+
+    def mark_uploaded(self, ids: Iterable[int]) -> None:
+        """
+        Mark transactions as uploaded to Google Sheets
+
+        Args:
+            ids: Store IDs of the uploaded transactions
+        """
+        uploaded_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE transactions SET status = 'uploaded', uploaded_at = ? WHERE id = ?",
+                [(uploaded_at, int(id_)) for id_ in ids],
+            )
+
+    def reset_uploads(self, card_number: str, cycle: Union[str, None] = None) -> int:
+        """
+        Mark uploaded transactions as pending again, e.g. to rebuild a worksheet
+
+        Args:
+            card_number (str): Last digits of the card
+            cycle (str, optional): Only reset this statement cycle
+
+        Returns:
+            int: Number of transactions reset
+        """
+        query = "UPDATE transactions SET status = 'pending', uploaded_at = NULL WHERE card_number = ?"
+        params: List = [card_number]
+        if cycle:
+            query += " AND cycle = ?"
+            params.append(cycle)
+
+        with self.connection:
+            return self.connection.execute(query, params).rowcount
+
+    def transactions(
+        self,
+        card_number: Union[str, None] = None,
+        date_interval: Union[List[datetime], None] = None,
+        cycle: Union[str, None] = None,
+    ) -> List[TransactionRecord]:
+        """
+        Query the transaction history
+
+        Args:
+            card_number (str, optional): Last digits of the card
+            date_interval (List[datetime], optional): List containing
+                [from_date, to_date], naive dates are in LOCAL_TIMEZONE
+            cycle (str, optional): Statement cycle key, e.g. "20250509"
+
+        Returns:
+            List[TransactionRecord]: Matching transactions sorted by date
+        """
+        conditions = []
+        params: List = []
+        if card_number:
+            conditions.append("card_number = ?")
+            params.append(card_number)
+        if date_interval:
+            conditions.append("date_utc >= ? AND date_utc < ?")
+            params.extend(_utc_date(date) for date in date_interval)
+        if cycle:
+            conditions.append("cycle = ?")
+            params.append(cycle)
+
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        return self._query(where + "ORDER BY date_utc", params)
+
+    def add_timed_out(self, card_number: str, emails: Iterable[Tuple[str, dict]]) -> int:
+        """
+        Record emails skipped by a run of a card for running past the
+        extraction time budget, counting the runs that skipped each
+
+        Args:
+            card_number (str): Last digits of the card of the run
+            emails: The merchant and email data of each skipped email
+
+        Returns:
+            int: Number of emails not recorded before
+        """
+        rows = []
+        for merchant, email_data in emails or []:
+            date = email_data.get("date")
+            rows.append(
+                (
+                    email_data.get("message_id") or _generated_email_id(email_data),
+                    card_number,
+                    merchant,
+                    date.isoformat() if date else None,
+                    email_data.get("from"),
+                    email_data.get("subject"),
+                )
+            )
+        if not rows:
+            return 0
+
+        with self.connection:
+            before = self._count("timed_out_emails")
+            self.connection.executemany(
+                """
+                INSERT INTO timed_out_emails (
+                    message_id, card_number, merchant, date, sender, subject
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (message_id, card_number) DO UPDATE SET
+                    runs = runs + 1, last_seen = CURRENT_TIMESTAMP
+                """,
+                rows,
+            )
+            return self._count("timed_out_emails") - before
+
+    def timed_out(self, card_number: Union[str, None] = None) -> List[dict]:
+        """
+        Get the emails skipped for running past the extraction time budget
+
+        Args:
+            card_number (str, optional): Last digits of the card
+
+        Returns:
+            List[dict]: The message_id, card_number, merchant, date, sender,
+                subject, runs and last_seen of each email, sorted by date
+        """
+        columns = [
+            "message_id",
+            "card_number",
+            "merchant",
+            "date",
+            "sender",
+            "subject",
+            "runs",
+            "last_seen",
+        ]
+        query = f"SELECT {', '.join(columns)} FROM timed_out_emails"
+        params: List = []
+        if card_number:
+            query += " WHERE card_number = ?"
+            params.append(card_number)
+        cursor = self.connection.execute(query + " ORDER BY date", params)
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def has_message(self, message_id: str) -> bool:
+        """Check whether the transaction of an email is already stored"""
+        return (
+            self.connection.execute(
+                "SELECT 1 FROM transactions WHERE message_id = ?", (message_id,)
+            ).fetchone()
+            is not None
+        )
+
+    def _migrate(self) -> None:
+        """Add the date_utc column to stores created before it"""
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(transactions)")}
+        if "date_utc" in columns:
+            return
+        with self.connection:
+            self.connection.execute("ALTER TABLE transactions ADD COLUMN date_utc TEXT")
+            self.connection.executemany(
+                "UPDATE transactions SET date_utc = ? WHERE id = ?",
+                [
+                    (_utc_date(datetime.fromisoformat(date)), id_)
+                    for id_, date in self.connection.execute(
+                        "SELECT id, date FROM transactions"
+                    ).fetchall()
+                ],
+            )
+            self.connection.execute("DROP INDEX IF EXISTS idx_transactions_card_date")
+
+    def _count(self, table: str) -> int:
+        return self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def _query(self, clause: str, params: Iterable) -> List[TransactionRecord]:
+        cursor = self.connection.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM transactions {clause}", tuple(params)
+        )
+        records = []
+        for row in cursor:
+            values = dict(zip(COLUMNS, row))
+            values["date"] = datetime.fromisoformat(values["date"])
+            records.append(TransactionRecord(**values))
+        return records
+
+
+def _is_missing(value) -> bool:
+    # NaN is the only value not equal to itself
+    return value is None or value != value
+
+
+def _utc_date(date: datetime) -> str:
+    """Sortable UTC text of a date, naive dates being in LOCAL_TIMEZONE"""
+    if date.tzinfo is None:
+        date = LOCAL_TIMEZONE.localize(date)
+    return date.astimezone(pytz.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _optional_str(value) -> Union[str, None]:
+    return None if value is None else str(value)
+
+
+def _generated_message_id(record: TransactionRecord) -> str:
+    """Build a stable ID for emails without a Message-ID header"""
+    key = "|".join(
+        str(getattr(record, field))
+        for field in ("sender", "date", "subject", "card_number", "total_paid_amount")
+    )
+    return f"<generated-{hashlib.sha1(key.encode()).hexdigest()}>"
+
+
+def _generated_email_id(email_data: dict) -> str:
+    """Build a stable ID for skipped emails without a Message-ID header"""
+    key = "|".join(str(email_data.get(field)) for field in ("from", "date", "subject"))
+    return f"<generated-{hashlib.sha1(key.encode()).hexdigest()}>"
@@ -0,0 +1,303 @@
+import imaplib
+import re
+import select
+import ssl
+import threading
+import time
+from typing import Dict, List, Union
+
+from utils.extractors import (
+    TransactionExtractor,
+    get_merchant_for_email,
+    group_merchants_by_sender,
+)
+from utils.gmail import Gmail, fetch_email, gmail_raw, store_labels
+from utils.googlesheets import SheetManager
+from utils.metrics import metrics
+from utils.pipeline import processed_uids, record_transactions, upload_pending
+from utils.store import TransactionStore
+
+# Gmail ends IDLE commands after about 29 minutes without traffic
+KEEPALIVE_SECONDS = 25 * 60
+
+# Seconds between checks of the stop event while idling
+POLL_SECONDS = 1.0
+
+EXISTS_PATTERN = re.compile(rb"^\* \d+ EXISTS", re.IGNORECASE)
+
+
+class MailboxWatcher:
+    """
+    One IMAP connection idling on a folder, reporting the messages that arrive
+
+    Messages are tracked by UID: the watcher remembers the highest UID it is
+    done with and searches the UIDs above it when the server announces new
+    mail, restricted to the senders of interest. The caller advances last_uid
+    as it records the messages, so messages lost with the connection are
+    reported again.
+    """
+
+    def __init__(
+        self,
+        gmail_client: Gmail,
+        senders: List[str],
+        folder: str = "INBOX",
+        keepalive: float = KEEPALIVE_SECONDS,
+    ):
+        """
+        Args:
+            gmail_client: The Gmail client
+            senders (List[str]): Addresses whose new emails are reported
+            folder (str): Folder to watch (default: INBOX)
+            keepalive (float): Seconds between IDLE renewals (default: 25 minutes)
+        """
+        self.gmail_client = gmail_client
+        self.senders = senders
+        self.folder = folder
+        self.keepalive = keepalive
+        self.imap_server: Union[imaplib.IMAP4, None] = None
+        # Highest UID done with, None until the first connection
+        self.last_uid: Union[int, None] = None
+        # UIDs of the recorded messages, labeled once their transactions are uploaded
+        self.unlabeled: List[str] = []
+
+    def connect(self) -> None:
+        """Connect and select the folder, keeping the UID of the last message seen"""
+        self.imap_server = self.gmail_client.open_folder(self.folder)
+        _, data = self.imap_server.response("UIDNEXT")
+        if self.last_uid is None and data and data[0]:
+            # Only mail arriving from now on is reported
+            self.last_uid = int(data[0]) - 1
+        metrics.incr("watch.connections")
+
+    def close(self) -> None:
+        if self.imap_server is None:
+            return
+        try:
+            self.imap_server.logout()
+        except Exception:
+            pass
+        self.imap_server = None
+
+    def wait(self, stop: threading.Event) -> bool:
+        """
+        Idle until the server announces new mail, the keepalive or a stop
+
+        Args:
+            stop: Ends the wait when set
+
+        Returns:
+            bool: New mail was announced
+
+        Raises:
+            imaplib.IMAP4.abort: If the connection is lost
+        """
+        imap_server = self.imap_server
+        tag = imap_server._new_tag()
+        imap_server.send(tag + b" IDLE\r\n")
+        line = imap_server.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.abort(f"IDLE rejected: {line!r}")
+
+        announced = False
+        deadline = time.monotonic() + self.keepalive
+        while not announced and not stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self._readable(min(POLL_SECONDS, remaining)):
+                continue
+            # Server lines arrive whole, reading one does not block for long
+            line = imap_server.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed while idling")
+            announced = bool(EXISTS_PATTERN.match(line))
+
+        imap_server.send(b"DONE\r\n")
+        while not (line := imap_server.readline()).startswith(tag):
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed while ending IDLE")
+            announced = announced or bool(EXISTS_PATTERN.match(line))
+        if not announced:
+            # Keepalive of an idle connection
+            imap_server.noop()
+        return announced
+
+    def _readable(self, timeout: float) -> bool:
+        """Wait up to timeout for a server line, buffered or on the socket"""
+        sock = self.imap_server.sock
+        # A read with a socket timeout would leave the file unusable, so the
+        # buffer is checked without blocking and the socket with select
+        previous = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            if self.imap_server.file.peek(1):
+                return True
+        except (BlockingIOError, ssl.SSLWantReadError):
+            pass
+        finally:
+            sock.settimeout(previous)
+        readable, _, _ = select.select([sock], [], [], timeout)
+        return bool(readable)
+
+    def new_uids(self) -> List[str]:
+        """UIDs of the messages of the senders above last_uid, in ascending order"""
+        first = (self.last_uid or 0) + 1
+        senders = " ".join(f"from:{sender}" for sender in self.senders)
+        criteria = [f"{{{senders}}}" if len(self.senders) > 1 else senders]
+        exclude = self.gmail_client.exclusion_terms()
+        if exclude:
+            criteria.append(exclude)
+        with metrics.span("imap.search"):
+            _, data = self.imap_server.uid("SEARCH", None, f"UID {first}:*", gmail_raw(criteria))
+        uids = sorted({int(uid) for uid in data[0].split()} if data and data[0] else set())
+        # "first:*" also matches the highest UID when it is below first
+        uids = [uid for uid in uids if uid >= first]
+        return [str(uid) for uid in uids]
+
+    def fetch(self, uid: str) -> Dict:
+        """Fetch and parse a message by UID"""
+        return fetch_email(self.imap_server, uid.encode(), by_uid=True)
+
+    def label(self) -> None:
+        """Apply the processed label of the Gmail client, if any, to the unlabeled messages"""
+        if self.gmail_client.processed_label and self.unlabeled:
+            store_labels(self.imap_server, self.unlabeled, self.gmail_client.processed_label)
+        self.unlabeled = []
+
+
+def run_watch(
+    card,
+    gmail_client: Gmail,
+    sheet_client: SheetManager,
+    transaction_extractor: TransactionExtractor,
+    store: TransactionStore,
+    folder: str = "INBOX",
+    keepalive: float = KEEPALIVE_SECONDS,
+    reconnect_delay: float = 1.0,
+    max_reconnect_delay: float = 300.0,
+    stop: Union[threading.Event, None] = None,
+) -> int:
+    """
+    Log the transactions of a card as their emails arrive
+
+    One IMAP connection idles on the folder. When new mail is announced, only
+    the new messages of the card's merchants are fetched by UID, extracted,
+    recorded and uploaded through the already authorized Sheets client, so a
+    transaction reaches the sheet seconds after its email. A lost connection
+    is reopened with exponential backoff; mail that arrived meanwhile is
+    picked up by UID.
+
+    Args:
+        card: The credit card configuration (see cards/_template.py)
+        gmail_client: The Gmail client
+        sheet_client: The Google Sheets client
+        transaction_extractor: The transaction extractor
+        store: The local transaction store
+        folder (str): Folder to watch (default: INBOX)
+        keepalive (float): Seconds between IDLE renewals (default: 25 minutes)
+        reconnect_delay (float): First delay before reconnecting (default: 1)
+        max_reconnect_delay (float): Longest delay before reconnecting (default: 300)
+        stop (threading.Event, optional): Ends the watch when set
+
+    Returns:
+        int: Number of transactions uploaded
+    """
+    stop = stop or threading.Event()
+    groups = group_merchants_by_sender(card.MERCHANTS)
+    watcher = MailboxWatcher(gmail_client, list(groups), folder, keepalive)
+    uploaded = 0
+    delay = reconnect_delay
+
+    print(f"Watching {folder} for {', '.join(card.MERCHANTS)} emails")
+    try:
+        while not stop.is_set():
+            try:
+                if watcher.imap_server is None:
+                    watcher.connect()
+                    # Catch up with what arrived while disconnected
+                    announced = watcher.last_uid is not None
+                else:
+                    announced = watcher.wait(stop)
+                delay = reconnect_delay
+                if not announced:
+                    continue
+
+                with metrics.span("watch.batch"):
+                    uploaded += _process_new_mail(
+                        card, watcher, groups, transaction_extractor, store, sheet_client
+                    )
+            except (imaplib.IMAP4.abort, OSError) as e:
+                metrics.incr("watch.reconnects", error=type(e).__name__)
+                print(f"IMAP connection lost ({e}), reconnecting in {delay:.0f}s")
+                watcher.close()
+                stop.wait(delay)
+                delay = min(delay * 2, max_reconnect_delay)
+            except Exception as e:
+                # E.g. a Sheets error: the recorded transactions stay pending
+                # and are uploaded with the next batch, their emails are
+                # labeled then
+                metrics.incr("watch.errors", error=type(e).__name__)
+                print(f"Error processing new mail: {str(e)}")
+    finally:
+        watcher.close()
+    return uploaded
+
+
+def _process_new_mail(
+    card,
+    watcher: MailboxWatcher,
+    groups: Dict[str, List[str]],
+    transaction_extractor: TransactionExtractor,
+    store: TransactionStore,
+    sheet_client: SheetManager,
+) -> int:
+    """
+    Fetch, extract, record and upload the new messages, then label them
+
+    The watcher's last UID only advances past messages whose transactions
+    are recorded: when the connection is lost midway, the transactions
+    extracted so far are recorded and the remaining messages are fetched
+    again after reconnecting. Recorded messages are labeled after the next
+    successful upload. A message that cannot be parsed or extracted
+    is skipped without holding back the others.
+    """
+    emails = []
+    records = []
+    done_uid = None
+    recorded = 0
+    try:
+        for uid in watcher.new_uids():
+            try:
+                email_data = watcher.fetch(uid)
+                merchant = get_merchant_for_email(
+                    email_data["from"], email_data.get("subject")
+                )
+                record = None
+                if any(merchant in merchants for merchants in groups.values()):
+                    record = transaction_extractor.extract_transaction(merchant, email_data)
+            except (imaplib.IMAP4.abort, OSError):
+                raise
+            except Exception as e:
+                metrics.incr("watch.skipped", error=type(e).__name__)
+                print(f"Skipped message {uid}: {type(e).__name__}: {str(e)}")
+                done_uid = uid
+                continue
+            emails.append(email_data)
+            if record is not None:
+                records.append(record)
+            done_uid = uid
+    finally:
+        if records:
+            recorded = record_transactions(store, records, card)
+        if done_uid is not None:
+            watcher.last_uid = int(done_uid)
+        watcher.unlabeled.extend(processed_uids(emails, card.LAST_DIGITS))
+    if not emails:
+        return 0
+
+    print(f"{len(emails)} new emails, {recorded} new transactions")
+    # Also uploads what an earlier batch recorded but could not upload
+    uploaded = upload_pending(store, sheet_client, card)
+    watcher.label()
+    return uploaded